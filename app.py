@@ -1,12 +1,33 @@
 import streamlit as st
-import mysql.connector
 import pandas as pd
-import pickle
-import numpy as np
 from mysql.connector import Error
-import json
 import uuid
 import os
+import time
+
+from chart_assets import get_chart_cache
+from batch_prediction import SUPPORTED_FORMATS, input_template, predict_batch, read_input_file, write_results
+from db_pool import get_pool
+from explanations import EXPLAIN_METHODS, explain_one, explanation_figure
+from feature_metadata import EMPTY_METADATA, get_metadata_cache
+from feature_pipeline import classify_risk, get_encoder, predict_matrix, predict_one
+from model_comparison import compare_models, comparison_figure
+from model_registry import available_models, default_model, get_registry
+from parallel_scoring import DEFAULT_CHUNK_ROWS, default_workers, get_parallel_scorer
+from perf_metrics import get_metrics, get_prometheus_exporter
+from prediction_cache import get_prediction_cache
+from prediction_logger import get_prediction_logger
+from risk_table import get_risk_table
+from sensitivity import DEFAULT_POINTS, MAX_FACTORS, MAX_POINTS, factor_values, field_label, sweep, sweep_figure
+from stats_cache import get_stats_cache
+from stream_scoring import (DEFAULT_CHUNK_ROWS as STREAM_CHUNK_ROWS, DEFAULT_DATA_DIR as STREAM_DATA_DIR,
+                           StreamingJob, resolve_data_path)
+from training_charts import INTERACTIVE_CHARTS, build_figure
+from training_stats import get_training_stats_cache
+
+# 进程启动时在后台预加载并预热的模型: 'default' 只加载默认模型，'all' 加载 models 目录中的全部模型，
+# 'none' 不预加载（需要点击"加载模型"）
+PRELOAD_MODE = 'default'
 
 # 设置页面配置
 st.set_page_config(
@@ -17,18 +38,43 @@ st.set_page_config(
 )
 
 
+def _default_index(options, default):
+    """默认选项在可选值中的下标，不存在时选第一个"""
+    return options.index(default) if default in options else 0
+
+
+def _clamp(value, low, high):
+    """将默认值限制在取值范围内"""
+    return min(max(value, low), high)
+
+
 class AccidentRiskApp:
     def __init__(self):
-        self.db_connection = None
+        self.db_pool = None
+        self.prediction_logger = None
+        self.stats_cache = None
+        self.metadata_cache = None
+        self.training_stats = None
         self.feature_metadata = None
         self.session_id = str(uuid.uuid4())[:8]
         self.models_dir = "models"
+        # 流式预测只能读写该目录下的文件
+        self.stream_data_dir = STREAM_DATA_DIR
+        # 进程级模型注册表，所有会话共享同一份模型实例
+        self.registry = get_registry(self.models_dir)
+        # 进程级预测结果缓存，模型文件变化后自动失效
+        self.prediction_cache = get_prediction_cache(self.registry)
+        # 进程级分阶段耗时统计
+        self.metrics = get_metrics()
+        # 进程级指标文件导出线程，按固定间隔写出，页面渲染不写盘
+        self.metrics_exporter = get_prometheus_exporter()
+        # 每个进程只启动一次，之后的调用直接返回
+        self.registry.preload_in_background(self.preload_model_files())
+        # 进程级图表缓存，后台预先生成所有图表的缩略图
+        self.chart_cache = get_chart_cache()
+        self.chart_cache.prewarm_in_background()
 
         # 初始化session state
-        if 'model' not in st.session_state:
-            st.session_state.model = None
-        if 'scaler' not in st.session_state:
-            st.session_state.scaler = None
         if 'model_loaded' not in st.session_state:
             st.session_state.model_loaded = False
         if 'current_model' not in st.session_state:
@@ -37,16 +83,18 @@ class AccidentRiskApp:
             st.session_state.model_type = None
 
     def connect_database(self):
-        """连接数据库"""
+        """连接数据库（使用进程级连接池，复用已建立的连接）"""
         try:
             #secrets = st.secrets["mysql"]
-            self.db_connection = mysql.connector.connect(
-                host='localhost',
-                user='streamlit_user',
-                password='123456',
-                database='accident_risk_db',
-                buffered=True  # 添加buffered参数避免未读结果错误
-            )
+            pool = get_pool()
+            # 借出并归还一个连接以确认数据库可用，已有空闲连接时不会重新握手
+            with pool.connection():
+                pass
+            self.db_pool = pool
+            self.prediction_logger = get_prediction_logger(pool)
+            self.stats_cache = get_stats_cache(pool, self.prediction_logger)
+            self.metadata_cache = get_metadata_cache(pool)
+            self.training_stats = get_training_stats_cache(pool)
             return True
         except Error as e:
             st.error(f"数据库连接失败: {e}")
@@ -54,62 +102,56 @@ class AccidentRiskApp:
 
     def get_available_models(self):
         """获取可用的模型列表"""
-        if not os.path.exists(self.models_dir):
-            return []
-
-        model_files = [f for f in os.listdir(self.models_dir) if f.endswith('.pkl') and 'scaler' not in f.lower()]
-        return model_files
+        return available_models(self.models_dir)
+
+    def preload_model_files(self):
+        """按 PRELOAD_MODE 确定启动时预加载的模型文件"""
+        model_files = self.get_available_models()
+        if PRELOAD_MODE == 'all':
+            return model_files
+        if PRELOAD_MODE == 'default':
+            model_file = default_model(model_files)
+            return [model_file] if model_file else []
+        return []
+
+    def activate_model(self, model_filename):
+        """把已就绪的模型设为当前会话使用的模型"""
+        entry = self.registry.get(model_filename)
+        st.session_state.model_loaded = True
+        st.session_state.current_model = model_filename
+        st.session_state.model_type = entry.model_type
+        return entry
 
     def load_selected_model(self, model_filename):
         """加载选定的模型和相关的预处理对象"""
         try:
-            # 加载模型
-            model_path = os.path.join(self.models_dir, model_filename)
-            with open(model_path, 'rb') as f:
-                st.session_state.model = pickle.load(f)
-
-            # 确定模型类型
-            if 'linear_regression' in model_filename.lower():
-                st.session_state.model_type = 'linear_regression'
-            elif 'lasso' in model_filename.lower():
-                st.session_state.model_type = 'lasso'
-            elif 'ridge' in model_filename.lower():
-                st.session_state.model_type = 'ridge'
-            elif 'random_forest' in model_filename.lower():
-                st.session_state.model_type = 'random_forest'
-            elif 'xgboost' in model_filename.lower():
-                st.session_state.model_type = 'xgboost'
-            elif 'lightgbm' in model_filename.lower():
-                st.session_state.model_type = 'lightgbm'
-            else:
-                st.session_state.model_type = 'unknown'
-
-            # 尝试加载对应的scaler
-            model_name = os.path.splitext(model_filename)[0]
-            scaler_filename = f"{model_name}_scaler.pkl"
-            scaler_path = os.path.join(self.models_dir, scaler_filename)
-
-            if os.path.exists(scaler_path):
-                with open(scaler_path, 'rb') as f:
-                    st.session_state.scaler = pickle.load(f)
+            # 从共享注册表获取模型，已常驻内存时不会重复反序列化；首次加载时预热，首次预测不再承担初始化开销
+            entry = self.registry.get(model_filename)
+            if not entry.ready:
+                with self.metrics.span('model_warm_up'):
+                    entry.warm_up()
+            st.session_state.model_type = entry.model_type
+
+            if entry.scaler is not None:
                 return True, f"成功加载模型: {model_filename} 和特征缩放器"
             else:
-                st.session_state.scaler = None
                 return True, f"成功加载模型: {model_filename}，但未找到对应的特征缩放器"
 
         except Exception as e:
             return False, f"模型加载失败: {e}"
 
+    def get_current_model_entry(self):
+        """获取当前会话选中的模型（被淘汰后会自动重新加载）"""
+        if not st.session_state.model_loaded or not st.session_state.current_model:
+            return None
+        return self.registry.get(st.session_state.current_model)
+
     def get_feature_metadata(self):
-        """获取特征元数据"""
-        if self.db_connection:
+        """获取特征元数据（进程级缓存，版本标记变化时才重新读取）"""
+        if self.metadata_cache:
             try:
-                cursor = self.db_connection.cursor()
-                cursor.execute("SELECT * FROM feature_metadata")
-                result = cursor.fetchall()
-                columns = [col[0] for col in cursor.description]
-                self.feature_metadata = pd.DataFrame(result, columns=columns)
-                cursor.close()  # 关闭游标
+                with self.metrics.span('feature_metadata'):
+                    self.feature_metadata = self.metadata_cache.get()
                 return self.feature_metadata
             except Error as e:
                 st.error(f"获取特征元数据失败: {e}")
@@ -175,23 +217,13 @@ class AccidentRiskApp:
             """)
 
         # 系统统计信息
-        if self.db_connection:
+        if self.stats_cache:
             try:
-                cursor = self.db_connection.cursor()
-
-                # 总记录数
-                cursor.execute("SELECT COUNT(*) FROM training_data")
-                total_records = cursor.fetchone()[0]
-
-                # 模型数量
-                cursor.execute("SELECT COUNT(*) FROM model_configs")
-                model_count = cursor.fetchone()[0]
-
-                # 预测记录数
-                cursor.execute("SELECT COUNT(*) FROM web_predictions")
-                prediction_count = cursor.fetchone()[0]
-
-                cursor.close()  # 关闭游标
+                # 统计数据由所有会话共享的缓存提供，过期后才重新查询
+                stats = self.stats_cache.get()
+                total_records = stats['training_data']
+                model_count = stats['model_configs']
+                prediction_count = stats['web_predictions']
 
                 st.header("系统统计")
                 col1, col2, col3 = st.columns(3)
@@ -201,6 +233,8 @@ class AccidentRiskApp:
                     st.metric("模型数量", f"{model_count} 个")
                 with col3:
                     st.metric("预测次数", f"{prediction_count} 次")
+                if self.stats_cache.approximate:
+                    st.caption("训练数据量等统计来自 information_schema，为近似值")
 
             except Error as e:
                 st.error(f"获取统计数据失败: {e}")
@@ -211,6 +245,17 @@ class AccidentRiskApp:
 
         st.write("选择下方图表查看数据分析结果")
 
+        if self.training_stats:
+            source = st.radio(
+                "图表来源",
+                ["基于训练数据实时统计", "离线生成的静态图表"],
+                horizontal=True,
+                help="实时统计在数据库端分组聚合后缓存，训练数据新增后只统计新增的行"
+            )
+            if source == "基于训练数据实时统计":
+                self.interactive_charts_section()
+                return
+
         # 定义可用图表列表
         chart_options = {
             "事故概率分布直方图": "展示事故概率的整体分布情况",
@@ -242,12 +287,65 @@ class AccidentRiskApp:
 
         try:
             # 显示图表
-            st.image(chart_filename, use_column_width=True)
-            st.success(f"成功加载图表: {chart_filename}")
+            if self.show_chart([chart_filename]):
+                st.success(f"成功加载图表: {chart_filename}")
+            else:
+                st.error(f"无法加载图表: {chart_filename}")
+                st.info(f"请确保文件 '{chart_filename}' 存在于当前目录中")
         except Exception as e:
             st.error(f"无法加载图表: {chart_filename}")
             st.info(f"请确保文件 '{chart_filename}' 存在于当前目录中")
 
+    def interactive_charts_section(self):
+        """基于训练数据汇总绘制的交互式图表"""
+        try:
+            with self.metrics.span('training_stats'):
+                summary = self.training_stats.get()
+        except Error as e:
+            st.error(f"统计训练数据失败: {e}")
+            return
+
+        if summary.rows == 0:
+            st.info("训练数据表中暂无数据")
+            return
+
+        selected_chart = st.selectbox(
+            "选择要查看的图表",
+            options=list(INTERACTIVE_CHARTS),
+            index=0,
+            help="图表由数据库端的分组统计结果绘制，可缩放和悬停查看数值"
+        )
+        description = INTERACTIVE_CHARTS[selected_chart][0]
+        st.subheader(selected_chart)
+        st.write(description)
+
+        with self.metrics.span('chart_render'):
+            st.plotly_chart(build_figure(selected_chart, summary))
+
+        stats = self.training_stats.stats()
+        st.caption(f"基于 {summary.rows:,} 条训练数据，统计于 {stats['统计时间']}"
+                   f"（整表统计 {stats['整表统计次数']} 次，增量更新 {stats['增量更新次数']} 次，"
+                   f"最近一次耗时 {stats['最近统计耗时(s)']} 秒）")
+
+    def show_chart(self, candidates, caption=None):
+        """从图表缓存显示候选文件中第一个能加载的图片：默认显示缩略图，打开开关后显示高清图；
+        返回显示的文件名，都无法加载时返回None"""
+        index = self.chart_cache.index()
+        for filename in candidates:
+            if filename not in index:
+                continue
+            with self.metrics.span('chart_render'):
+                try:
+                    data = self.chart_cache.get(filename, 'thumbnail')
+                except OSError:
+                    continue
+                full = st.toggle("查看高清大图", key=f"chart_full_{filename}")
+                if full:
+                    data = self.chart_cache.get(filename, 'full')
+                st.image(data, caption=caption, width='stretch' if full else 'content')
+            return filename
+        return None
+
     def prediction_page(self):
         """预测分析页面"""
         st.title("🔮 事故风险预测")
@@ -265,19 +363,11 @@ class AccidentRiskApp:
         # 模型选择部分
         st.header("1. 选择预测模型")
 
-        # 设置默认模型为 lightgbm
-        default_index = 0
-        for i, model in enumerate(available_models):
-            if 'lightgbm' in model.lower():
-                default_index = i
-                break
-            elif 'xgboost' in model.lower():
-                default_index = i  # 如果没有lightgbm，使用xgboost作为备选
-
+        # 设置默认模型为 lightgbm，没有时使用 xgboost 作为备选
         selected_model = st.selectbox(
             "选择要使用的预测模型",
             options=available_models,
-            index=default_index,
+            index=_default_index(available_models, default_model(available_models)),
             help="从下拉列表中选择一个模型进行预测"
         )
 
@@ -285,13 +375,21 @@ class AccidentRiskApp:
         need_reload = (not st.session_state.model_loaded or
                        st.session_state.current_model != selected_model)
 
+        # 启动时预加载并预热的模型可以直接使用，无需点击"加载模型"
+        if need_reload and self.registry.is_preloading(selected_model):
+            with st.spinner(f"模型 {selected_model} 正在预加载..."):
+                self.registry.wait_preloaded(selected_model)
+        if need_reload and self.registry.is_ready(selected_model):
+            self.activate_model(selected_model)
+            need_reload = False
+
         if need_reload:
             st.session_state.model_loaded = False
 
-        # 加载模型按钮
+        # 加载模型按钮（模型已预加载时可选，用于重新加载）
         col1, col2 = st.columns([1, 3])
         with col1:
-            if st.button("加载模型", type="primary", key="load_model_btn"):
+            if st.button("加载模型", type="primary" if need_reload else "secondary", key="load_model_btn"):
                 with st.spinner(f"正在加载模型 {selected_model}..."):
                     success, message = self.load_selected_model(selected_model)
                     if success:
@@ -304,23 +402,86 @@ class AccidentRiskApp:
 
         with col2:
             if st.session_state.model_loaded:
+                entry = self.get_current_model_entry()
                 st.success(f"✅ 模型已加载: {st.session_state.current_model}")
                 st.info(f"模型类型: {st.session_state.model_type}")
-                if st.session_state.scaler:
+                if entry.scaler is not None:
                     st.info("✅ 特征缩放器已加载")
                 else:
                     st.warning("⚠️ 未找到特征缩放器")
+                if entry.source == 'artifact':
+                    st.info("✅ 已从导出产物加载（原生/数组格式，无需反序列化 pickle）")
+                if get_risk_table(entry):
+                    st.info("✅ 已加载预计算风险表，表单预测直接查表")
+                if entry.ready:
+                    st.info(f"✅ 模型已预热（{entry.warm_up_seconds * 1000:.0f} ms），首次预测无需额外初始化")
             else:
+                if selected_model in self.registry.preload_errors:
+                    st.warning(f"⚠️ 模型预加载失败: {self.registry.preload_errors[selected_model]}")
                 st.warning("⚠️ 请先加载模型")
 
+        # 模型缓存状态
+        with st.expander("模型缓存状态"):
+            cache_stats = self.registry.stats()
+            if cache_stats:
+                st.dataframe(pd.DataFrame(cache_stats))
+                st.caption(f"常驻模型 {len(cache_stats)} 个，"
+                           f"共 {self.registry.total_bytes() / 1024 / 1024:.2f} MB，"
+                           f"累计加载 {self.registry.loads} 次，淘汰 {self.registry.evictions} 次")
+            else:
+                st.write("暂无常驻内存的模型")
+            cache_stats = self.prediction_cache.stats()
+            st.caption(f"预测结果缓存: {cache_stats['size']} / {cache_stats['max_entries']} 条，"
+                       f"命中 {cache_stats['hits']} 次，未命中 {cache_stats['misses']} 次，"
+                       f"命中率 {cache_stats['hit_rate']:.1%}")
+
         # 如果模型未加载，显示提示并返回
         if not st.session_state.model_loaded:
             st.info("请先点击'加载模型'按钮加载选定的模型")
             return
 
+        prediction_mode = st.radio(
+            "预测方式",
+            ["单条预测", "多模型对比", "批量预测", "大文件流式预测"],
+            horizontal=True,
+            help="多模型对比用所有选中的模型同时预测同一条输入；"
+                 "批量预测支持上传CSV/Parquet文件，一次对多条记录进行预测；"
+                 "大文件流式预测分块读取服务器上的文件，内存占用与文件大小无关，中断后可续跑"
+        )
+
+        if prediction_mode == "批量预测":
+            self.batch_prediction_section()
+            return
+        if prediction_mode == "大文件流式预测":
+            self.streaming_prediction_section()
+            return
+
+        comparing = prediction_mode == "多模型对比"
+        if comparing:
+            compare_files = st.multiselect(
+                "参与对比的模型",
+                options=available_models,
+                default=available_models,
+                key="compare_models",
+                help="未常驻内存的模型会在提交时并发加载"
+            )
+            use_ensemble = st.checkbox("显示平均集成预测", value=True, key="compare_ensemble",
+                                       help="对所有成功预测的模型的风险值取平均")
+
         # 创建预测表单
         st.header("2. 输入预测参数")
 
+        # 表单的可选值、取值范围和说明来自特征元数据，元数据未提供时使用默认值
+        metadata = self.feature_metadata or EMPTY_METADATA
+        road_type_options = metadata.options('road_type', ['urban', 'rural', 'highway'])
+        lighting_options = metadata.options('lighting', ['daylight', 'dim', 'night'])
+        weather_options = metadata.options('weather', ['clear', 'rainy', 'foggy'])
+        time_of_day_options = metadata.options('time_of_day', ['morning', 'afternoon', 'evening'])
+        lanes_min, lanes_max = metadata.value_range('num_lanes', 1, 8)
+        curvature_min, curvature_max = metadata.value_range('curvature', 0.0, 1.0)
+        speed_min, speed_max = metadata.value_range('speed_limit', 20, 120)
+        accidents_min, accidents_max = metadata.value_range('num_reported_accidents', 0, 10)
+
         with st.form("prediction_form"):
             col1, col2 = st.columns(2)
 
@@ -330,49 +491,49 @@ class AccidentRiskApp:
                 # 道路类型
                 road_type = st.selectbox(
                     "道路类型",
-                    options=['urban', 'rural', 'highway'],
-                    index=0,
-                    help="选择道路类型"
+                    options=road_type_options,
+                    index=_default_index(road_type_options, 'urban'),
+                    help=metadata.description('road_type', "选择道路类型")
                 )
                 input_features['road_type'] = road_type
 
                 # 车道数量
                 num_lanes = st.slider(
                     "车道数量",
-                    min_value=1,
-                    max_value=8,
-                    value=2,
-                    help="选择车道数量"
+                    min_value=lanes_min,
+                    max_value=lanes_max,
+                    value=_clamp(2, lanes_min, lanes_max),
+                    help=metadata.description('num_lanes', "选择车道数量")
                 )
                 input_features['num_lanes'] = num_lanes
 
                 # 道路曲率
                 curvature = st.slider(
                     "道路曲率",
-                    min_value=0.0,
-                    max_value=1.0,
-                    value=0.5,
+                    min_value=curvature_min,
+                    max_value=curvature_max,
+                    value=_clamp(0.5, curvature_min, curvature_max),
                     step=0.1,
-                    help="道路曲率，0表示直线，1表示急弯"
+                    help=metadata.description('curvature', "道路曲率，0表示直线，1表示急弯")
                 )
                 input_features['curvature'] = curvature
 
                 # 限速
                 speed_limit = st.slider(
                     "限速 (km/h)",
-                    min_value=20,
-                    max_value=120,
-                    value=60,
-                    help="道路限速"
+                    min_value=speed_min,
+                    max_value=speed_max,
+                    value=_clamp(60, speed_min, speed_max),
+                    help=metadata.description('speed_limit', "道路限速")
                 )
                 input_features['speed_limit'] = speed_limit
 
                 # 光照条件
                 lighting = st.selectbox(
                     "光照条件",
-                    options=['daylight', 'dim', 'night'],
-                    index=0,
-                    help="选择光照条件"
+                    options=lighting_options,
+                    index=_default_index(lighting_options, 'daylight'),
+                    help=metadata.description('lighting', "选择光照条件")
                 )
                 input_features['lighting'] = lighting
 
@@ -380,9 +541,9 @@ class AccidentRiskApp:
                 # 天气状况
                 weather = st.selectbox(
                     "天气状况",
-                    options=['clear', 'rainy', 'foggy'],
-                    index=0,
-                    help="选择天气状况"
+                    options=weather_options,
+                    index=_default_index(weather_options, 'clear'),
+                    help=metadata.description('weather', "选择天气状况")
                 )
                 input_features['weather'] = weather
 
@@ -390,7 +551,7 @@ class AccidentRiskApp:
                 road_signs_present = st.checkbox(
                     "是否有道路标志",
                     value=True,
-                    help="道路是否有交通标志"
+                    help=metadata.description('road_signs_present', "道路是否有交通标志")
                 )
                 input_features['road_signs_present'] = road_signs_present
 
@@ -398,16 +559,16 @@ class AccidentRiskApp:
                 public_road = st.checkbox(
                     "是否公共道路",
                     value=True,
-                    help="是否为公共道路"
+                    help=metadata.description('public_road', "是否为公共道路")
                 )
                 input_features['public_road'] = public_road
 
                 # 时间段
                 time_of_day = st.selectbox(
                     "时间段",
-                    options=['morning', 'afternoon', 'evening'],
-                    index=1,
-                    help="选择时间段"
+                    options=time_of_day_options,
+                    index=_default_index(time_of_day_options, 'afternoon'),
+                    help=metadata.description('time_of_day', "选择时间段")
                 )
                 input_features['time_of_day'] = time_of_day
 
@@ -415,7 +576,7 @@ class AccidentRiskApp:
                 holiday = st.checkbox(
                     "是否节假日",
                     value=False,
-                    help="是否为节假日"
+                    help=metadata.description('holiday', "是否为节假日")
                 )
                 input_features['holiday'] = holiday
 
@@ -423,260 +584,364 @@ class AccidentRiskApp:
                 school_season = st.checkbox(
                     "是否学校季节",
                     value=False,
-                    help="是否为学校开学季节"
+                    help=metadata.description('school_season', "是否为学校开学季节")
                 )
                 input_features['school_season'] = school_season
 
                 # 报告事故数量
                 num_reported_accidents = st.slider(
                     "报告事故数量",
-                    min_value=0,
-                    max_value=10,
-                    value=1,
-                    help="历史报告事故数量"
+                    min_value=accidents_min,
+                    max_value=accidents_max,
+                    value=_clamp(1, accidents_min, accidents_max),
+                    help=metadata.description('num_reported_accidents', "历史报告事故数量")
                 )
                 input_features['num_reported_accidents'] = num_reported_accidents
 
             # 提交按钮
-            submitted = st.form_submit_button("进行风险预测", type="primary")
+            submitted = st.form_submit_button("多模型对比预测" if comparing else "进行风险预测", type="primary")
 
             if submitted:
-                self.make_prediction(input_features)
+                if comparing:
+                    self.compare_models_section(compare_files, input_features, use_ensemble)
+                else:
+                    self.make_prediction(input_features)
 
-    def create_features_for_model(self, input_features, model_type):
-        """根据模型类型创建对应的特征"""
-        # 基础特征
-        road_type = input_features['road_type']
-        num_lanes = input_features['num_lanes']
-        curvature = input_features['curvature']
-        speed_limit = input_features['speed_limit']
-        lighting = input_features['lighting']
-        weather = input_features['weather']
-        road_signs_present = input_features['road_signs_present']
-        public_road = input_features['public_road']
-        time_of_day = input_features['time_of_day']
-        holiday = input_features['holiday']
-        school_season = input_features['school_season']
-        num_reported_accidents = input_features['num_reported_accidents']
-
-        # 创建特征字典
-        features = {}
-
-        if model_type == 'linear_regression':
-            # 线性回归特征
-            features['num_reported_accidents_log_scaled'] = np.log1p(num_reported_accidents)
-            features['num_lanes_enc_scaled'] = num_lanes / 8.0
-            features['speed_limit_enc_scaled'] = speed_limit / 120.0
-            features['holiday'] = 1 if holiday else 0
-            features['public_road'] = 1 if public_road else 0
-            features['road_signs_present'] = 1 if road_signs_present else 0
-            features['school_season'] = 1 if school_season else 0
-
-            # One-hot编码特征
-            features['road_type_highway'] = 1 if road_type == 'highway' else 0
-            features['road_type_rural'] = 1 if road_type == 'rural' else 0
-            features['road_type_urban'] = 1 if road_type == 'urban' else 0
-
-            features['weather_clear'] = 1 if weather == 'clear' else 0
-            features['weather_foggy'] = 1 if weather == 'foggy' else 0
-            features['weather_rainy'] = 1 if weather == 'rainy' else 0
-
-            features['time_of_day_afternoon'] = 1 if time_of_day == 'afternoon' else 0
-            features['time_of_day_evening'] = 1 if time_of_day == 'evening' else 0
-            features['time_of_day_morning'] = 1 if time_of_day == 'morning' else 0
-
-            # 交互特征
-            features['curvature_speed_scaled'] = curvature * (speed_limit / 120.0)
-            features['curvature_night_scaled'] = curvature * (1 if lighting == 'night' else 0)
-
-        elif model_type in ['lasso', 'ridge']:
-            # Lasso和Ridge回归特征 - 只使用训练时使用的特征
-            features['num_reported_accidents_log_scaled'] = np.log1p(num_reported_accidents)
-            features['num_lanes_enc_scaled'] = num_lanes / 8.0
-            features['speed_limit_enc_scaled'] = speed_limit / 120.0
-            features['public_road'] = 1 if public_road else 0
-            features['road_signs_present'] = 1 if road_signs_present else 0
-            features['weather_clear'] = 1 if weather == 'clear' else 0
-            features['weather_rainy'] = 1 if weather == 'rainy' else 0
-            features['time_of_day_evening'] = 1 if time_of_day == 'evening' else 0
-            features['curvature_speed_scaled'] = curvature * (speed_limit / 120.0)
-            features['curvature_night_scaled'] = curvature * (1 if lighting == 'night' else 0)
-
-        elif model_type == 'random_forest':
-            # 随机森林特征
-            features['curvature_speed'] = curvature * speed_limit
-            features['curvature_night'] = curvature * (1 if lighting == 'night' else 0)
-            features['speed_limit_enc'] = speed_limit / 120.0
-            features['curvature'] = curvature
-            features['weather_clear'] = 1 if weather == 'clear' else 0
-            features['lighting_night'] = 1 if lighting == 'night' else 0
-            features['num_reported_accidents'] = num_reported_accidents
-
-        elif model_type == 'xgboost':
-            # XGBoost特征 - 根据错误信息，训练时只使用了7个特征
-            features['curvature_speed'] = float(curvature * speed_limit)
-            features['curvature_night'] = float(curvature * (1 if lighting == 'night' else 0))
-
-            # 对于分类特征，使用整数编码而不是浮点数
-            lighting_map = {'daylight': 0, 'dim': 1, 'night': 2}
-            weather_map = {'clear': 0, 'rainy': 1, 'foggy': 2}
-
-            features['lighting'] = lighting_map[lighting]
-            features['speed_limit_enc'] = float(speed_limit / 120.0)
-            features['weather'] = weather_map[weather]
-            features['curvature'] = float(curvature)
-            features['num_reported_accidents'] = float(num_reported_accidents)
-
-        elif model_type == 'lightgbm':
-            # LightGBM特征 - 确保分类特征正确设置
-            features['curvature'] = curvature
-            features['curvature_speed'] = curvature * speed_limit
-            features['weather'] = {'clear': 0, 'rainy': 1, 'foggy': 2}[weather]
-            features['speed_limit'] = speed_limit
-            features['num_reported_accidents'] = num_reported_accidents
-            features['curvature_night'] = curvature * (1 if lighting == 'night' else 0)
-            features['lighting'] = {'daylight': 0, 'dim': 1, 'night': 2}[lighting]
-            features['public_road'] = 1 if public_road else 0
-            features['holiday'] = 1 if holiday else 0
-            features['num_lanes'] = num_lanes
-            features['time_of_day'] = {'morning': 0, 'afternoon': 1, 'evening': 2}[time_of_day]
-            features['road_type'] = {'urban': 0, 'rural': 1, 'highway': 2}[road_type]
-            features['road_signs_present'] = 1 if road_signs_present else 0
-            features['school_season'] = 1 if school_season else 0
+        if comparing:
+            return
 
-        else:
-            # 未知模型类型，使用基础特征
-            features = input_features.copy()
-            # 将布尔值转换为0/1
-            for key in features:
-                if isinstance(features[key], bool):
-                    features[key] = 1 if features[key] else 0
+        self.sensitivity_section(input_features, {
+            'num_lanes': (lanes_min, lanes_max),
+            'curvature': (curvature_min, curvature_max),
+            'speed_limit': (speed_min, speed_max),
+            'num_reported_accidents': (accidents_min, accidents_max),
+        })
 
-        return features
+    def explanation_section(self, entry, input_features):
+        """影响因素分析：本次输入的各字段对风险值的贡献，结果与预测值一起缓存"""
+        st.subheader("影响因素分析")
+        try:
+            with self.metrics.span('explain'):
+                explanation = explain_one(entry, input_features, self.prediction_cache)
+        except ValueError as e:
+            st.info(str(e))
+            return
 
-    def preprocess_features(self, input_features):
-        """预处理输入特征，转换为模型需要的格式"""
-        # 根据模型类型创建特征
-        model_type = st.session_state.model_type
-        features_dict = self.create_features_for_model(input_features, model_type)
-
-        # 创建DataFrame
-        features_df = pd.DataFrame([features_dict])
-
-        # 对于XGBoost模型，确保特征顺序与训练时一致
-        if model_type == 'xgboost':
-            # 根据错误信息，训练时使用的特征顺序
-            expected_features_order = [
-                'curvature_speed', 'curvature_night', 'lighting', 'speed_limit_enc',
-                'weather', 'curvature', 'num_reported_accidents'
-            ]
-            # 只保留训练时使用的特征，并按正确顺序排列
-            features_df = features_df[expected_features_order]
-
-        # 对于Lasso和Ridge模型，简化特征缩放处理
-        if model_type in ['lasso', 'ridge'] and st.session_state.scaler:
-            try:
-                # 只对数值特征进行缩放，忽略特征名称
-                numerical_features = features_df.select_dtypes(include=[np.number]).columns
-                features_df[numerical_features] = st.session_state.scaler.transform(features_df[numerical_features])
-            except Exception:
-                # 如果缩放失败，继续使用原始特征进行预测
-                pass
+        st.plotly_chart(explanation_figure(explanation))
+        st.caption(f"解释方法: {explanation.method}；基准值 {explanation.base_value:.4f} 加各因素贡献得到模型输出 "
+                   f"{explanation.raw_prediction:.4f}"
+                   + ("（截断到 [0, 1] 后为预测风险值）" if explanation.raw_prediction != explanation.prediction else "")
+                   + f"；计算耗时 {explanation.elapsed_seconds * 1000:.2f} ms")
+        with st.expander("特征贡献明细"):
+            st.dataframe(pd.DataFrame(explanation.feature_table()))
+
+    def compare_models_section(self, model_files, input_features, use_ensemble):
+        """多模型对比：同一条输入在线程池中交给所有选中的模型并发预测，并排展示风险值、等级和耗时"""
+        try:
+            with self.metrics.span('model_compare'):
+                result = compare_models(self.registry, model_files, input_features, ensemble=use_ensemble)
+        except ValueError as e:
+            st.error(f"多模型对比失败: {e}")
+            return
+
+        st.header("📊 多模型对比结果")
+        for model_file, error in result.errors.items():
+            st.error(f"❌ {model_file} 预测失败: {error}")
+        if not result.rows:
+            return
+
+        if result.ensemble is not None:
+            ensemble = result.ensemble
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                st.metric("平均集成风险值", f"{ensemble['risk']:.4f}")
+            with col2:
+                st.metric("集成风险等级", ensemble['risk_level'].upper())
+            with col3:
+                st.metric("模型间标准差", f"{ensemble['std']:.4f}",
+                          help=f"{ensemble['models']} 个模型的最大最小差为 {ensemble['range']:.4f}")
+
+        st.dataframe(pd.DataFrame(result.table()))
+        st.plotly_chart(comparison_figure(result))
+        loaded = sum(1 for row in result.rows if row['load_seconds'])
+        st.caption(f"{len(result.rows)} 个模型在线程池中并发预测，总耗时 {result.elapsed_seconds * 1000:.1f} ms"
+                   + (f"，其中 {loaded} 个模型为本次加载" if loaded else ""))
+
+    def sensitivity_section(self, input_features, value_ranges):
+        """敏感性分析：以表单输入为基准改变一到两个因素，全部取值组合一次批量预测"""
+        st.header("3. 敏感性分析")
+        st.write("保持其余输入不变，查看风险值随一个因素变化的曲线，或随两个因素变化的热力图")
+
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            factors = st.multiselect(
+                "要改变的因素",
+                options=list(input_features),
+                default=['curvature', 'speed_limit'],
+                format_func=field_label,
+                max_selections=MAX_FACTORS,
+                key="sweep_factors",
+                help="选择一个因素绘制风险曲线，选择两个因素绘制风险热力图"
+            )
+        with col2:
+            points = st.number_input("数值型因素取值点数", min_value=3, max_value=MAX_POINTS, value=DEFAULT_POINTS,
+                                     key="sweep_points")
+
+        if not factors:
+            st.info("请选择要改变的因素")
+            return
+
+        try:
+            with self.metrics.span('sensitivity_sweep'):
+                result = sweep(self.get_current_model_entry(), input_features, factors,
+                               [factor_values(factor, points, value_ranges.get(factor)) for factor in factors])
+        except ValueError as e:
+            st.error(f"敏感性分析失败: {e}")
+            return
+
+        st.plotly_chart(sweep_figure(result))
+        st.caption(f"{result.rows:,} 个取值组合在一次批量预测中完成，耗时 {result.elapsed_seconds * 1000:.1f} ms；"
+                   f"基准为最近一次提交的表单输入，星号为当前输入（风险值 {result.base_risk:.4f}）")
+
+    def batch_prediction_section(self):
+        """批量预测：上传CSV/Parquet文件，整表一次性预测并下载结果"""
+        st.header("2. 上传批量预测数据")
+
+        st.write("文件需包含与预测表单相同的12个字段，每行一条记录：")
+        st.download_button(
+            "下载输入模板",
+            data=write_results(input_template(), 'csv'),
+            file_name="batch_prediction_template.csv",
+            mime="text/csv"
+        )
+
+        uploaded_file = st.file_uploader(
+            "上传批量预测文件",
+            type=SUPPORTED_FORMATS,
+            help="支持CSV和Parquet格式"
+        )
+        if uploaded_file is None:
+            return
 
-        # 对于其他模型，如果有scaler，直接应用
-        elif st.session_state.scaler:
+        output_format = st.selectbox("结果文件格式", options=SUPPORTED_FORMATS, index=0)
+
+        col1, col2 = st.columns(2)
+        with col1:
+            workers = st.number_input(
+                "并行工作进程数", min_value=1, max_value=max(default_workers(), 1), value=1,
+                help="大于1时按分块分发到多个进程并行预测，每个进程启动时加载一次模型；适合树模型的大文件"
+            )
+        with col2:
+            chunk_rows = st.number_input(
+                "每块行数", min_value=1000, max_value=1_000_000, value=DEFAULT_CHUNK_ROWS, step=1000,
+                disabled=workers == 1
+            )
+        explain_method = None
+        if st.checkbox("附带各影响因素的贡献", value=False, key="batch_explain",
+                       help="结果中增加 contrib_* 列，每行各因素贡献之和加 contrib_base 等于模型输出"):
+            explain_method = st.radio(
+                "树模型的解释方法", options=list(EXPLAIN_METHODS), horizontal=True, key="batch_explain_method",
+                format_func=lambda method: {'shap': "精确 TreeSHAP（较慢）", 'path': "路径归因（快速）"}[method],
+                index=list(EXPLAIN_METHODS).index('path'),
+                help="线性模型两种方式相同；树模型的精确 TreeSHAP 每行耗时约为预测的数十倍，大文件建议使用路径归因"
+            )
+
+        if st.button("开始批量预测", type="primary", key="batch_predict_btn"):
             try:
-                features_df = pd.DataFrame(
-                    st.session_state.scaler.transform(features_df),
-                    columns=features_df.columns
-                )
-            except Exception:
-                # 如果缩放失败，继续使用原始特征进行预测
-                pass
+                with st.spinner("正在进行批量预测..."):
+                    raw_df = read_input_file(uploaded_file, uploaded_file.name)
+                    scorer = None
+                    if workers > 1:
+                        # 进程池在进程内共享，模型和进程数不变时复用已启动的工作进程
+                        scorer = get_parallel_scorer(st.session_state.current_model, self.models_dir,
+                                                     int(workers), int(chunk_rows))
+                    with self.metrics.span('batch_predict'):
+                        batch = predict_batch(self.get_current_model_entry(), raw_df, scorer, explain_method)
+                    result_bytes = write_results(batch.results, output_format)
+            except ValueError as e:
+                st.error(f"批量预测失败: {e}")
+                return
+            except Exception as e:
+                st.error(f"❌ 批量预测过程中出现错误: {e}")
+                return
 
-        # 对于LightGBM，设置分类特征
-        if model_type == 'lightgbm':
-            categorical_features = ['weather', 'lighting', 'time_of_day', 'road_type']
-            for feature in categorical_features:
-                if feature in features_df.columns:
-                    features_df[feature] = features_df[feature].astype('category')
+            st.header("📊 批量预测结果")
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                st.metric("预测记录数", f"{batch.rows:,} 条")
+            with col2:
+                st.metric("总耗时", f"{batch.elapsed_seconds:.3f} 秒")
+            with col3:
+                st.metric("吞吐量", f"{batch.rows_per_second:,.0f} 条/秒")
+            if scorer is not None:
+                st.caption(f"{scorer.workers} 个工作进程，每块 {scorer.chunk_rows:,} 行，"
+                           f"进程池启动耗时 {scorer.start_seconds:.2f} 秒（已启动的进程池会被复用）")
+
+            st.dataframe(batch.results['risk_level'].value_counts().rename("记录数"))
+            st.dataframe(batch.results.head(100))
+
+            result_name = os.path.splitext(uploaded_file.name)[0]
+            st.download_button(
+                "下载预测结果",
+                data=result_bytes,
+                file_name=f"{result_name}_predictions.{output_format}",
+                mime="text/csv" if output_format == 'csv' else "application/octet-stream"
+            )
+
+    def streaming_prediction_section(self):
+        """大文件流式预测：分块读取服务器上的CSV/Parquet文件，逐块预测并写出，显示进度，中断后从断点继续"""
+        st.header("2. 流式预测服务器上的大文件")
+        st.write("文件需包含与预测表单相同的12个字段；每次只读入一块数据，适合无法整体载入内存的历史数据导出文件。")
 
-        # 对于XGBoost，确保所有特征都是数值型，并且使用正确的数据类型
-        if model_type == 'xgboost':
-            # 确保所有特征都是数值型
-            for col in features_df.columns:
-                features_df[col] = pd.to_numeric(features_df[col], errors='coerce')
+        data_dir = self.stream_data_dir
+        if not os.path.isdir(data_dir):
+            st.info(f"数据目录 {os.path.abspath(data_dir)} 不存在，请先创建该目录并放入待预测的文件")
+            return
+        st.caption(f"输入和结果文件都位于数据目录 {os.path.abspath(data_dir)} 内，路径相对该目录填写")
+
+        input_name = st.text_input("输入文件", help="数据目录中的CSV或Parquet文件")
+        if not input_name:
+            return
+        try:
+            input_path = resolve_data_path(data_dir, input_name)
+        except ValueError as e:
+            st.error(str(e))
+            return
+        if not os.path.isfile(input_path):
+            st.error(f"输入文件不存在: {input_name}")
+            return
+
+        output_format = st.selectbox("结果文件格式", options=SUPPORTED_FORMATS, index=0,
+                                     key="stream_output_format",
+                                     help="Parquet结果为目录，每块一个part文件")
+        output_name = st.text_input(
+            "结果文件",
+            value=f"{os.path.splitext(input_name)[0]}_predictions.{output_format}"
+        )
+        try:
+            output_path = resolve_data_path(data_dir, output_name)
+        except ValueError as e:
+            st.error(str(e))
+            return
+        col1, col2 = st.columns(2)
+        with col1:
+            chunk_rows = st.number_input("每块行数", min_value=1000, max_value=5_000_000,
+                                         value=STREAM_CHUNK_ROWS, step=10000, key="stream_chunk_rows")
+        with col2:
+            workers = st.number_input("并行工作进程数", min_value=1, max_value=max(default_workers(), 1), value=1,
+                                      key="stream_workers")
+        restart = st.checkbox("忽略断点，从头开始", value=False)
+
+        entry = self.get_current_model_entry()
+        try:
+            job = StreamingJob(entry, input_path, output_path, int(chunk_rows), output_format)
+        except ValueError as e:
+            st.error(f"流式预测失败: {e}")
+            return
+        checkpoint = job.load_checkpoint()
+        if checkpoint is not None and not restart:
+            if checkpoint.get('completed'):
+                st.success(f"该任务已完成，共 {checkpoint['rows']:,} 行，结果在 {output_name}")
+            else:
+                st.info(f"发现断点：已完成 {checkpoint['rows']:,} 行，将从断点继续")
+
+        if not st.button("开始流式预测", type="primary", key="stream_predict_btn"):
+            return
+
+        if workers > 1:
+            job.scorer = get_parallel_scorer(st.session_state.current_model, self.models_dir, int(workers),
+                                             int(chunk_rows))
+        if restart:
+            job.reset()
+
+        progress_bar = st.progress(0.0, text="正在预测...")
+        metrics = st.empty()
+
+        def progress(job):
+            progress_bar.progress(job.fraction, text=f"已处理 {job.rows_done:,} 行 ({job.fraction:.1%})")
+            metrics.caption(f"已写出 {job.chunks_done} 块，{job.rows_per_second:,.0f} 行/秒，"
+                            f"耗时 {job.elapsed_seconds:.1f} 秒")
+
+        try:
+            job.run(progress)
+        except ValueError as e:
+            st.error(f"流式预测失败: {e}（已完成的部分已保存，修正后再次运行将从断点继续）")
+            return
+        except Exception as e:
+            st.error(f"❌ 流式预测过程中出现错误: {e}（再次运行将从断点继续）")
+            return
 
-            # 填充可能的NaN值
-            features_df = features_df.fillna(0)
+        progress_bar.progress(1.0, text="预测完成")
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("预测记录数", f"{job.rows_done:,} 条")
+        with col2:
+            st.metric("本次耗时", f"{job.elapsed_seconds:.1f} 秒")
+        with col3:
+            st.metric("吞吐量", f"{job.rows_per_second:,.0f} 条/秒")
+        if job.resumed_rows:
+            st.caption(f"其中 {job.resumed_rows:,} 行在之前的运行中已完成")
+        st.success(f"✅ 结果已写入 {output_name}")
 
-            # 确保数据类型一致
-            features_df = features_df.astype(np.float32)
+    def create_features_for_model(self, input_features, model_type):
+        """根据模型类型创建对应的特征（特征定义见 feature_pipeline.FEATURE_SPECS）"""
+        return get_encoder(model_type).features_dict(input_features)
 
-        return features_df
+    def preprocess_features(self, input_features):
+        """预处理输入特征，转换为模型需要的格式"""
+        # 使用模型加载时编译好的编码器，直接得到按训练列顺序排列的 float32 特征矩阵
+        return self.get_current_model_entry().encoder.encode_one(input_features)
 
     def make_prediction(self, input_features):
         """进行预测"""
         try:
+            start = time.perf_counter()
             # 检查模型是否已加载
-            if st.session_state.model is None:
+            entry = self.get_current_model_entry()
+            if entry is None:
                 st.error("模型未加载，请先加载模型")
                 return
-
-            # 预处理特征
-            features_processed = self.preprocess_features(input_features)
-
-            if features_processed is None:
-                st.error("特征预处理失败，无法进行预测")
-                return
-
-            # 检查特征数量
-            expected_features_count = {
-                'linear_regression': 18,
-                'lasso': 10,
-                'ridge': 10,
-                'random_forest': 7,
-                'xgboost': 7,  # XGBoost现在只使用7个特征
-                'lightgbm': 14
-            }
-
-            model_type = st.session_state.model_type
-            if model_type in expected_features_count:
-                expected_count = expected_features_count[model_type]
-                actual_count = len(features_processed.columns)
-                if actual_count != expected_count:
+            model = entry.model
+
+            # 优先从预计算风险表查表，其次使用相同模型版本和相同输入的缓存结果
+            metrics = self.metrics
+            risk_table = get_risk_table(entry)
+            prediction = None
+            if risk_table:
+                with metrics.span('risk_table_lookup'):
+                    prediction = risk_table.lookup(input_features)
+            if prediction is None:
+                with metrics.span('cache_lookup'):
+                    prediction = self.prediction_cache.get(entry, input_features)
+            if prediction is None and entry.kernel is not None:
+                # 线性模型使用加载时编译的融合内核，直接由表单输入计算风险值（特征构造、缩放和预测融合为一步）
+                with metrics.span('predict'):
+                    prediction = predict_one(entry, input_features)
+                self.prediction_cache.put(entry, input_features, prediction)
+            if prediction is None:
+                # 预处理特征（缩放已折叠进编码器）
+                with metrics.span('feature_encode'):
+                    features_processed = self.preprocess_features(input_features)
+
+                if features_processed is None:
+                    st.error("特征预处理失败，无法进行预测")
+                    return
+
+                # 检查特征数量
+                expected_count = getattr(model, 'n_features_in_', None)
+                actual_count = features_processed.shape[1]
+                if expected_count is not None and actual_count != expected_count:
                     st.warning(f"特征数量: 期望 {expected_count} 个，实际 {actual_count} 个")
 
-            # 进行预测
-            if model_type == 'xgboost':
-                # 对于XGBoost，确保使用正确的预测方法
-                try:
-                    # 尝试直接预测
-                    prediction = st.session_state.model.predict(features_processed)[0]
-                except Exception as e:
-                    st.error(f"XGBoost预测失败: {e}")
-                    # 尝试使用predict_proba（如果是分类问题）
-                    try:
-                        prediction_proba = st.session_state.model.predict_proba(features_processed)
-                        prediction = prediction_proba[0][1] if prediction_proba.shape[1] > 1 else prediction_proba[0][0]
-                    except:
-                        # 最后尝试使用原始预测值
-                        prediction = st.session_state.model.predict(features_processed, output_margin=True)[0]
-                        # 如果是margin输出，使用sigmoid转换
-                        prediction = 1 / (1 + np.exp(-prediction))
-            else:
-                prediction = st.session_state.model.predict(features_processed)[0]
-
-            # 确保预测值在合理范围内
-            prediction = max(0.0, min(1.0, float(prediction)))
+                # 进行预测，预测值截断到[0, 1]
+                # 树模型单条预测使用编译后的节点数组，避免原生库的单次调用开销
+                with metrics.span('predict'):
+                    prediction = float(predict_matrix(entry.predictor(1), features_processed)[0])
+                self.prediction_cache.put(entry, input_features, prediction)
 
             # 确定风险等级
-            if prediction < 0.3:
-                risk_level = 'low'
-            elif prediction < 0.7:
-                risk_level = 'medium'
-            else:
-                risk_level = 'high'
+            risk_level = classify_risk(prediction)
+            metrics.observe('prediction_total', time.perf_counter() - start)
 
             # 显示预测结果
             st.header("📊 预测结果")
@@ -723,31 +988,17 @@ class AccidentRiskApp:
                 - 建议：显著降低车速，保持高度警惕，必要时选择其他路线
                 """)
 
-            # 保存预测记录到数据库 - 修复后的代码
-            if self.db_connection:
-                try:
-                    # 使用一个游标查询模型ID
-                    cursor1 = self.db_connection.cursor()
-                    cursor1.execute("SELECT id FROM model_configs WHERE is_active = TRUE")
-                    result = cursor1.fetchone()
-                    model_config_id = result[0] if result else 1
-                    cursor1.close()  # 关闭查询游标
-
-                    # 使用另一个游标执行插入
-                    cursor2 = self.db_connection.cursor()
-                    cursor2.execute("""
-                       INSERT INTO web_predictions
-                       (model_config_id, input_features, predicted_risk, risk_level, session_id)
-                       VALUES (%s, %s, %s, %s, %s)
-                       """, (model_config_id, json.dumps(input_features), float(prediction), risk_level,
-                             self.session_id))
-
-                    self.db_connection.commit()
-                    cursor2.close()  # 关闭插入游标
-                    st.success("✅ 预测完成！预测记录已保存到数据库。")
-
-                except Error as e:
-                    st.warning(f"⚠️ 预测记录保存失败: {e}，但预测已完成")
+            self.explanation_section(entry, input_features)
+
+            # 预测记录交给后台队列批量写入数据库，不阻塞本次预测
+            if self.prediction_logger:
+                with metrics.span('prediction_log'):
+                    status = self.prediction_logger.log(input_features, prediction, risk_level,
+                                                        self.session_id)
+                if status == 'dropped':
+                    st.warning("⚠️ 预测记录保存队列已满，本次记录未保存，但预测已完成")
+                else:
+                    st.success("✅ 预测完成！预测记录将在后台保存到数据库。")
 
         except Exception as e:
             st.error(f"❌ 预测过程中出现错误: {e}")
@@ -757,12 +1008,11 @@ class AccidentRiskApp:
                 st.write(f"当前模型: {st.session_state.current_model}")
                 st.write(f"模型类型: {st.session_state.model_type}")
                 if 'features_processed' in locals():
-                    st.write(f"实际特征: {features_processed.columns.tolist()}")
-                    st.write(f"实际特征数量: {len(features_processed.columns)}")
-                    st.write(f"特征值: {features_processed.iloc[0].to_dict()}")
-                    st.write(f"特征数据类型:")
-                    for col in features_processed.columns:
-                        st.write(f"- {col}: {features_processed[col].dtype}")
+                    columns = self.get_current_model_entry().encoder.columns
+                    st.write(f"实际特征: {columns}")
+                    st.write(f"实际特征数量: {features_processed.shape[1]}")
+                    st.write(f"特征值: {dict(zip(columns, features_processed[0].tolist()))}")
+                    st.write(f"特征数据类型: {features_processed.dtype}")
 
     def model_analysis_page(self):
         """模型分析页面"""
@@ -778,18 +1028,10 @@ class AccidentRiskApp:
             "learning_curves.png"
         ]
 
-        learning_curve_loaded = False
-        for curve_file in learning_curve_files:
-            if os.path.exists(curve_file):
-                try:
-                    st.image(curve_file, use_column_width=True, caption="模型学习曲线")
-                    st.success(f"成功加载学习曲线: {curve_file}")
-                    learning_curve_loaded = True
-                    break
-                except Exception as e:
-                    continue
-
-        if not learning_curve_loaded:
+        curve_file = self.show_chart(learning_curve_files, caption="模型学习曲线")
+        if curve_file:
+            st.success(f"成功加载学习曲线: {curve_file}")
+        else:
             st.warning("无法找到学习曲线图片文件。请确保以下文件之一存在于当前目录:")
             for curve_file in learning_curve_files:
                 st.write(f"- {curve_file}")
@@ -813,14 +1055,14 @@ class AccidentRiskApp:
 
         # 尝试加载特征重要性图片
         try:
-            if os.path.exists(feature_importance_file):
-                st.image(feature_importance_file, use_column_width=True, caption=f"{selected_model}模型特征重要性分析")
+            if self.show_chart([feature_importance_file], caption=f"{selected_model}模型特征重要性分析"):
                 st.success(f"成功加载特征重要性分析图: {feature_importance_file}")
             else:
                 st.warning(f"未找到特征重要性分析图片: {feature_importance_file}")
                 st.info(f"请确保文件 '{feature_importance_file}' 存在于当前目录中")
         except Exception as e:
             st.error(f"加载特征重要性分析图失败: {e}")
+        st.caption("以上为训练时的全局特征重要性；单条输入的各因素贡献见\"预测分析\"页单条预测结果中的\"影响因素分析\"")
 
         # 模型性能对比图
         st.header("模型性能对比图")
@@ -832,18 +1074,10 @@ class AccidentRiskApp:
             "performance_comparison.png"
         ]
 
-        performance_comparison_loaded = False
-        for perf_file in performance_comparison_files:
-            if os.path.exists(perf_file):
-                try:
-                    st.image(perf_file, use_column_width=True, caption="模型性能对比图")
-                    st.success(f"成功加载模型性能对比图: {perf_file}")
-                    performance_comparison_loaded = True
-                    break
-                except Exception as e:
-                    continue
-
-        if not performance_comparison_loaded:
+        perf_file = self.show_chart(performance_comparison_files, caption="模型性能对比图")
+        if perf_file:
+            st.success(f"成功加载模型性能对比图: {perf_file}")
+        else:
             st.warning("无法找到模型性能对比图图片文件。请确保以下文件之一存在于当前目录:")
             for perf_file in performance_comparison_files:
                 st.write(f"- {perf_file}")
@@ -858,18 +1092,10 @@ class AccidentRiskApp:
             "residuals_plot.png"
         ]
 
-        residual_analysis_loaded = False
-        for residual_file in residual_analysis_files:
-            if os.path.exists(residual_file):
-                try:
-                    st.image(residual_file, use_column_width=True, caption="残差分析图")
-                    st.success(f"成功加载残差分析图: {residual_file}")
-                    residual_analysis_loaded = True
-                    break
-                except Exception as e:
-                    continue
-
-        if not residual_analysis_loaded:
+        residual_file = self.show_chart(residual_analysis_files, caption="残差分析图")
+        if residual_file:
+            st.success(f"成功加载残差分析图: {residual_file}")
+        else:
             st.warning("无法找到残差分析图图片文件。请确保以下文件之一存在于当前目录:")
             for residual_file in residual_analysis_files:
                 st.write(f"- {residual_file}")
@@ -877,18 +1103,20 @@ class AccidentRiskApp:
         # 模型性能指标
         st.header("模型性能指标")
 
-        if self.db_connection:
+        if self.db_pool:
             try:
-                cursor = self.db_connection.cursor()
-
-                # 获取模型性能数据
-                cursor.execute("""
-                               SELECT mc.model_name, mp.dataset_type, mp.mse, mp.r2_score, mp.mae
-                               FROM model_performance mp
-                                        JOIN model_configs mc ON mp.model_config_id = mc.id
-                               WHERE mc.is_active = TRUE
-                               """)
-                performance_data = cursor.fetchall()
+                with self.db_pool.connection() as conn:
+                    cursor = conn.cursor()
+
+                    # 获取模型性能数据
+                    cursor.execute("""
+                                   SELECT mc.model_name, mp.dataset_type, mp.mse, mp.r2_score, mp.mae
+                                   FROM model_performance mp
+                                            JOIN model_configs mc ON mp.model_config_id = mc.id
+                                   WHERE mc.is_active = TRUE
+                                   """)
+                    performance_data = cursor.fetchall()
+                    cursor.close()  # 关闭游标
 
                 if performance_data:
                     # 创建性能指标表格 - 移除了RMSE列
@@ -899,6 +1127,7 @@ class AccidentRiskApp:
                         'R2 Score': '{:.4f}',
                         'MAE': '{:.4f}'
                     }))
+                    st.caption("指标由 `python evaluate.py` 基于当前训练数据重新计算后写入")
 
                     # 添加性能指标解释 - 更新说明，移除了RMSE
                     with st.expander("性能指标说明"):
@@ -908,9 +1137,7 @@ class AccidentRiskApp:
                         - **MAE (平均绝对误差)**: 预测值与真实值之差的绝对值的平均值，值越小越好
                         """)
                 else:
-                    st.info("暂无模型性能数据")
-
-                cursor.close()  # 关闭游标
+                    st.info("暂无模型性能数据，可运行 `python evaluate.py` 计算")
 
             except Error as e:
                 st.error(f"加载模型性能数据失败: {e}")
@@ -919,9 +1146,11 @@ class AccidentRiskApp:
 
     def run(self):
         """运行应用"""
-        # 初始化连接
-        if not self.db_connection:
-            if not self.connect_database():
+        # 初始化连接（连接池在进程内共享，重新运行脚本时不会重新握手）
+        if not self.db_pool:
+            with self.metrics.span('db_connect'):
+                connected = self.connect_database()
+            if not connected:
                 st.error("无法连接到数据库，请检查数据库配置")
                 return
 
@@ -945,8 +1174,19 @@ class AccidentRiskApp:
         st.sidebar.subheader("系统状态")
 
         # 显示数据库连接状态
-        db_status = "✅ 已连接" if self.db_connection and self.db_connection.is_connected() else "❌ 未连接"
+        db_status = "✅ 已连接" if self.db_pool else "❌ 未连接"
         st.sidebar.write(f"数据库: {db_status}")
+        if self.db_pool:
+            pool_stats = self.db_pool.stats()
+            st.sidebar.write(f"连接池: 活跃 {pool_stats['active']} / 空闲 {pool_stats['idle']}"
+                             f" / 上限 {pool_stats['pool_size']}")
+            st.sidebar.caption(f"借出等待 平均 {pool_stats['avg_wait_ms']:.2f} ms，"
+                               f"P95 {pool_stats['p95_wait_ms']:.2f} ms，"
+                               f"已建立连接 {pool_stats['created']} 个，回收 {pool_stats['recycled']} 个")
+        if self.prediction_logger:
+            log_stats = self.prediction_logger.stats()
+            st.sidebar.caption(f"预测记录: 待写入 {log_stats['pending']} 条，已写入 {log_stats['written']} 条，"
+                               f"溢写 {log_stats['spilled']} 条，丢弃 {log_stats['dropped']} 条")
 
         # 显示模型加载状态
         model_status = "✅ 已加载" if st.session_state.model_loaded else "❌ 未加载"
@@ -956,6 +1196,10 @@ class AccidentRiskApp:
             st.sidebar.write(f"当前模型: {st.session_state.current_model}")
             st.sidebar.write(f"模型类型: {st.session_state.model_type}")
 
+        # 性能监控面板在页面渲染之后填充，包含本次运行中记录的耗时
+        st.sidebar.markdown("---")
+        metrics_panel = st.sidebar.container()
+
         st.sidebar.markdown("---")
         st.sidebar.info("交通事故风险预测系统 v1.0")
 
@@ -969,6 +1213,41 @@ class AccidentRiskApp:
         elif page == "模型分析":
             self.model_analysis_page()
 
+        with metrics_panel:
+            self.metrics_panel()
+
+    def metrics_panel(self):
+        """侧边栏性能监控：各阶段耗时直方图的汇总，可导出为 Prometheus 文本格式"""
+        st.subheader("性能监控")
+        enabled = st.checkbox("记录分阶段耗时", value=self.metrics.enabled, key="metrics_enabled",
+                              help="关闭后各阶段不再计时，开销可忽略；设置对整个进程生效")
+        self.metrics.enabled = enabled
+        stats = self.metrics.stats()
+        if not stats:
+            st.caption("暂无耗时记录" if enabled else "分阶段耗时记录已关闭")
+            return
+
+        with st.expander("各阶段耗时", expanded=False):
+            st.dataframe(pd.DataFrame(stats).set_index('阶段'))
+            st.caption("P50/P95/P99 由直方图桶插值估计")
+        prometheus_text = self.metrics.prometheus_text()
+        col1, col2 = st.columns(2)
+        with col1:
+            st.download_button("导出指标", data=prometheus_text.encode('utf-8'), file_name="accident_app.prom",
+                               mime="text/plain", help="Prometheus 文本格式")
+        with col2:
+            if st.button("重置统计", key="metrics_reset_btn"):
+                self.metrics.reset()
+                st.rerun()
+        exporter = self.metrics_exporter
+        if exporter.last_error:
+            st.caption(f"指标文件写入失败: {exporter.last_error}")
+        elif exporter.last_export_at:
+            st.caption(f"指标文件: {exporter.path}（每 {exporter.interval:g} 秒更新，"
+                       f"上次 {time.strftime('%H:%M:%S', time.localtime(exporter.last_export_at))}）")
+        else:
+            st.caption(f"指标文件: {exporter.path}（每 {exporter.interval:g} 秒更新）")
+
 
 # 运行应用
 if __name__ == "__main__":
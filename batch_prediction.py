@@ -0,0 +1,83 @@
+import io
+import os
+import time
+
+import pandas as pd
+
+from explanations import explain_frame
+from feature_pipeline import RAW_FEATURE_COLUMNS, classify_risks, normalize_raw_frame, predict_frame
+
+SUPPORTED_FORMATS = ['csv', 'parquet']
+
+
+def file_format(filename):
+    """根据扩展名判断文件格式"""
+    ext = os.path.splitext(filename)[1].lower().lstrip('.')
+    if ext not in SUPPORTED_FORMATS:
+        raise ValueError(f"不支持的文件格式: {ext or '无扩展名'}，仅支持 CSV 和 Parquet")
+    return ext
+
+
+def read_input_file(file, filename):
+    """读取上传的CSV/Parquet文件为DataFrame"""
+    if file_format(filename) == 'csv':
+        return pd.read_csv(file)
+    try:
+        return pd.read_parquet(file)
+    except ImportError:
+        raise ValueError("读取Parquet文件需要安装 pyarrow 或 fastparquet")
+
+
+def write_results(results_df, fmt='csv'):
+    """将预测结果序列化为可下载的文件内容"""
+    if fmt == 'csv':
+        # 带BOM便于Excel正确识别中文
+        return results_df.to_csv(index=False).encode('utf-8-sig')
+    buffer = io.BytesIO()
+    try:
+        results_df.to_parquet(buffer, index=False)
+    except ImportError:
+        raise ValueError("导出Parquet文件需要安装 pyarrow 或 fastparquet")
+    return buffer.getvalue()
+
+
+def input_template():
+    """批量预测输入模板（示例一行）"""
+    return pd.DataFrame([{
+        'road_type': 'urban', 'num_lanes': 2, 'curvature': 0.5, 'speed_limit': 60,
+        'lighting': 'daylight', 'weather': 'clear', 'road_signs_present': True,
+        'public_road': True, 'time_of_day': 'afternoon', 'holiday': False,
+        'school_season': False, 'num_reported_accidents': 1,
+    }], columns=RAW_FEATURE_COLUMNS)
+
+
+class BatchResult:
+    """批量预测结果及吞吐量统计"""
+
+    def __init__(self, results, elapsed_seconds):
+        self.results = results
+        self.elapsed_seconds = elapsed_seconds
+
+    @property
+    def rows(self):
+        return len(self.results)
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed_seconds if self.elapsed_seconds > 0 else float('inf')
+
+
+def predict_batch(entry, raw_df, scorer=None, explain_method=None):
+    """对原始输入表做批量预测，返回附带 predicted_risk 和 risk_level 列的结果；
+    scorer 为多进程打分器（parallel_scoring.ParallelScorer）时按分块分发到工作进程；
+    explain_method 为解释方法（explanations.EXPLAIN_METHODS）时再附带各影响因素的贡献列（contrib_*）"""
+    start = time.perf_counter()
+    inputs = normalize_raw_frame(raw_df)
+    predictions = scorer.predict_frame(inputs) if scorer is not None else predict_frame(entry, inputs)
+
+    results = inputs.copy()
+    results['predicted_risk'] = predictions
+    results['risk_level'] = classify_risks(predictions)
+    if explain_method is not None:
+        results = pd.concat([results, explain_frame(entry, inputs, explain_method)], axis=1)
+    return BatchResult(results, time.perf_counter() - start)
@@ -0,0 +1,308 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from feature_pipeline import normalize_input, predict_frame, predict_one, sample_raw_frame
+from model_artifacts import (DEFAULT_ARTIFACTS_DIR, MODEL_TYPE_KEYWORDS, available_models, cold_load,
+                             infer_model_type)
+from model_registry import ModelRegistry
+
+REPORT_VERSION = 1
+DEFAULT_SAMPLES = 2000
+DEFAULT_BATCH_SIZES = [1, 16, 256, 4096, 65536]
+# 批量吞吐量测量的最短时长（秒），小批量会重复多次
+MIN_BATCH_SECONDS = 0.2
+# 与基准报告比较时视为退化的相对变化
+DEFAULT_THRESHOLD = 0.10
+
+
+def percentiles(samples_seconds):
+    """单次耗时样本（秒）的 p50/p95/p99 和平均值，单位微秒"""
+    samples = np.asarray(samples_seconds) * 1e6
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+    return {'p50_us': round(float(p50), 2), 'p95_us': round(float(p95), 2), 'p99_us': round(float(p99), 2),
+            'mean_us': round(float(samples.mean()), 2)}
+
+
+def _rss_mb():
+    """当前常驻内存（MB），无法读取时返回None"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _peak_rss_mb():
+    """进程的内存峰值（MB）"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为KB，macOS 为字节
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+def _round_mb(value):
+    return round(value, 1) if value is not None else None
+
+
+def bench_model(models_dir, model_filename, artifacts_dir=DEFAULT_ARTIFACTS_DIR, samples=DEFAULT_SAMPLES,
+                batch_sizes=DEFAULT_BATCH_SIZES, seed=0):
+    """在当前进程中测量一个模型的加载、单条预测延迟、批量吞吐量和内存；应在新进程中调用，内存数据才可比较"""
+    rss_before = _rss_mb()
+    entry = ModelRegistry(models_dir, artifacts_dir=artifacts_dir).get(model_filename)
+    rss_loaded = _rss_mb()
+
+    # 单条预测：与表单预测相同的路径（不查风险表和缓存），即编码特征 + 模型预测
+    raw_df = sample_raw_frame(samples, seed)
+    inputs = [normalize_input(record) for record in raw_df.to_dict('records')]
+    for input_features in inputs[:min(50, samples)]:
+        predict_one(entry, input_features)
+    encode_times = []
+    for input_features in inputs:
+        start = time.perf_counter()
+        entry.encoder.encode_one(input_features)
+        encode_times.append(time.perf_counter() - start)
+    predict_times = []
+    for input_features in inputs:
+        start = time.perf_counter()
+        predict_one(entry, input_features)
+        predict_times.append(time.perf_counter() - start)
+
+    # 批量吞吐量：每种批量大小重复到至少 MIN_BATCH_SECONDS，取平均
+    batches = {}
+    for batch_size in batch_sizes:
+        batch_df = sample_raw_frame(batch_size, seed + batch_size)
+        predict_frame(entry, batch_df)
+        runs = 0
+        start = time.perf_counter()
+        while True:
+            predict_frame(entry, batch_df)
+            runs += 1
+            elapsed = time.perf_counter() - start
+            if elapsed >= MIN_BATCH_SECONDS:
+                break
+        batches[str(batch_size)] = {
+            'rows_per_second': round(batch_size * runs / elapsed, 1),
+            'batch_ms': round(elapsed / runs * 1000, 4),
+        }
+
+    return {
+        'model_type': entry.model_type,
+        'source': entry.source,
+        'engine': entry.engine_name(),
+        'size_bytes': entry.size_bytes,
+        'load_seconds': round(entry.load_seconds, 6),
+        'encode_one': percentiles(encode_times),
+        'single_row': percentiles(predict_times),
+        'batch': batches,
+        'memory': {
+            'rss_before_load_mb': _round_mb(rss_before),
+            'rss_after_load_mb': _round_mb(rss_loaded),
+            'model_rss_mb': _round_mb(rss_loaded - rss_before) if rss_before is not None else None,
+            'peak_rss_mb': _round_mb(_peak_rss_mb()),
+        },
+    }
+
+
+def bench_isolated(models_dir, model_filename, artifacts_dir=DEFAULT_ARTIFACTS_DIR, samples=DEFAULT_SAMPLES,
+                   batch_sizes=DEFAULT_BATCH_SIZES, seed=0):
+    """在新进程中运行 bench_model，各模型的内存峰值互不影响"""
+    args = [sys.executable, os.path.abspath(__file__), 'run', '--isolated', '--models-dir', models_dir,
+            '--artifacts-dir', artifacts_dir or '', '--model', model_filename, '--samples', str(samples),
+            '--seed', str(seed), '--batch-sizes', *[str(size) for size in batch_sizes]]
+    result = subprocess.run(args, capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    if result.returncode != 0:
+        raise ValueError(f"基准测试进程失败: {result.stderr.strip().splitlines()[-1:]}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def _git_commit():
+    try:
+        result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+    except OSError:
+        return None
+    return result.stdout.strip() or None
+
+
+def _environment():
+    import sklearn
+
+    versions = {'python': platform.python_version(), 'numpy': np.__version__,
+                'scikit-learn': sklearn.__version__}
+    for name in ('lightgbm', 'xgboost'):
+        try:
+            versions[name] = __import__(name).__version__
+        except ImportError:
+            versions[name] = None
+    return {
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'versions': versions,
+        'git_commit': _git_commit(),
+    }
+
+
+def run_suite(models_dir="models", model_files=None, artifacts_dir=DEFAULT_ARTIFACTS_DIR,
+              samples=DEFAULT_SAMPLES, batch_sizes=DEFAULT_BATCH_SIZES, cold_repeat=3, seed=0, progress=None):
+    """对 models 目录中的每个模型做完整测量，返回可序列化为JSON的报告"""
+    model_files = model_files or available_models(models_dir)
+    report = {
+        'report_version': REPORT_VERSION,
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'environment': _environment(),
+        'config': {'samples': samples, 'batch_sizes': list(batch_sizes), 'cold_repeat': cold_repeat,
+                   'seed': seed, 'artifacts_dir': artifacts_dir},
+        'models': {},
+        # 模型目录中没有对应文件的模型类型
+        'missing_model_types': sorted(set(MODEL_TYPE_KEYWORDS) - {infer_model_type(model_file)
+                                                                  for model_file in available_models(models_dir)}),
+    }
+    for model_file in model_files:
+        if progress is not None:
+            progress(model_file)
+        result = bench_isolated(models_dir, model_file, artifacts_dir, samples, batch_sizes, seed)
+        # 冷启动：新进程从启动到模型可用的耗时（包含导入依赖库），取多次中最快的一次
+        sources = {'pickle': None}
+        if artifacts_dir:
+            sources['artifact'] = artifacts_dir
+        result['cold_start'] = {}
+        for label, directory in sources.items():
+            total, load_seconds, source = min(cold_load(models_dir, model_file, directory)
+                                              for _ in range(cold_repeat))
+            result['cold_start'][label] = {'total_seconds': round(total, 4),
+                                           'load_seconds': round(load_seconds, 6), 'source': source}
+        report['models'][model_file] = result
+    return report
+
+
+# 比较报告时检查的指标: (路径, 名称, 越大越好)
+_COMPARED_METRICS = [
+    (('single_row', 'p50_us'), '单条 p50 (µs)', False),
+    (('single_row', 'p99_us'), '单条 p99 (µs)', False),
+    (('encode_one', 'p50_us'), '编码 p50 (µs)', False),
+    (('memory', 'peak_rss_mb'), '内存峰值 (MB)', False),
+    (('cold_start', 'pickle', 'total_seconds'), '冷启动 pickle (s)', False),
+    (('cold_start', 'artifact', 'total_seconds'), '冷启动 artifact (s)', False),
+]
+
+
+def _lookup(result, path):
+    for key in path:
+        if not isinstance(result, dict) or key not in result:
+            return None
+        result = result[key]
+    return result
+
+
+def compare(baseline, current, threshold=DEFAULT_THRESHOLD):
+    """比较两份报告，返回每个模型、每个指标的变化；变差超过 threshold 的标记为退化"""
+    rows = []
+    for model_file, result in current['models'].items():
+        base = baseline['models'].get(model_file)
+        if base is None:
+            continue
+        metrics = list(_COMPARED_METRICS)
+        for batch_size in result.get('batch', {}):
+            metrics.append((('batch', batch_size, 'rows_per_second'), f'批量 {batch_size} 行 (行/秒)', True))
+        for path, name, higher_is_better in metrics:
+            old, new = _lookup(base, path), _lookup(result, path)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = -change if higher_is_better else change
+            rows.append({'model': model_file, 'metric': name, 'baseline': old, 'current': new,
+                         'change': round(change, 4), 'regression': worse > threshold})
+    return rows
+
+
+def _print_report(report):
+    for model_file, result in report['models'].items():
+        single = result['single_row']
+        batch = ', '.join(f"{size}: {value['rows_per_second']:,.0f}"
+                          for size, value in result['batch'].items())
+        cold = ', '.join(f"{label} {value['total_seconds'] * 1000:.0f} ms"
+                         for label, value in result.get('cold_start', {}).items())
+        print(f"{model_file} [{result['engine']}，{result['source']}]")
+        print(f"  单条预测 p50/p95/p99: {single['p50_us']:.1f} / {single['p95_us']:.1f} / "
+              f"{single['p99_us']:.1f} µs，"
+              f"编码 p50 {result['encode_one']['p50_us']:.1f} µs")
+        print(f"  批量吞吐量(行/秒): {batch}")
+        print(f"  冷启动: {cold}；内存峰值 {result['memory']['peak_rss_mb']} MB，"
+              f"模型占用 {result['memory']['model_rss_mb']} MB")
+    if report.get('missing_model_types'):
+        print(f"模型目录中没有以下类型的模型: {', '.join(report['missing_model_types'])}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="预测热路径基准测试（不依赖 Streamlit 和数据库）：冷启动、单条延迟、"
+                                                 "批量吞吐量和内存峰值，输出JSON报告")
+    parser.add_argument('command', choices=['run', 'compare'],
+                        help="run 运行基准测试，compare 比较两份报告")
+    parser.add_argument('reports', nargs='*', help="compare: 基准报告和当前报告")
+    parser.add_argument('--models-dir', default="models", help="模型文件目录")
+    parser.add_argument('--artifacts-dir', default=DEFAULT_ARTIFACTS_DIR, help="导出产物目录，为空时只从 pickle 加载")
+    parser.add_argument('--model', action='append', help="只测试指定的模型文件，可重复指定")
+    parser.add_argument('--samples', type=int, default=DEFAULT_SAMPLES, help="单条预测的样本数")
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=DEFAULT_BATCH_SIZES,
+                        help="批量吞吐量测试的批量大小")
+    parser.add_argument('--cold-repeat', type=int, default=3, help="冷启动测量的重复次数，取最快一次")
+    parser.add_argument('--seed', type=int, default=0, help="随机输入的种子")
+    parser.add_argument('--output', help="JSON报告的输出路径")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help="compare: 视为退化的相对变化")
+    parser.add_argument('--isolated', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.command == 'compare':
+        if len(args.reports) != 2:
+            parser.error("compare 需要两份报告: 基准报告和当前报告")
+        reports = []
+        for path in args.reports:
+            with open(path, encoding='utf-8') as f:
+                reports.append(json.load(f))
+        rows = compare(*reports, threshold=args.threshold)
+        for row in rows:
+            flag = '退化' if row['regression'] else ''
+            print(f"{row['model']} {row['metric']}: {row['baseline']} -> {row['current']} "
+                  f"({row['change']:+.1%}) {flag}")
+        regressions = sum(row['regression'] for row in rows)
+        print(f"共比较 {len(rows)} 项，退化 {regressions} 项（阈值 {args.threshold:.0%}）")
+        return 1 if regressions else 0
+
+    if args.isolated:
+        # 由 bench_isolated 在新进程中调用，最后一行输出JSON结果
+        result = bench_model(args.models_dir, args.model[0], args.artifacts_dir or None, args.samples,
+                             args.batch_sizes, args.seed)
+        print(json.dumps(result, ensure_ascii=False))
+        return 0
+
+    def progress(model_file):
+        print(f"正在测试 {model_file} ...", flush=True)
+
+    try:
+        report = run_suite(args.models_dir, args.model, args.artifacts_dir or None, args.samples,
+                           args.batch_sizes, args.cold_repeat, args.seed, progress)
+    except ValueError as e:
+        print(f"基准测试失败: {e}")
+        return 1
+    _print_report(report)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"报告已写入 {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
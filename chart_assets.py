@@ -0,0 +1,184 @@
+import io
+import os
+import threading
+import time
+from collections import OrderedDict
+
+CHART_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+# 变体 -> 最大宽度（像素）。Streamlit 会把宽于 1460 像素或不是 PNG/JPEG/GIF 的图片在每次重新运行时
+# 解码、缩小并重新编码，预先生成不超过该宽度的 PNG 后 st.image 原样发送
+VARIANT_WIDTHS = {'thumbnail': 960, 'full': 1460}
+# 调色板颜色数，统计图表的颜色很少，量化后体积明显变小且肉眼无差别
+PALETTE_COLORS = 256
+# 目录重新扫描的间隔（秒），期间不访问文件系统
+DEFAULT_RESCAN_INTERVAL = 30
+# 缓存的图片变体总字节上限
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+class ChartAsset:
+    """目录中的一张图表文件"""
+
+    def __init__(self, filename, path, mtime_ns, size_bytes):
+        self.filename = filename
+        self.path = path
+        self.mtime_ns = mtime_ns
+        self.size_bytes = size_bytes
+
+
+def encode_variant(path, max_width):
+    """生成不超过 max_width 的图片变体：透明背景铺白、缩小后量化为调色板 PNG"""
+    from PIL import Image
+
+    with Image.open(path) as image:
+        image.load()
+        if image.width > max_width:
+            image.thumbnail((max_width, image.height), Image.LANCZOS)
+        if image.mode in ('RGBA', 'LA', 'P'):
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, 'white')
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        elif image.mode != 'RGB':
+            image = image.convert('RGB')
+        buffer = io.BytesIO()
+        image.quantize(PALETTE_COLORS).save(buffer, format='PNG', optimize=True)
+    return buffer.getvalue()
+
+
+class ChartAssetCache:
+    """进程级图表缓存：目录只按间隔扫描一次，缩小并重新压缩后的变体按文件修改时间缓存在内存中"""
+
+    def __init__(self, chart_dir=".", rescan_interval=DEFAULT_RESCAN_INTERVAL, max_bytes=DEFAULT_MAX_BYTES):
+        self.chart_dir = chart_dir
+        self.rescan_interval = rescan_interval
+        self.max_bytes = max_bytes
+        self._index = {}
+        self._scanned_at = None
+        self._variants = OrderedDict()
+        self._lock = threading.Lock()
+        self._encode_locks = {}
+        self._prewarm_thread = None
+        self.scans = 0
+        self.hits = 0
+        self.misses = 0
+        self.encode_seconds = 0.0
+
+    def _scan(self):
+        index = {}
+        with os.scandir(self.chart_dir) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.name.lower().endswith(CHART_EXTENSIONS):
+                    stat = entry.stat()
+                    index[entry.name] = ChartAsset(entry.name, entry.path, stat.st_mtime_ns, stat.st_size)
+        return index
+
+    def index(self):
+        """目录中的图表文件名 -> ChartAsset，超过扫描间隔才重新扫描"""
+        with self._lock:
+            now = time.monotonic()
+            if self._scanned_at is None or now - self._scanned_at >= self.rescan_interval:
+                self._index = self._scan()
+                self._scanned_at = now
+                self.scans += 1
+            return self._index
+
+    def find(self, candidates):
+        """返回候选文件名中第一个存在的图表，都不存在时返回None"""
+        if isinstance(candidates, str):
+            candidates = [candidates]
+        index = self.index()
+        for filename in candidates:
+            asset = index.get(filename)
+            if asset is not None:
+                return asset
+        return None
+
+    def get(self, filename, variant='thumbnail'):
+        """获取图表的指定变体（PNG字节），文件不存在时返回None；文件被替换后按新的修改时间重新生成"""
+        if variant not in VARIANT_WIDTHS:
+            raise ValueError(f"未知的图片变体 {variant}，可选值为 {list(VARIANT_WIDTHS)}")
+        asset = self.index().get(filename)
+        if asset is None:
+            return None
+        key = (filename, asset.mtime_ns, variant)
+        with self._lock:
+            data = self._variants.get(key)
+            if data is not None:
+                self._variants.move_to_end(key)
+                self.hits += 1
+                return data
+            encode_lock = self._encode_locks.setdefault(key, threading.Lock())
+
+        with encode_lock:
+            # 等待期间其他会话可能已经生成
+            with self._lock:
+                data = self._variants.get(key)
+                if data is not None:
+                    self.hits += 1
+                    return data
+            start = time.perf_counter()
+            data = encode_variant(asset.path, VARIANT_WIDTHS[variant])
+            elapsed = time.perf_counter() - start
+
+            with self._lock:
+                self.misses += 1
+                self.encode_seconds += elapsed
+                # 丢弃同一文件旧版本的变体
+                for stale in [k for k in self._variants if k[0] == filename and k[1] != asset.mtime_ns]:
+                    del self._variants[stale]
+                self._variants[key] = data
+                self._encode_locks.pop(key, None)
+                while len(self._variants) > 1 and self.cached_bytes() > self.max_bytes:
+                    self._variants.popitem(last=False)
+        return data
+
+    def prewarm(self, variant='thumbnail'):
+        """为目录中的所有图表生成指定变体"""
+        for filename in list(self.index()):
+            try:
+                self.get(filename, variant)
+            except OSError:
+                continue
+
+    def prewarm_in_background(self, variant='thumbnail'):
+        """在后台线程中预先生成缩略图，每个进程只启动一次"""
+        with self._lock:
+            if self._prewarm_thread is not None:
+                return self._prewarm_thread
+            self._prewarm_thread = threading.Thread(target=self.prewarm, args=(variant,), name="chart-prewarm",
+                                                    daemon=True)
+        self._prewarm_thread.start()
+        return self._prewarm_thread
+
+    def cached_bytes(self):
+        return sum(len(data) for data in self._variants.values())
+
+    def stats(self):
+        with self._lock:
+            variants = len(self._variants)
+            cached_bytes = self.cached_bytes()
+            source_bytes = sum(self._index[k[0]].size_bytes for k in self._variants if k[0] in self._index)
+        return {
+            '图表文件数': len(self._index),
+            '缓存变体数': variants,
+            '缓存大小(KB)': round(cached_bytes / 1024, 1),
+            '原图大小(KB)': round(source_bytes / 1024, 1),
+            '目录扫描次数': self.scans,
+            '命中次数': self.hits,
+            '生成次数': self.misses,
+            '生成耗时(s)': round(self.encode_seconds, 3),
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_chart_cache(chart_dir=".", **kwargs):
+    """获取进程内共享的图表缓存"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ChartAssetCache(chart_dir, **kwargs)
+        return _cache
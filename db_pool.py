@@ -0,0 +1,197 @@
+import queue
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import mysql.connector
+from mysql.connector import Error
+from mysql.connector.errors import PoolError
+
+# 数据库连接配置
+DB_CONFIG = {
+    'host': 'localhost',
+    'user': 'streamlit_user',
+    'password': '123456',
+    'database': 'accident_risk_db',
+}
+
+DEFAULT_POOL_SIZE = 8
+# 连接最长存活时间，超过后回收重建，避免被服务端 wait_timeout 断开
+DEFAULT_MAX_LIFETIME = 3600
+# 空闲超过该时间的连接在借出前先ping一次
+DEFAULT_HEALTH_CHECK_INTERVAL = 30
+# 借出连接的最长等待时间
+DEFAULT_CHECKOUT_TIMEOUT = 10
+
+
+class _PooledConnection:
+    """连接池中的一个连接及其创建/使用时间"""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+
+class ConnectionPool:
+    """进程级MySQL连接池：按需建立连接并复用，借出前做健康检查，超过存活时间自动回收"""
+
+    def __init__(self, config, pool_size=DEFAULT_POOL_SIZE, max_lifetime=DEFAULT_MAX_LIFETIME,
+                 health_check_interval=DEFAULT_HEALTH_CHECK_INTERVAL,
+                 checkout_timeout=DEFAULT_CHECKOUT_TIMEOUT):
+        self.config = dict(config)
+        self.pool_size = pool_size
+        self.max_lifetime = max_lifetime
+        self.health_check_interval = health_check_interval
+        self.checkout_timeout = checkout_timeout
+
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(pool_size)
+        self._lock = threading.Lock()
+        self._in_use = {}
+
+        # 统计信息
+        self.created = 0
+        self.recycled = 0
+        self.failed_checks = 0
+        self.checkouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._recent_waits = deque(maxlen=1000)
+
+    def _connect(self):
+        """建立新的数据库连接"""
+        connection = mysql.connector.connect(
+            **self.config,
+            buffered=True,  # 避免未读结果错误
+            autocommit=True  # 连接被复用，避免读事务长期持有旧快照
+        )
+        with self._lock:
+            self.created += 1
+        return _PooledConnection(connection)
+
+    def _close(self, pooled):
+        try:
+            pooled.connection.close()
+        except Error:
+            pass
+
+    def _is_healthy(self, pooled):
+        """检查空闲连接是否可用：超过存活时间则回收，空闲较久则ping"""
+        now = time.monotonic()
+        if now - pooled.created_at > self.max_lifetime:
+            with self._lock:
+                self.recycled += 1
+            return False
+        if now - pooled.last_used > self.health_check_interval:
+            if not pooled.connection.is_connected():
+                with self._lock:
+                    self.failed_checks += 1
+                return False
+        return True
+
+    def acquire(self):
+        """借出一个连接，连接全部被占用时最多等待 checkout_timeout 秒"""
+        start = time.perf_counter()
+        if not self._slots.acquire(timeout=self.checkout_timeout):
+            raise PoolError(f"等待数据库连接超时（{self.checkout_timeout} 秒）")
+
+        try:
+            pooled = None
+            while pooled is None:
+                try:
+                    pooled = self._idle.get_nowait()
+                except queue.Empty:
+                    pooled = self._connect()
+                    break
+                if not self._is_healthy(pooled):
+                    self._close(pooled)
+                    pooled = None
+        except Exception:
+            self._slots.release()
+            raise
+
+        wait = time.perf_counter() - start
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            self._recent_waits.append(wait)
+            self._in_use[id(pooled.connection)] = pooled
+        return pooled.connection
+
+    def release(self, connection, broken=False):
+        """归还连接；出错的连接直接关闭，不再复用"""
+        with self._lock:
+            pooled = self._in_use.pop(id(connection), None)
+        if pooled is None:
+            return
+
+        try:
+            if not broken and connection.in_transaction:
+                connection.rollback()
+        except Error:
+            broken = True
+
+        if broken:
+            self._close(pooled)
+        else:
+            pooled.last_used = time.monotonic()
+            self._idle.put(pooled)
+        self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        """以上下文管理器的方式借用连接"""
+        connection = self.acquire()
+        broken = False
+        try:
+            yield connection
+        except Error:
+            broken = not connection.is_connected()
+            raise
+        finally:
+            self.release(connection, broken)
+
+    def close_idle(self):
+        """关闭所有空闲连接"""
+        while True:
+            try:
+                self._close(self._idle.get_nowait())
+            except queue.Empty:
+                return
+
+    def stats(self):
+        """连接池指标：活跃/空闲连接数与借出等待时间"""
+        with self._lock:
+            waits = sorted(self._recent_waits)
+            active = len(self._in_use)
+            checkouts = self.checkouts
+            total_wait = self.total_wait
+        p95 = waits[min(len(waits) - 1, int(len(waits) * 0.95))] if waits else 0.0
+        return {
+            'pool_size': self.pool_size,
+            'active': active,
+            'idle': self._idle.qsize(),
+            'created': self.created,
+            'recycled': self.recycled,
+            'failed_checks': self.failed_checks,
+            'checkouts': checkouts,
+            'avg_wait_ms': total_wait / checkouts * 1000 if checkouts else 0.0,
+            'p95_wait_ms': p95 * 1000,
+            'max_wait_ms': self.max_wait * 1000,
+        }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool(config=None, **kwargs):
+    """获取进程内共享的连接池，首次调用时创建（不会立即建立连接）"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(config or DB_CONFIG, **kwargs)
+        return _pool
@@ -0,0 +1,256 @@
+import argparse
+import os
+import pickle
+import re
+import resource
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from db_pool import get_pool
+from feature_pipeline import NUMERIC_COLUMNS, predict_columns
+from model_artifacts import DEFAULT_ARTIFACTS_DIR, available_models, infer_model_type
+from model_registry import ModelRegistry
+from parallel_scoring import default_workers
+from retrain import (CONFIG_FILE_COLUMNS, CONFIG_NAME_COLUMNS, DEFAULT_FETCH_ROWS, DEFAULT_VALIDATION_FRACTION,
+                     HOLDOUT_COLUMN, register_models, stream_training_data)
+from training_stats import TARGET_COLUMN, holdout_condition
+
+# 数据集类型 -> 是否属于留出集，与 retrain.py 的训练/验证划分一致
+DATASET_TYPES = {'train': False, 'validation': True}
+# model_performance 表中可能使用的样本数列名，表中存在时一并写入
+SAMPLE_COUNT_COLUMNS = ['sample_count', 'n_samples', 'samples', 'row_count']
+
+
+class RunningMetrics:
+    """分块累计的回归指标：只保存误差平方和、绝对误差和与目标值的均值/离差平方和，不保留预测值"""
+
+    def __init__(self):
+        self.rows = 0
+        self.squared_error = 0.0
+        self.absolute_error = 0.0
+        self.target_mean = 0.0
+        # 目标值的离差平方和，按分块合并（Chan 等人的并行方差公式），行数很多时也不会因相减而损失精度
+        self.target_m2 = 0.0
+
+    def update(self, target, predictions):
+        n = len(target)
+        if n == 0:
+            return
+        errors = predictions - target
+        self.squared_error += float(errors @ errors)
+        self.absolute_error += float(np.abs(errors).sum())
+
+        chunk_mean = float(target.mean())
+        centered = target - chunk_mean
+        chunk_m2 = float(centered @ centered)
+        total = self.rows + n
+        delta = chunk_mean - self.target_mean
+        self.target_mean += delta * n / total
+        self.target_m2 += chunk_m2 + delta * delta * self.rows * n / total
+        self.rows = total
+
+    def result(self):
+        if self.rows == 0:
+            return {'rows': 0, 'mse': None, 'mae': None, 'r2': None}
+        return {
+            'rows': self.rows,
+            'mse': self.squared_error / self.rows,
+            'mae': self.absolute_error / self.rows,
+            'r2': 1.0 - self.squared_error / self.target_m2 if self.target_m2 > 0 else 0.0,
+        }
+
+
+def evaluate_models(pool, model_files, models_dir="models", artifacts_dir=DEFAULT_ARTIFACTS_DIR,
+                    datasets=tuple(DATASET_TYPES), fetch_rows=DEFAULT_FETCH_ROWS, limit=None,
+                    validation_fraction=DEFAULT_VALIDATION_FRACTION, workers=None, progress=None):
+    """一次流式读取 training_data，每块同时交给所有模型打分并累计指标；返回 {模型文件: {数据集: 指标}} 和读取的行数"""
+    for dataset in datasets:
+        if dataset not in DATASET_TYPES:
+            raise ValueError(f"未知的数据集类型 {dataset}，可选值为 {list(DATASET_TYPES)}")
+    # 评估期间持有所有模型条目的引用，注册表的缓存上限不影响评估
+    registry = ModelRegistry(models_dir, max_models=len(model_files), artifacts_dir=artifacts_dir)
+    entries, errors = {}, {}
+    for model_file in model_files:
+        try:
+            entries[model_file] = registry.get(model_file)
+        except (OSError, ValueError, EOFError, pickle.UnpicklingError) as e:
+            errors[model_file] = str(e)
+
+    metrics = {model_file: {dataset: RunningMetrics() for dataset in datasets} for model_file in entries}
+    # 只评估一种数据集时在数据库端过滤，不读取另一部分的行
+    where = None
+    if len(datasets) == 1:
+        condition = holdout_condition(validation_fraction)
+        where = condition if DATASET_TYPES[datasets[0]] else f"NOT ({condition})"
+
+    rows = 0
+    chunks = stream_training_data(pool, fetch_rows, limit, validation_fraction, where)
+    workers = min(workers or default_workers(), max(len(entries), 1))
+    with ThreadPoolExecutor(max_workers=1) as reader, ThreadPoolExecutor(max_workers=workers) as scorers:
+        # 后台线程预先读取下一块，数据库读取与模型打分重叠进行
+        pending = reader.submit(next, chunks, None)
+        while True:
+            columns = pending.result()
+            if columns is None:
+                break
+            pending = reader.submit(next, chunks, None)
+
+            target = columns.pop(TARGET_COLUMN).astype(np.float64)
+            holdout = columns.pop(HOLDOUT_COLUMN) != 0
+            for col in NUMERIC_COLUMNS:
+                columns[col] = columns[col].astype(np.float64)
+            masks = {dataset: holdout if DATASET_TYPES[dataset] else ~holdout for dataset in datasets}
+
+            # 原生库和 NumPy 打分时释放 GIL，多个模型在线程池中并发打分
+            futures = {model_file: scorers.submit(predict_columns, entry, columns)
+                       for model_file, entry in entries.items()}
+            for model_file, future in futures.items():
+                predictions = future.result()
+                for dataset, mask in masks.items():
+                    metrics[model_file][dataset].update(target[mask], predictions[mask])
+            rows += len(target)
+            if progress is not None:
+                progress(rows)
+
+    results = {model_file: {dataset: running.result() for dataset, running in by_dataset.items()}
+               for model_file, by_dataset in metrics.items()}
+    return results, errors, rows
+
+
+def _first_existing(columns, candidates):
+    for column in candidates:
+        if column in columns:
+            return column
+    return None
+
+
+def find_config_ids(pool, model_files, register_missing=False):
+    """按模型文件名查找 model_configs 中的配置ID；register_missing 时为找不到的模型补登记（不生效）"""
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM model_configs")
+        rows = cursor.fetchall()
+        table_columns = [col[0] for col in cursor.description]
+        cursor.close()
+
+    file_column = _first_existing(table_columns, CONFIG_FILE_COLUMNS)
+    name_column = _first_existing(table_columns, CONFIG_NAME_COLUMNS)
+    keys = {}
+    for row in sorted(rows, key=lambda row: row[table_columns.index('id')]):
+        row = dict(zip(table_columns, row))
+        # 同一模型登记过多次时使用最新的配置
+        if file_column and row.get(file_column):
+            keys[os.path.basename(str(row[file_column]))] = row['id']
+        if name_column and row.get(name_column):
+            keys[str(row[name_column])] = row['id']
+
+    config_ids = {}
+    missing = []
+    for model_file in model_files:
+        config_id = keys.get(model_file, keys.get(os.path.splitext(model_file)[0]))
+        if config_id is None:
+            missing.append(model_file)
+        else:
+            config_ids[model_file] = config_id
+
+    if register_missing and missing:
+        for model_file in missing:
+            match = re.search(r'v\d{8}_\d{6}', model_file)
+            version = match.group(0) if match else None
+            config_ids.update(register_models(
+                pool, [{'model_type': infer_model_type(model_file), 'model_file': model_file}], version))
+    return config_ids
+
+
+def save_results(pool, results, config_ids):
+    """把指标写入 model_performance：每个模型配置和数据集只保留一行（同一事务内先删除再插入），返回写入的行数"""
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM model_performance LIMIT 0")
+        cursor.fetchall()
+        count_column = _first_existing([col[0] for col in cursor.description], SAMPLE_COUNT_COLUMNS)
+        columns = ['model_config_id', 'dataset_type', 'mse', 'r2_score', 'mae']
+        if count_column:
+            columns.append(count_column)
+        insert_sql = (f"INSERT INTO model_performance ({', '.join(columns)}) "
+                      f"VALUES ({', '.join(['%s'] * len(columns))})")
+
+        conn.start_transaction()
+        written = 0
+        for model_file, by_dataset in results.items():
+            config_id = config_ids.get(model_file)
+            if config_id is None:
+                continue
+            for dataset, result in by_dataset.items():
+                if result['rows'] == 0:
+                    continue
+                cursor.execute("DELETE FROM model_performance WHERE model_config_id = %s AND dataset_type = %s",
+                               (config_id, dataset))
+                row = [config_id, dataset, result['mse'], result['r2'], result['mae']]
+                if count_column:
+                    row.append(result['rows'])
+                cursor.execute(insert_sql, row)
+                written += 1
+        conn.commit()
+        cursor.close()
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="用当前的 training_data 分块评估 models/ 中的模型，"
+                                                 "结果按数据集类型写入 model_performance")
+    parser.add_argument('--model', action='append', help="只评估指定的模型文件，可重复指定，默认评估全部模型")
+    parser.add_argument('--models-dir', default="models", help="模型文件目录")
+    parser.add_argument('--artifacts-dir', default=DEFAULT_ARTIFACTS_DIR, help="导出产物目录")
+    parser.add_argument('--dataset', action='append', choices=list(DATASET_TYPES),
+                        help="要评估的数据集类型，可重复指定，默认全部")
+    parser.add_argument('--validation-fraction', type=float, default=DEFAULT_VALIDATION_FRACTION,
+                        help="留出集比例，应与训练时一致")
+    parser.add_argument('--fetch-rows', type=int, default=DEFAULT_FETCH_ROWS, help="每次从游标读取的行数")
+    parser.add_argument('--limit', type=int, help="只读取前若干行，用于快速试跑")
+    parser.add_argument('--workers', type=int, help="并发打分的线程数，默认为CPU核数")
+    parser.add_argument('--no-save', action='store_true', help="只输出结果，不写入 model_performance")
+    parser.add_argument('--register-missing', action='store_true',
+                        help="model_configs 中找不到的模型先补登记再写入结果")
+    args = parser.parse_args(argv)
+
+    pool = get_pool()
+    model_files = args.model or available_models(args.models_dir)
+    if not model_files:
+        print(f"{args.models_dir} 中没有模型文件")
+        return 1
+
+    def progress(rows):
+        print(f"\r已评估 {rows:,} 行", end='', flush=True)
+
+    start = time.perf_counter()
+    results, errors, rows = evaluate_models(pool, model_files, args.models_dir, args.artifacts_dir,
+                                            tuple(args.dataset or DATASET_TYPES), args.fetch_rows, args.limit,
+                                            args.validation_fraction, args.workers, progress)
+    elapsed = time.perf_counter() - start
+    print()
+    print(f"{len(results)} 个模型，{rows:,} 行，耗时 {elapsed:.1f} s（{rows / elapsed if elapsed else 0:,.0f} 行/秒），"
+          f"峰值内存 {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
+    for model_file, by_dataset in results.items():
+        for dataset, result in by_dataset.items():
+            if result['rows']:
+                print(f"  {model_file} [{dataset}]: {result['rows']:,} 行，MSE {result['mse']:.6f}，"
+                      f"MAE {result['mae']:.4f}，R2 {result['r2']:.4f}")
+    for model_file, error in errors.items():
+        print(f"  {model_file}: 加载失败: {error}")
+
+    if not args.no_save:
+        config_ids = find_config_ids(pool, list(results), args.register_missing)
+        written = save_results(pool, results, config_ids)
+        print(f"写入 model_performance {written} 行")
+        for model_file in results:
+            if model_file not in config_ids:
+                print(f"  {model_file}: model_configs 中没有对应的配置，未写入（可使用 --register-missing）")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
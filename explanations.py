@@ -0,0 +1,212 @@
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+from feature_pipeline import normalize_input, raw_columns_from_frame
+from model_artifacts import model_kind
+from training_charts import FIELD_LABELS
+from tree_compiler import compile_trees
+
+# 批量解释每块的行数，特征贡献矩阵按块计算并归并，内存占用与总行数无关
+EXPLAIN_CHUNK_ROWS = 65536
+# 批量结果中贡献列的前缀与基准值列
+CONTRIBUTION_PREFIX = 'contrib_'
+BASE_COLUMN = 'contrib_base'
+# 树模型的解释方法: shap 为原生库的精确 TreeSHAP，每行耗时约为预测的十倍到数百倍（批量时更明显）；
+# path 为路径归因（Saabas），耗时为预测的数倍，适合批量任务。XGBoost 使用原生 approx_contribs，
+# LightGBM 没有对应的原生输出，在编译后的树上计算
+EXPLAIN_METHODS = ('shap', 'path')
+DEFAULT_EXPLAIN_METHOD = 'shap'
+# (模型格式, 解释方法) -> 展示名称
+METHOD_LABELS = {
+    ('lightgbm', 'shap'): 'TreeSHAP（LightGBM 原生 pred_contrib）',
+    ('xgboost', 'shap'): 'TreeSHAP（XGBoost 原生 pred_contribs）',
+    ('lightgbm', 'path'): '路径归因（编译后的树）',
+    ('xgboost', 'path'): '路径归因（XGBoost 原生 approx_contribs）',
+    ('linear', 'shap'): '系数 × 特征值（缩放后）',
+    ('linear', 'path'): '系数 × 特征值（缩放后）',
+}
+
+
+_compiled = {}
+_compiled_lock = threading.Lock()
+
+
+def _compiled_trees(entry):
+    """LightGBM 路径归因使用的编译后的树；推理引擎为 native 时注册表未编译，按模型版本在此编译一次"""
+    if entry.trees is not None:
+        return entry.trees
+    key = (entry.filename, entry.version)
+    with _compiled_lock:
+        trees = _compiled.get(key)
+        if trees is None:
+            # 同一模型文件只保留最新版本的编译结果
+            for stale in [k for k in _compiled if k[0] == entry.filename]:
+                del _compiled[stale]
+            trees = _compiled[key] = compile_trees(entry.model)
+        return trees
+
+
+def feature_contributions(entry, features, method=DEFAULT_EXPLAIN_METHOD):
+    """对编码好的特征矩阵计算逐行特征贡献，返回 (贡献 (行数, 特征数), 基准值 (行数,))；
+    每行贡献之和加基准值等于模型未截断的预测值"""
+    if method not in EXPLAIN_METHODS:
+        raise ValueError(f"未知的解释方法 {method}，可选值为 {list(EXPLAIN_METHODS)}")
+    model = entry.model
+    kind = model_kind(model)
+    if kind == 'lightgbm' and method == 'path':
+        return _compiled_trees(entry).contributions(features)
+    if kind == 'lightgbm':
+        # 与模型自身的 predict 使用相同的迭代数
+        output = model.booster_.predict(features, num_iteration=getattr(model, 'best_iteration_', None),
+                                        pred_contrib=True)
+    elif kind == 'xgboost':
+        import xgboost
+
+        booster = model.get_booster()
+        # sklearn 包装器未使用早停时访问 best_iteration 会抛出 AttributeError
+        try:
+            best_iteration = model.best_iteration
+        except AttributeError:
+            best_iteration = None
+        iteration_range = (0, best_iteration + 1) if best_iteration is not None else (0, 0)
+        matrix = xgboost.DMatrix(features, feature_names=booster.feature_names,
+                                 feature_types=booster.feature_types, enable_categorical=True)
+        output = booster.predict(matrix, pred_contribs=True, approx_contribs=method == 'path',
+                                 iteration_range=iteration_range)
+    elif kind == 'linear':
+        # 缩放已折叠进编码器，特征矩阵即标准化后的特征值
+        contributions = np.asarray(features, dtype=np.float64) * np.asarray(model.coef_, dtype=np.float64)
+        return contributions, np.full(len(features), float(model.intercept_))
+    else:
+        raise ValueError(f"模型类型 {entry.model_type} 暂不支持逐条解释")
+    output = np.asarray(output, dtype=np.float64)
+    return output[:, :-1], output[:, -1]
+
+
+def contribution_groups(encoder):
+    """按特征读取的原始字段分组：只读取一个字段的特征归入该字段，交互特征（如曲率×限速）单独成组；
+    返回 [(字段元组, 特征下标列表)]"""
+    groups = {}
+    for j, fields in enumerate(encoder.feature_fields):
+        groups.setdefault(fields, []).append(j)
+    return list(groups.items())
+
+
+def group_label(fields):
+    return '×'.join(FIELD_LABELS.get(field, field) for field in fields)
+
+
+def group_column(fields):
+    return CONTRIBUTION_PREFIX + '*'.join(fields)
+
+
+def _group_matrix(groups, n_features):
+    """特征 -> 分组的 0/1 归并矩阵，特征贡献乘以它即得到各分组的贡献"""
+    matrix = np.zeros((n_features, len(groups)))
+    for k, (_, indices) in enumerate(groups):
+        matrix[indices, k] = 1.0
+    return matrix
+
+
+class Explanation:
+    """单条预测的特征贡献：基准值加全部贡献即模型未截断的输出"""
+
+    def __init__(self, method, feature_names, feature_values, contributions, groups, group_contributions,
+                 base_value, elapsed_seconds):
+        self.method = method
+        self.feature_names = feature_names
+        self.feature_values = feature_values
+        self.contributions = contributions
+        self.groups = groups
+        self.group_contributions = group_contributions
+        self.base_value = base_value
+        self.elapsed_seconds = elapsed_seconds
+
+    @property
+    def raw_prediction(self):
+        return self.base_value + float(self.contributions.sum())
+
+    @property
+    def prediction(self):
+        return min(max(self.raw_prediction, 0.0), 1.0)
+
+    def ranked_groups(self):
+        """按贡献绝对值从大到小排列的 (字段元组, 贡献)"""
+        order = np.argsort(-np.abs(self.group_contributions), kind='stable')
+        return [(self.groups[k], float(self.group_contributions[k])) for k in order]
+
+    def group_table(self):
+        return [{'影响因素': group_label(fields), '贡献': round(value, 6)} for fields, value in self.ranked_groups()]
+
+    def feature_table(self):
+        order = np.argsort(-np.abs(self.contributions), kind='stable')
+        return [{
+            '特征': self.feature_names[j],
+            '特征值': float(self.feature_values[j]),
+            '贡献': round(float(self.contributions[j]), 6),
+        } for j in order]
+
+
+def explain_one(entry, input_features, cache=None, method=DEFAULT_EXPLAIN_METHOD):
+    """单条表单输入的特征贡献；cache 为预测结果缓存时与预测值一起缓存，同一模型版本和输入只计算一次"""
+    cache_kind = f'explanation:{method}'
+    if cache is not None:
+        explanation = cache.get(entry, input_features, kind=cache_kind)
+        if explanation is not None:
+            return explanation
+
+    start = time.perf_counter()
+    encoder = entry.encoder
+    features = encoder.encode_one(normalize_input(input_features))
+    contributions, base = feature_contributions(entry, features, method)
+    groups = contribution_groups(encoder)
+    explanation = Explanation(
+        METHOD_LABELS[model_kind(entry.model), method], list(encoder.columns), features[0].astype(np.float64),
+        contributions[0], [fields for fields, _ in groups],
+        contributions[0] @ _group_matrix(groups, encoder.n_features), float(base[0]),
+        time.perf_counter() - start)
+    if cache is not None:
+        cache.put(entry, input_features, explanation, kind=cache_kind)
+    return explanation
+
+
+def explain_frame(entry, raw_df, method=DEFAULT_EXPLAIN_METHOD, chunk_rows=EXPLAIN_CHUNK_ROWS):
+    """对规范化后的原始输入表批量计算各分组的贡献，返回 contrib_* 列与 contrib_base 列组成的表"""
+    encoder = entry.encoder
+    groups = contribution_groups(encoder)
+    group_matrix = _group_matrix(groups, encoder.n_features)
+    columns = raw_columns_from_frame(raw_df)
+    n_rows = len(raw_df)
+
+    grouped = np.empty((n_rows, len(groups)))
+    base = np.empty(n_rows)
+    for begin in range(0, n_rows, chunk_rows):
+        end = min(begin + chunk_rows, n_rows)
+        features = encoder.encode_columns({col: values[begin:end] for col, values in columns.items()})
+        contributions, base[begin:end] = feature_contributions(entry, features, method)
+        grouped[begin:end] = contributions @ group_matrix
+
+    result = pd.DataFrame(grouped, columns=[group_column(fields) for fields, _ in groups])
+    result[BASE_COLUMN] = base
+    return result
+
+
+def explanation_figure(explanation):
+    """瀑布图：从基准值出发，各影响因素按贡献大小依次累加得到模型输出"""
+    ranked = explanation.ranked_groups()
+    labels = ["基准值"] + [group_label(fields) for fields, _ in ranked] + ["模型输出"]
+    values = [explanation.base_value] + [value for _, value in ranked] + [explanation.raw_prediction]
+    fig = go.Figure(go.Waterfall(
+        x=labels, y=values, measure=['absolute'] + ['relative'] * len(ranked) + ['total'],
+        text=[f"{explanation.base_value:.4f}"] + [f"{value:+.4f}" for _, value in ranked]
+             + [f"{explanation.raw_prediction:.4f}"],
+        increasing={'marker': {'color': '#d62728'}}, decreasing={'marker': {'color': '#2ca02c'}},
+        totals={'marker': {'color': '#1f77b4'}},
+        hovertemplate="%{x}<br>%{text}<extra></extra>"))
+    fig.update_yaxes(title_text="风险值")
+    fig.update_layout(showlegend=False)
+    return fig
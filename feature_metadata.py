@@ -0,0 +1,179 @@
+import json
+import threading
+import time
+from types import MappingProxyType
+
+import pandas as pd
+from mysql.connector import Error
+
+from feature_pipeline import CATEGORICAL_OPTIONS
+
+# 两次检查版本标记之间的最短间隔（秒），期间直接使用缓存，不访问数据库
+DEFAULT_CHECK_INTERVAL = 60
+
+# 版本标记查询，按顺序尝试：优先使用 updated_at 列，没有该列时使用表的更新时间
+MARKER_QUERIES = [
+    "SELECT COUNT(*), MAX(updated_at) FROM feature_metadata",
+    """SELECT TABLE_ROWS, UPDATE_TIME FROM information_schema.TABLES
+       WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'feature_metadata'""",
+]
+
+# 元数据表中可能使用的列名
+NAME_COLUMNS = ['feature_name', 'name', 'feature']
+OPTION_COLUMNS = ['possible_values', 'allowed_values', 'categories', 'options', 'feature_values']
+MIN_COLUMNS = ['min_value', 'min_val', 'minimum']
+MAX_COLUMNS = ['max_value', 'max_val', 'maximum']
+DESCRIPTION_COLUMNS = ['description', 'feature_description', 'comment']
+
+
+def _first(row, columns):
+    for column in columns:
+        if row.get(column) is not None:
+            return row[column]
+    return None
+
+
+def _parse_options(raw):
+    """解析取值列表，支持JSON数组和逗号分隔字符串"""
+    if raw is None:
+        return None
+    if isinstance(raw, (bytes, bytearray)):
+        raw = raw.decode('utf-8')
+    if isinstance(raw, str):
+        try:
+            parsed = json.loads(raw)
+        except ValueError:
+            parsed = [item.strip() for item in raw.split(',') if item.strip()]
+    else:
+        parsed = raw
+    return tuple(str(item) for item in parsed) if isinstance(parsed, (list, tuple)) else None
+
+
+def _parse_number(raw):
+    try:
+        return float(raw) if raw is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class FeatureMetadata:
+    """特征元数据的不可变快照，为预测表单提供可选值、取值范围和说明"""
+
+    def __init__(self, rows, columns, version):
+        self.version = version
+        self._rows = tuple(tuple(row) for row in rows)
+        self._columns = tuple(columns)
+
+        features = {}
+        for row in rows:
+            row = dict(zip(columns, row))
+            name = _first(row, NAME_COLUMNS)
+            if name is None:
+                continue
+            features[str(name)] = MappingProxyType({
+                'options': _parse_options(_first(row, OPTION_COLUMNS)),
+                'min': _parse_number(_first(row, MIN_COLUMNS)),
+                'max': _parse_number(_first(row, MAX_COLUMNS)),
+                'description': _first(row, DESCRIPTION_COLUMNS),
+            })
+        self._features = MappingProxyType(features)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def options(self, field, default):
+        """分类字段的可选值；只保留模型能够编码的取值，元数据未提供时使用默认值"""
+        info = self._features.get(field)
+        options = info['options'] if info else None
+        if options:
+            known = CATEGORICAL_OPTIONS.get(field, default)
+            options = [option for option in options if option in known]
+        return list(options) if options else list(default)
+
+    def value_range(self, field, default_min, default_max):
+        """数值字段的取值范围，元数据未提供或不合法时使用默认范围"""
+        info = self._features.get(field)
+        low = info['min'] if info and info['min'] is not None else default_min
+        high = info['max'] if info and info['max'] is not None else default_max
+        if low >= high:
+            return default_min, default_max
+        return type(default_min)(low), type(default_max)(high)
+
+    def description(self, field, default):
+        """字段说明，用作表单控件的帮助文字"""
+        info = self._features.get(field)
+        return str(info['description']) if info and info['description'] else default
+
+    def to_frame(self):
+        """以DataFrame形式返回原始元数据"""
+        return pd.DataFrame(list(self._rows), columns=list(self._columns))
+
+
+# 数据库中没有元数据时使用的空快照
+EMPTY_METADATA = FeatureMetadata([], [], None)
+
+
+class FeatureMetadataCache:
+    """进程级特征元数据缓存：只有版本标记变化时才重新读取整张表"""
+
+    def __init__(self, pool, check_interval=DEFAULT_CHECK_INTERVAL):
+        self.pool = pool
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._metadata = None
+        self._checked_at = 0.0
+        self._marker_query = None
+        self.reloads = 0
+
+    def _read_marker(self, cursor):
+        """读取版本标记，记住第一个可用的查询"""
+        queries = [self._marker_query] if self._marker_query else MARKER_QUERIES
+        last_error = None
+        for query in queries:
+            try:
+                cursor.execute(query)
+                marker = cursor.fetchone()
+                self._marker_query = query
+                return tuple(str(value) for value in marker)
+            except Error as e:
+                last_error = e
+        raise last_error
+
+    def get(self):
+        """获取元数据快照；check_interval 内不访问数据库"""
+        with self._lock:
+            now = time.monotonic()
+            if self._metadata is not None and now - self._checked_at < self.check_interval:
+                return self._metadata
+
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                marker = self._read_marker(cursor)
+                if self._metadata is None or marker != self._metadata.version:
+                    cursor.execute("SELECT * FROM feature_metadata")
+                    rows = cursor.fetchall()
+                    columns = [col[0] for col in cursor.description]
+                    self._metadata = FeatureMetadata(rows, columns, marker)
+                    self.reloads += 1
+                cursor.close()
+
+            self._checked_at = now
+            return self._metadata
+
+    def invalidate(self):
+        """使缓存失效，下次获取时重新检查版本标记"""
+        with self._lock:
+            self._checked_at = 0.0
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_metadata_cache(pool, **kwargs):
+    """获取进程内共享的特征元数据缓存"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = FeatureMetadataCache(pool, **kwargs)
+        return _cache
@@ -0,0 +1,554 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+
+# 表单输入的12个原始字段
+RAW_FEATURE_COLUMNS = [
+    'road_type', 'num_lanes', 'curvature', 'speed_limit', 'lighting', 'weather',
+    'road_signs_present', 'public_road', 'time_of_day', 'holiday', 'school_season',
+    'num_reported_accidents',
+]
+
+# 分类型字段的可选值
+CATEGORICAL_OPTIONS = {
+    'road_type': ['urban', 'rural', 'highway'],
+    'lighting': ['daylight', 'dim', 'night'],
+    'weather': ['clear', 'rainy', 'foggy'],
+    'time_of_day': ['morning', 'afternoon', 'evening'],
+}
+
+BOOLEAN_COLUMNS = ['road_signs_present', 'public_road', 'holiday', 'school_season']
+
+NUMERIC_COLUMNS = ['num_lanes', 'curvature', 'speed_limit', 'num_reported_accidents']
+
+# LightGBM训练时作为分类特征的字段
+LIGHTGBM_CATEGORICAL_FEATURES = ['weather', 'lighting', 'time_of_day', 'road_type']
+
+_TRUE_VALUES = {'true', '1', 'yes', 'y', '是'}
+_FALSE_VALUES = {'false', '0', 'no', 'n', '否'}
+
+
+def _to_bool(series):
+    """将布尔列统一转换为bool，支持True/False、1/0、是/否等写法"""
+    if series.dtype == bool:
+        return series
+    if pd.api.types.is_numeric_dtype(series):
+        if series.isna().any():
+            raise ValueError(f"字段 {series.name} 存在空值")
+        return series != 0
+    text = series.astype(str).str.strip().str.lower()
+    invalid = ~text.isin(_TRUE_VALUES | _FALSE_VALUES)
+    if invalid.any():
+        raise ValueError(f"字段 {series.name} 存在无法识别的布尔值: {sorted(text[invalid].unique())[:5]}")
+    return text.isin(_TRUE_VALUES)
+
+
+def normalize_raw_frame(raw_df):
+    """校验并规范化原始输入表，返回只包含12个原始字段的DataFrame"""
+    missing = [col for col in RAW_FEATURE_COLUMNS if col not in raw_df.columns]
+    if missing:
+        raise ValueError(f"输入数据缺少字段: {', '.join(missing)}")
+
+    df = pd.DataFrame(index=raw_df.index)
+    for col in RAW_FEATURE_COLUMNS:
+        values = raw_df[col]
+        if col in CATEGORICAL_OPTIONS:
+            values = values.astype(str).str.strip().str.lower()
+            invalid = ~values.isin(CATEGORICAL_OPTIONS[col])
+            if invalid.any():
+                raise ValueError(f"字段 {col} 存在无效取值: {sorted(values[invalid].unique())[:5]}，"
+                                 f"可选值为 {CATEGORICAL_OPTIONS[col]}")
+        elif col in BOOLEAN_COLUMNS:
+            values = _to_bool(values)
+        else:
+            values = pd.to_numeric(values, errors='coerce')
+            if values.isna().any():
+                raise ValueError(f"字段 {col} 存在空值或非数值数据")
+        df[col] = values
+    return df.reset_index(drop=True)
+
+
+def normalize_input(input_features):
+    """校验并规范化单条输入（规则与 normalize_raw_frame 相同），返回只包含12个原始字段的字典"""
+    missing = [col for col in RAW_FEATURE_COLUMNS if col not in input_features]
+    if missing:
+        raise ValueError(f"输入数据缺少字段: {', '.join(missing)}")
+
+    normalized = {}
+    for col in RAW_FEATURE_COLUMNS:
+        value = input_features[col]
+        if col in CATEGORICAL_OPTIONS:
+            value = str(value).strip().lower()
+            if value not in CATEGORICAL_OPTIONS[col]:
+                raise ValueError(f"字段 {col} 的取值 {value} 无效，可选值为 {CATEGORICAL_OPTIONS[col]}")
+        elif col in BOOLEAN_COLUMNS:
+            if isinstance(value, (bool, np.bool_)):
+                value = bool(value)
+            elif isinstance(value, (int, float, np.number)) and not np.isnan(value):
+                value = bool(value != 0)
+            elif str(value).strip().lower() in _TRUE_VALUES | _FALSE_VALUES:
+                value = str(value).strip().lower() in _TRUE_VALUES
+            else:
+                raise ValueError(f"字段 {col} 的布尔值 {value} 无法识别")
+        else:
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                value = float('nan')
+            if np.isnan(value):
+                raise ValueError(f"字段 {col} 存在空值或非数值数据")
+        normalized[col] = value
+    return normalized
+
+
+# 数值字段在预测表单中的取值范围 (最小值, 最大值, 是否为整数)
+NUMERIC_RANGES = {
+    'num_lanes': (1, 8, True),
+    'curvature': (0.0, 1.0, False),
+    'speed_limit': (20, 120, True),
+    'num_reported_accidents': (0, 10, True),
+}
+
+
+def sample_raw_frame(samples, seed=0):
+    """在表单取值范围内随机生成规范化的原始输入表，用于一致性检查和性能测试"""
+    rng = np.random.default_rng(seed)
+    data = {}
+    for col in RAW_FEATURE_COLUMNS:
+        if col in CATEGORICAL_OPTIONS:
+            options = np.asarray(CATEGORICAL_OPTIONS[col], dtype=object)
+            data[col] = options[rng.integers(0, len(options), samples)]
+        elif col in BOOLEAN_COLUMNS:
+            data[col] = rng.random(samples) < 0.5
+        else:
+            low, high, integer = NUMERIC_RANGES[col]
+            data[col] = (rng.integers(low, high + 1, samples).astype(np.float64) if integer
+                         else rng.uniform(low, high, samples))
+    return pd.DataFrame(data, columns=RAW_FEATURE_COLUMNS)
+
+
+# 特征定义：每个特征由一个操作描述，编译后按列向量化计算
+def value(field, divisor=1.0):
+    """数值字段，可选除以固定值"""
+    return ('value', field, divisor)
+
+
+def log1p(field):
+    """数值字段取 log(1 + x)"""
+    return ('log1p', field)
+
+
+def flag(field):
+    """布尔字段转换为0/1"""
+    return ('flag', field)
+
+
+def one_hot(field, category):
+    """分类字段等于指定取值时为1，否则为0"""
+    return ('one_hot', field, category)
+
+
+def code(field, mapping):
+    """分类字段按映射表做整数编码"""
+    return ('code', field, mapping)
+
+
+def product(field, other, divisor=1.0):
+    """两个数值字段的乘积，可选除以固定值"""
+    return ('product', field, other, divisor)
+
+
+def product_if(field, category_field, category):
+    """数值字段乘以分类字段是否等于指定取值"""
+    return ('product_if', field, category_field, category)
+
+
+LIGHTING_CODES = {'daylight': 0, 'dim': 1, 'night': 2}
+WEATHER_CODES = {'clear': 0, 'rainy': 1, 'foggy': 2}
+TIME_OF_DAY_CODES = {'morning': 0, 'afternoon': 1, 'evening': 2}
+ROAD_TYPE_CODES = {'urban': 0, 'rural': 1, 'highway': 2}
+
+# 各模型类型的特征列表，顺序即送入模型的列顺序
+FEATURE_SPECS = {
+    'linear_regression': [
+        ('num_reported_accidents_log_scaled', log1p('num_reported_accidents')),
+        ('num_lanes_enc_scaled', value('num_lanes', 8.0)),
+        ('speed_limit_enc_scaled', value('speed_limit', 120.0)),
+        ('holiday', flag('holiday')),
+        ('public_road', flag('public_road')),
+        ('road_signs_present', flag('road_signs_present')),
+        ('school_season', flag('school_season')),
+        ('road_type_highway', one_hot('road_type', 'highway')),
+        ('road_type_rural', one_hot('road_type', 'rural')),
+        ('road_type_urban', one_hot('road_type', 'urban')),
+        ('weather_clear', one_hot('weather', 'clear')),
+        ('weather_foggy', one_hot('weather', 'foggy')),
+        ('weather_rainy', one_hot('weather', 'rainy')),
+        ('time_of_day_afternoon', one_hot('time_of_day', 'afternoon')),
+        ('time_of_day_evening', one_hot('time_of_day', 'evening')),
+        ('time_of_day_morning', one_hot('time_of_day', 'morning')),
+        ('curvature_speed_scaled', product('curvature', 'speed_limit', 120.0)),
+        ('curvature_night_scaled', product_if('curvature', 'lighting', 'night')),
+    ],
+    # Lasso和Ridge回归只使用训练时使用的特征
+    'lasso': [
+        ('num_reported_accidents_log_scaled', log1p('num_reported_accidents')),
+        ('num_lanes_enc_scaled', value('num_lanes', 8.0)),
+        ('speed_limit_enc_scaled', value('speed_limit', 120.0)),
+        ('public_road', flag('public_road')),
+        ('road_signs_present', flag('road_signs_present')),
+        ('weather_clear', one_hot('weather', 'clear')),
+        ('weather_rainy', one_hot('weather', 'rainy')),
+        ('time_of_day_evening', one_hot('time_of_day', 'evening')),
+        ('curvature_speed_scaled', product('curvature', 'speed_limit', 120.0)),
+        ('curvature_night_scaled', product_if('curvature', 'lighting', 'night')),
+    ],
+    'random_forest': [
+        ('curvature_speed', product('curvature', 'speed_limit')),
+        ('curvature_night', product_if('curvature', 'lighting', 'night')),
+        ('speed_limit_enc', value('speed_limit', 120.0)),
+        ('curvature', value('curvature')),
+        ('weather_clear', one_hot('weather', 'clear')),
+        ('lighting_night', one_hot('lighting', 'night')),
+        ('num_reported_accidents', value('num_reported_accidents')),
+    ],
+    # XGBoost训练时只使用了7个特征，顺序与训练时一致
+    'xgboost': [
+        ('curvature_speed', product('curvature', 'speed_limit')),
+        ('curvature_night', product_if('curvature', 'lighting', 'night')),
+        ('lighting', code('lighting', LIGHTING_CODES)),
+        ('speed_limit_enc', value('speed_limit', 120.0)),
+        ('weather', code('weather', WEATHER_CODES)),
+        ('curvature', value('curvature')),
+        ('num_reported_accidents', value('num_reported_accidents')),
+    ],
+    'lightgbm': [
+        ('curvature', value('curvature')),
+        ('curvature_speed', product('curvature', 'speed_limit')),
+        ('weather', code('weather', WEATHER_CODES)),
+        ('speed_limit', value('speed_limit')),
+        ('num_reported_accidents', value('num_reported_accidents')),
+        ('curvature_night', product_if('curvature', 'lighting', 'night')),
+        ('lighting', code('lighting', LIGHTING_CODES)),
+        ('public_road', flag('public_road')),
+        ('holiday', flag('holiday')),
+        ('num_lanes', value('num_lanes')),
+        ('time_of_day', code('time_of_day', TIME_OF_DAY_CODES)),
+        ('road_type', code('road_type', ROAD_TYPE_CODES)),
+        ('road_signs_present', flag('road_signs_present')),
+        ('school_season', flag('school_season')),
+    ],
+}
+FEATURE_SPECS['ridge'] = FEATURE_SPECS['lasso']
+
+# 未知模型类型使用原始字段，分类字段按可选值顺序编码
+DEFAULT_FEATURE_SPEC = [
+    (field, code(field, {option: i for i, option in enumerate(CATEGORICAL_OPTIONS[field])})
+     if field in CATEGORICAL_OPTIONS else flag(field) if field in BOOLEAN_COLUMNS else value(field))
+    for field in RAW_FEATURE_COLUMNS
+]
+
+
+def raw_columns_from_frame(raw_df):
+    """将规范化后的原始输入表转换为按列存放的数组，分类字段转换为可选值下标"""
+    columns = {}
+    for col in RAW_FEATURE_COLUMNS:
+        if col in CATEGORICAL_OPTIONS:
+            columns[col] = pd.Categorical(raw_df[col], categories=CATEGORICAL_OPTIONS[col]).codes
+        else:
+            columns[col] = raw_df[col].to_numpy(dtype=np.float64)
+    return columns
+
+
+def raw_columns_from_dict(input_features):
+    """将单条表单输入转换为长度为1的按列数组"""
+    columns = {}
+    for col in RAW_FEATURE_COLUMNS:
+        if col in CATEGORICAL_OPTIONS:
+            columns[col] = np.array([CATEGORICAL_OPTIONS[col].index(input_features[col])], dtype=np.int8)
+        else:
+            columns[col] = np.array([float(input_features[col])], dtype=np.float64)
+    return columns
+
+
+def _op_fields(op):
+    """特征操作读取的原始字段"""
+    if op[0] in ('product', 'product_if'):
+        return [op[1], op[2]]
+    return [op[1]]
+
+
+def _category_lookup(field, mapping):
+    """把可选值下标映射为编码值的查找表"""
+    return np.array([mapping[option] for option in CATEGORICAL_OPTIONS[field]], dtype=np.float64)
+
+
+def _compile_op(op):
+    """将单个特征操作编译为 columns -> ndarray 的函数"""
+    kind = op[0]
+    if kind == 'value':
+        _, field, divisor = op
+        if divisor == 1.0:
+            return lambda columns: columns[field]
+        return lambda columns: columns[field] / divisor
+    if kind == 'log1p':
+        field = op[1]
+        return lambda columns: np.log1p(columns[field])
+    if kind == 'flag':
+        field = op[1]
+        return lambda columns: columns[field] != 0
+    if kind == 'one_hot':
+        _, field, category = op
+        index = CATEGORICAL_OPTIONS[field].index(category)
+        return lambda columns: columns[field] == index
+    if kind == 'code':
+        _, field, mapping = op
+        lookup = _category_lookup(field, mapping)
+        return lambda columns: lookup[columns[field]]
+    if kind == 'product':
+        _, field, other, divisor = op
+        if divisor == 1.0:
+            return lambda columns: columns[field] * columns[other]
+        return lambda columns: columns[field] * (columns[other] / divisor)
+    if kind == 'product_if':
+        _, field, category_field, category = op
+        index = CATEGORICAL_OPTIONS[category_field].index(category)
+        return lambda columns: columns[field] * (columns[category_field] == index)
+    raise ValueError(f"未知的特征操作: {kind}")
+
+
+def _lightgbm_categories(model):
+    """LightGBM使用pandas分类特征训练时，各分类特征训练时的类别顺序"""
+    booster = getattr(model, 'booster_', None)
+    pandas_categorical = getattr(booster, 'pandas_categorical', None)
+    if not pandas_categorical:
+        return {}
+    categorical_columns = [name for name in booster.feature_name()
+                           if name in LIGHTGBM_CATEGORICAL_FEATURES]
+    if len(categorical_columns) != len(pandas_categorical):
+        return {}
+    return {column: list(categories) for column, categories in zip(categorical_columns, pandas_categorical)}
+
+
+def _xgboost_categories(model):
+    """XGBoost使用pandas分类特征训练时，模型中保存的各分类特征的类别顺序；用数值编码训练的模型没有保存类别。
+    模型含分类特征但读不到类别顺序时抛出 ValueError，不按表单可选值的顺序猜测编码"""
+    booster = model.get_booster()
+    try:
+        # 需要 xgboost>=3.1 和 pyarrow
+        categories = booster.get_categories(export_to_arrow=True).to_arrow()
+    except (AttributeError, ImportError, TypeError) as e:
+        if 'c' in (booster.feature_types or []):
+            raise ValueError(f"无法读取XGBoost模型训练时的类别顺序（需要 xgboost>=3.1 和 pyarrow）: {e}")
+        return {}
+    return {column: array.to_pylist() for column, array in categories if array is not None}
+
+
+def training_categories(model_type, model):
+    """模型训练时各分类特征的类别顺序 {特征名: [类别]}；模型按数值编码训练时为空"""
+    if model_type == 'lightgbm':
+        return _lightgbm_categories(model)
+    if model_type == 'xgboost':
+        return _xgboost_categories(model)
+    return {}
+
+
+def _scaler_applies(scaler, columns):
+    """缩放器的特征与模型特征一致时才做缩放，否则使用原始特征"""
+    if scaler is None or getattr(scaler, 'n_features_in_', None) != len(columns):
+        return False
+    names = getattr(scaler, 'feature_names_in_', None)
+    return names is None or list(names) == list(columns)
+
+
+class FeatureEncoder:
+    """由特征定义编译得到的编码器，直接写入预分配的特征矩阵（默认 float32）"""
+
+    def __init__(self, model_type, spec, scaler=None, dtype=np.float32):
+        self.model_type = model_type
+        self.dtype = dtype
+        self.columns = [name for name, _ in spec]
+        self.n_features = len(self.columns)
+        # 每个特征读取的原始字段，用于把特征贡献归并到表单字段
+        self.feature_fields = [tuple(_op_fields(op)) for _, op in spec]
+        # 分类字段 -> 编码表；预计算结果（如风险表）据此判断是否按相同的编码生成
+        self.category_codes = {op[1]: dict(op[2]) for _, op in spec if op[0] == 'code'}
+        self._ops = [_compile_op(op) for _, op in spec]
+        # 特征实际依赖的原始字段，按原始字段顺序排列
+        used = {field for _, op in spec for field in _op_fields(op)}
+        self.input_fields = [col for col in RAW_FEATURE_COLUMNS if col in used]
+
+        # 缩放器均值/标准差折叠进每列的编码
+        self.scaled = _scaler_applies(scaler, self.columns)
+        if self.scaled:
+            self._shift = np.asarray(scaler.mean_, dtype=np.float64)
+            self._scale = np.asarray(scaler.scale_, dtype=np.float64)
+
+    def encode_columns(self, columns, out=None):
+        """按列编码原始输入，返回形状为 (行数, 特征数) 的特征矩阵"""
+        n_rows = len(columns[RAW_FEATURE_COLUMNS[0]])
+        if out is None:
+            out = np.empty((n_rows, self.n_features), dtype=self.dtype)
+        for j, op in enumerate(self._ops):
+            values = op(columns)
+            if self.scaled:
+                values = (values - self._shift[j]) / self._scale[j]
+            out[:, j] = values
+        return out
+
+    def encode_frame(self, raw_df, out=None):
+        """编码规范化后的原始输入表"""
+        return self.encode_columns(raw_columns_from_frame(raw_df), out)
+
+    def encode_one(self, input_features):
+        """编码单条表单输入，返回 1 行的特征矩阵"""
+        return self.encode_columns(raw_columns_from_dict(input_features))
+
+    def features_dict(self, input_features):
+        """单条输入的特征名 -> 特征值，用于展示和调试"""
+        return dict(zip(self.columns, self.encode_one(input_features)[0].tolist()))
+
+
+def compile_encoder(model_type, model=None, scaler=None):
+    """为指定模型编译特征编码器：使用模型训练时的分类编码，并折叠缩放器"""
+    spec = FEATURE_SPECS.get(model_type, DEFAULT_FEATURE_SPEC)
+    categories = training_categories(model_type, model) if model is not None else {}
+    if categories:
+        compiled_spec = []
+        for name, op in spec:
+            if op[0] == 'code' and name in categories:
+                op = code(op[1], {category: i for i, category in enumerate(categories[name])})
+            compiled_spec.append((name, op))
+        spec = compiled_spec
+    # LightGBM的分裂阈值是双精度，float32输入会在阈值附近改变分支，因此保留float64
+    dtype = np.float64 if model_type == 'lightgbm' else np.float32
+    return FeatureEncoder(model_type, spec, scaler, dtype)
+
+
+def native_frame(model_type, model, columns, scaler=None):
+    """不经过编码器的分类编码和缩放折叠，按原生库的方式构造模型输入表：分类特征为带训练时类别顺序的
+    pandas Categorical，由原生库自行映射为编码；作为编码器、导出产物和编译树的一致性基准"""
+    spec = FEATURE_SPECS.get(model_type, DEFAULT_FEATURE_SPEC)
+    encoder = FeatureEncoder(model_type, spec, dtype=np.float64)
+    frame = pd.DataFrame(encoder.encode_columns(columns), columns=encoder.columns)
+    if _scaler_applies(scaler, encoder.columns):
+        frame = pd.DataFrame(scaler.transform(frame), columns=encoder.columns)
+    categories = training_categories(model_type, model)
+    for name, op in spec:
+        if op[0] == 'code' and name in categories:
+            values = pd.Categorical.from_codes(np.asarray(columns[op[1]], dtype=np.int64),
+                                               categories=CATEGORICAL_OPTIONS[op[1]])
+            frame[name] = values.set_categories(categories[name])
+    return frame
+
+
+_type_encoders = {}
+
+
+def get_encoder(model_type):
+    """按模型类型缓存的编码器（不绑定具体模型），用于展示特征"""
+    encoder = _type_encoders.get(model_type)
+    if encoder is None:
+        encoder = _type_encoders[model_type] = compile_encoder(model_type)
+    return encoder
+
+
+def predict_matrix(model, features):
+    """对编码好的特征矩阵调用一次predict，返回截断到[0, 1]的风险值"""
+    with warnings.catch_warnings():
+        # 以数组形式预测时sklearn会提示缺少特征名，特征顺序由编码器保证
+        warnings.filterwarnings('ignore', message='X does not have valid feature names')
+        predictions = np.asarray(model.predict(features), dtype=float)
+    return np.clip(predictions, 0.0, 1.0)
+
+
+def classify_risks(predictions):
+    """按风险值划分风险等级: <0.3 为low，<0.7 为medium，其余为high"""
+    predictions = np.asarray(predictions)
+    return np.where(predictions < 0.3, 'low', np.where(predictions < 0.7, 'medium', 'high'))
+
+
+def classify_risk(prediction):
+    """单个风险值对应的风险等级"""
+    return str(classify_risks([prediction])[0])
+
+
+# 可以编译为融合内核的线性模型类型
+LINEAR_MODEL_TYPES = ['linear_regression', 'lasso', 'ridge']
+# 融合内核按块累加，块内的临时数组留在CPU缓存中
+KERNEL_BLOCK_ROWS = 65536
+
+
+class LinearKernel:
+    """线性模型的融合打分内核：缩放器均值/标准差折叠进一条系数向量和截距，直接由原始字段逐列累加，
+    不生成特征矩阵"""
+
+    def __init__(self, encoder, coef, intercept):
+        coef = np.asarray(coef, dtype=np.float64)
+        if encoder.scaled:
+            # w·((x - mean) / std) + b = (w / std)·x + (b - Σ w·mean / std)
+            self.weights = coef / encoder._scale
+            self.intercept = float(intercept) - float(np.sum(coef * encoder._shift / encoder._scale))
+        else:
+            self.weights = coef.copy()
+            self.intercept = float(intercept)
+        self.columns = list(encoder.columns)
+        self._terms = list(zip(self.weights.tolist(), encoder._ops))
+
+    def predict_columns(self, columns):
+        """按列输入批量打分，返回未截断的预测值 (float64)"""
+        n_rows = len(columns[RAW_FEATURE_COLUMNS[0]])
+        out = np.full(n_rows, self.intercept)
+        for begin in range(0, n_rows, KERNEL_BLOCK_ROWS):
+            end = min(begin + KERNEL_BLOCK_ROWS, n_rows)
+            block = {col: values[begin:end] for col, values in columns.items()} if n_rows > KERNEL_BLOCK_ROWS else columns
+            acc = out[begin:end]
+            for weight, op in self._terms:
+                acc += weight * op(block)
+        return out
+
+    def predict_one(self, input_features):
+        """单条表单输入打分，全程使用Python标量，返回未截断的预测值"""
+        values = {}
+        for col in RAW_FEATURE_COLUMNS:
+            if col in CATEGORICAL_OPTIONS:
+                values[col] = CATEGORICAL_OPTIONS[col].index(input_features[col])
+            else:
+                values[col] = float(input_features[col])
+        total = self.intercept
+        for weight, op in self._terms:
+            total += weight * float(op(values))
+        return total
+
+
+def compile_linear_kernel(model_type, model, encoder):
+    """线性模型加载时编译融合内核；模型类型或系数形状不符时返回None，继续使用模型自身的predict"""
+    if model_type not in LINEAR_MODEL_TYPES:
+        return None
+    coef = getattr(model, 'coef_', None)
+    intercept = getattr(model, 'intercept_', None)
+    if coef is None or np.ndim(coef) != 1 or len(coef) != encoder.n_features or np.ndim(intercept) != 0:
+        return None
+    return LinearKernel(encoder, coef, intercept)
+
+
+def predict_columns(entry, columns, out=None):
+    """对按列存放的原始输入批量预测；有融合内核时不经过特征矩阵，树模型按行数选择编译后的树或原生库，
+    out 为可复用的特征矩阵缓冲区"""
+    if entry.kernel is not None:
+        return np.clip(entry.kernel.predict_columns(columns), 0.0, 1.0)
+    features = entry.encoder.encode_columns(columns, out)
+    return predict_matrix(entry.predictor(len(features)), features)
+
+
+def predict_frame(entry, raw_df):
+    """对规范化后的原始输入表批量预测，每个模型只调用一次predict"""
+    return predict_columns(entry, raw_columns_from_frame(raw_df))
+
+
+def predict_one(entry, input_features):
+    """单条表单输入的风险值，截断到[0, 1]"""
+    if entry.kernel is not None:
+        return min(max(entry.kernel.predict_one(input_features), 0.0), 1.0)
+    return float(predict_matrix(entry.predictor(1), entry.encoder.encode_one(input_features))[0])
@@ -0,0 +1,419 @@
+import argparse
+import json
+import os
+import pickle
+import re
+import subprocess
+import sys
+import time
+import warnings
+
+import numpy as np
+
+from feature_pipeline import (DEFAULT_FEATURE_SPEC, FEATURE_SPECS, compile_encoder, compile_linear_kernel,
+                              native_frame, predict_matrix, raw_columns_from_frame, sample_raw_frame)
+from tree_compiler import compile_trees, model_best_iteration, parity_matrices
+
+DEFAULT_ARTIFACTS_DIR = "artifacts"
+MANIFEST_NAME = "manifest.json"
+FORMAT_VERSION = 1
+# 导出产物、融合内核、编译树与原模型的最大允许误差
+DEFAULT_TOLERANCE = 1e-9
+
+# 文件名关键字 -> 模型类型，按顺序匹配
+MODEL_TYPE_KEYWORDS = [
+    'linear_regression',
+    'lasso',
+    'ridge',
+    'random_forest',
+    'xgboost',
+    'lightgbm',
+]
+
+# 特征操作 -> 清单中记录的特征类型
+FEATURE_TYPES = {'code': 'category', 'flag': 'bool', 'one_hot': 'bool'}
+
+
+def infer_model_type(model_filename):
+    """根据模型文件名推断模型类型"""
+    name = model_filename.lower()
+    for model_type in MODEL_TYPE_KEYWORDS:
+        if model_type in name:
+            return model_type
+    return 'unknown'
+
+
+def available_models(models_dir):
+    """模型目录中的模型文件（不含特征缩放器）"""
+    if not os.path.exists(models_dir):
+        return []
+    return sorted(f for f in os.listdir(models_dir) if f.endswith('.pkl') and 'scaler' not in f.lower())
+
+
+def default_model(model_files):
+    """默认使用的模型：优先 lightgbm，其次 xgboost，否则第一个模型文件；同类模型有多个版本时使用最新版本"""
+    # 文件名中的版本为 vYYYYMMDD_HHMMSS，倒序排列即最新版本在前
+    newest_first = sorted(model_files, reverse=True)
+    for keyword in ('lightgbm', 'xgboost'):
+        for model_file in newest_first:
+            if keyword in model_file.lower():
+                return model_file
+    return model_files[0] if model_files else None
+
+
+def scaler_filename_for(model_filename):
+    """返回模型对应的特征缩放器文件名"""
+    model_name = os.path.splitext(model_filename)[0]
+    return f"{model_name}_scaler.pkl"
+
+
+def source_version(models_dir, model_filename):
+    """模型及缩放器文件的版本标记（修改时间和大小）"""
+    version = []
+    for filename in (model_filename, scaler_filename_for(model_filename)):
+        try:
+            stat = os.stat(os.path.join(models_dir, filename))
+            version.append((stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            version.append(None)
+    return tuple(version)
+
+
+def load_pickled(models_dir, model_filename):
+    """反序列化 pickle 格式的模型和缩放器，返回 (模型, 缩放器, 文件总字节数)"""
+    model_path = os.path.join(models_dir, model_filename)
+    with open(model_path, 'rb') as f:
+        model = pickle.load(f)
+    size_bytes = os.path.getsize(model_path)
+
+    scaler = None
+    scaler_path = os.path.join(models_dir, scaler_filename_for(model_filename))
+    if os.path.exists(scaler_path):
+        with open(scaler_path, 'rb') as f:
+            scaler = pickle.load(f)
+        size_bytes += os.path.getsize(scaler_path)
+    return model, scaler, size_bytes
+
+
+def artifact_dir(artifacts_dir, model_filename):
+    """导出产物目录，每个模型文件一个子目录"""
+    return os.path.join(artifacts_dir, os.path.splitext(model_filename)[0])
+
+
+def read_manifest(artifacts_dir, model_filename):
+    """读取导出清单，不存在时返回None"""
+    path = os.path.join(artifact_dir(artifacts_dir, model_filename), MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _json_version(version):
+    """将版本标记转换为JSON可比较的形式"""
+    return json.loads(json.dumps(version))
+
+
+def is_current(manifest, version):
+    """清单是否由当前版本的模型文件导出"""
+    return (manifest is not None and manifest.get('format_version') == FORMAT_VERSION and
+            manifest.get('source_version') == _json_version(version))
+
+
+class LinearArtifactModel:
+    """以扁平数组保存的线性模型，predict 为一次矩阵乘法"""
+
+    def __init__(self, coef, intercept):
+        self.coef_ = coef
+        self.intercept_ = float(intercept)
+        self.n_features_in_ = len(coef)
+
+    def predict(self, features):
+        return np.asarray(features) @ self.coef_ + self.intercept_
+
+
+class ArrayScaler:
+    """以扁平数组保存的标准化缩放器，提供编码器折叠缩放所需的属性"""
+
+    def __init__(self, mean, scale, feature_names=None):
+        self.mean_ = mean
+        self.scale_ = scale
+        self.n_features_in_ = len(scale)
+        self.feature_names_in_ = np.asarray(feature_names, dtype=object) if feature_names else None
+
+    def transform(self, features):
+        return (np.asarray(features) - self.mean_) / self.scale_
+
+
+class LightGBMArtifactModel:
+    """从原生文本格式加载的LightGBM模型"""
+
+    def __init__(self, booster, best_iteration=None):
+        self.booster_ = booster
+        self.best_iteration_ = best_iteration
+        self.n_features_in_ = booster.num_feature()
+
+    def predict(self, features):
+        return self.booster_.predict(features, num_iteration=self.best_iteration_)
+
+
+class XGBoostArtifactModel:
+    """从原生 UBJSON 格式加载的XGBoost模型"""
+
+    def __init__(self, booster, best_iteration=None):
+        self._booster = booster
+        self.best_iteration = best_iteration
+        self.n_features_in_ = booster.num_features()
+
+    def get_booster(self):
+        return self._booster
+
+    def predict(self, features):
+        iteration_range = (0, self.best_iteration + 1) if self.best_iteration is not None else (0, 0)
+        return self._booster.inplace_predict(features, iteration_range=iteration_range)
+
+
+def model_kind(model):
+    """判断模型的导出格式: linear、lightgbm 或 xgboost，无法导出时返回None"""
+    if hasattr(model, 'booster_') and hasattr(model.booster_, 'model_to_string'):
+        return 'lightgbm'
+    if hasattr(model, 'get_booster'):
+        return 'xgboost'
+    coef = getattr(model, 'coef_', None)
+    if coef is not None and np.ndim(coef) == 1 and np.ndim(getattr(model, 'intercept_', None)) == 0:
+        return 'linear'
+    return None
+
+
+def _lightgbm_model_text(booster):
+    """LightGBM模型文本；参数段中按名称列出的分类特征改写为列下标，否则 lightgbm 无法重新加载"""
+    names = booster.feature_name()
+
+    def to_indices(match):
+        items = [str(names.index(item)) if item in names else item for item in match.group(1).split(',')]
+        return f"[categorical_feature: {','.join(items)}]"
+
+    return re.sub(r'^\[categorical_feature: (.+)\]$', to_indices, booster.model_to_string(), flags=re.M)
+
+
+def _feature_manifest(model_type):
+    spec = FEATURE_SPECS.get(model_type, DEFAULT_FEATURE_SPEC)
+    return [{'name': name, 'type': FEATURE_TYPES.get(op[0], 'float')} for name, op in spec]
+
+
+def export_model(models_dir, model_filename, artifacts_dir=DEFAULT_ARTIFACTS_DIR):
+    """把 pickle 模型导出为原生/数组格式，写入清单并返回"""
+    model, scaler, _ = load_pickled(models_dir, model_filename)
+    kind = model_kind(model)
+    if kind is None:
+        raise ValueError(f"{model_filename} 的模型类型 {type(model).__name__} 不支持导出")
+
+    model_type = infer_model_type(model_filename)
+    out_dir = artifact_dir(artifacts_dir, model_filename)
+    os.makedirs(out_dir, exist_ok=True)
+    files = {}
+    manifest = {
+        'format_version': FORMAT_VERSION,
+        'model_file': model_filename,
+        'model_type': model_type,
+        'model_class': type(model).__name__,
+        'kind': kind,
+        'source_version': _json_version(source_version(models_dir, model_filename)),
+        'features': _feature_manifest(model_type),
+        'dtype': np.dtype(compile_encoder(model_type, model, scaler).dtype).name,
+        'best_iteration': None,
+        'scaler': None,
+        'files': files,
+    }
+
+    if kind == 'lightgbm':
+        files['model'] = 'model.txt'
+        with open(os.path.join(out_dir, files['model']), 'w', encoding='utf-8') as f:
+            f.write(_lightgbm_model_text(model.booster_))
+        manifest['best_iteration'] = model_best_iteration(model, 'best_iteration_')
+        manifest['categories'] = model.booster_.pandas_categorical
+    elif kind == 'xgboost':
+        files['model'] = 'model.ubj'
+        model.get_booster().save_model(os.path.join(out_dir, files['model']))
+        manifest['best_iteration'] = model_best_iteration(model, 'best_iteration')
+    else:
+        files['coef'] = 'coef.npy'
+        files['intercept'] = 'intercept.npy'
+        np.save(os.path.join(out_dir, files['coef']), np.asarray(model.coef_, dtype=np.float64))
+        np.save(os.path.join(out_dir, files['intercept']), np.asarray(model.intercept_, dtype=np.float64))
+
+    if scaler is not None:
+        n_features = scaler.n_features_in_
+        mean = getattr(scaler, 'mean_', None)
+        scale = getattr(scaler, 'scale_', None)
+        files['scaler_mean'] = 'scaler_mean.npy'
+        files['scaler_scale'] = 'scaler_scale.npy'
+        np.save(os.path.join(out_dir, files['scaler_mean']),
+                np.zeros(n_features) if mean is None else np.asarray(mean, dtype=np.float64))
+        np.save(os.path.join(out_dir, files['scaler_scale']),
+                np.ones(n_features) if scale is None else np.asarray(scale, dtype=np.float64))
+        names = getattr(scaler, 'feature_names_in_', None)
+        manifest['scaler'] = {
+            'n_features': int(n_features),
+            'feature_names': [str(name) for name in names] if names is not None else None,
+        }
+
+    manifest['created_at'] = time.strftime('%Y-%m-%d %H:%M:%S')
+    # 清单最后写入，存在清单即表示产物完整
+    manifest_path = os.path.join(out_dir, MANIFEST_NAME)
+    with open(manifest_path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(manifest_path + '.tmp', manifest_path)
+    return manifest
+
+
+def load_artifact(artifacts_dir, model_filename, manifest=None):
+    """加载导出产物，返回 (模型, 缩放器, 文件总字节数)；数组以只读内存映射打开，多进程共享页缓存"""
+    manifest = manifest or read_manifest(artifacts_dir, model_filename)
+    if manifest is None:
+        raise ValueError(f"{model_filename} 没有导出产物")
+    out_dir = artifact_dir(artifacts_dir, model_filename)
+    files = manifest['files']
+
+    def path(key):
+        return os.path.join(out_dir, files[key])
+
+    kind = manifest['kind']
+    if kind == 'lightgbm':
+        # 按需导入，线性模型的加载不需要这些库
+        import lightgbm
+        model = LightGBMArtifactModel(lightgbm.Booster(model_file=path('model')), manifest['best_iteration'])
+    elif kind == 'xgboost':
+        import xgboost
+        model = XGBoostArtifactModel(xgboost.Booster(model_file=path('model')), manifest['best_iteration'])
+    elif kind == 'linear':
+        model = LinearArtifactModel(np.load(path('coef'), mmap_mode='r'), np.load(path('intercept')))
+    else:
+        raise ValueError(f"{model_filename} 的导出格式 {kind} 无法识别")
+
+    columns = [feature['name'] for feature in manifest['features']]
+    if model.n_features_in_ != len(columns):
+        raise ValueError(f"{model_filename} 的特征数 {model.n_features_in_} 与清单中的 {len(columns)} 不一致")
+    if columns != compile_encoder(manifest['model_type']).columns:
+        raise ValueError(f"{model_filename} 的特征顺序与当前特征定义不一致，请重新导出")
+
+    scaler = None
+    if manifest['scaler'] is not None:
+        scaler = ArrayScaler(np.load(path('scaler_mean'), mmap_mode='r'),
+                             np.load(path('scaler_scale'), mmap_mode='r'),
+                             manifest['scaler']['feature_names'])
+
+    size_bytes = sum(os.path.getsize(path(key)) for key in files)
+    return model, scaler, size_bytes
+
+
+def verify(models_dir, model_filename, artifacts_dir=DEFAULT_ARTIFACTS_DIR, samples=20000, seed=0):
+    """随机抽取表单输入，以 pickle 中的原模型在原生输入（pandas 分类特征、未折叠的缩放器）上的预测为基准，
+    比较特征编码器、导出产物、融合内核和编译树的预测差异；编译树另外在分裂阈值附近和带缺失值的特征矩阵上与原生库比较"""
+    model_type = infer_model_type(model_filename)
+    columns = raw_columns_from_frame(sample_raw_frame(samples, seed))
+    model, scaler, _ = load_pickled(models_dir, model_filename)
+    encoder = compile_encoder(model_type, model, scaler)
+
+    def predict(model, scaler):
+        # 编码器和导出产物都使用 float64 特征矩阵，差异只来自编码和模型本身
+        encoder = compile_encoder(model_type, model, scaler)
+        return predict_matrix(model, encoder.encode_columns(columns, np.empty((samples, encoder.n_features))))
+
+    with warnings.catch_warnings():
+        # 线性模型以数组训练，缩放后的输入表带有特征名时 sklearn 会给出提示
+        warnings.filterwarnings('ignore', message='X has feature names')
+        native = model.predict(native_frame(model_type, model, columns, scaler))
+    reference = np.clip(np.asarray(native, dtype=float), 0.0, 1.0)
+    comparisons = {'特征编码': (predict(model, scaler), reference)}
+    if is_current(read_manifest(artifacts_dir, model_filename), source_version(models_dir, model_filename)):
+        comparisons['导出产物'] = (predict(*load_artifact(artifacts_dir, model_filename)[:2]), reference)
+    kernel = compile_linear_kernel(model_type, model, encoder)
+    if kernel is not None:
+        comparisons['融合内核'] = (np.clip(kernel.predict_columns(columns), 0.0, 1.0), reference)
+    try:
+        trees = compile_trees(model)
+    except ValueError:
+        trees = None
+    if trees is not None:
+        features = encoder.encode_columns(columns, np.empty((samples, encoder.n_features)))
+        comparisons['编译树'] = (predict_matrix(trees, features), reference)
+        for name, matrix in parity_matrices(trees, samples, seed).items():
+            matrix = matrix.astype(encoder.dtype)
+            comparisons[f'编译树-{name}'] = (trees.predict(matrix), np.asarray(model.predict(matrix), dtype=float))
+
+    results = {}
+    for name, (predictions, expected) in comparisons.items():
+        diff = np.abs(predictions - expected)
+        results[name] = {'samples': samples, 'max_abs_diff': float(diff.max()),
+                         'mean_abs_diff': float(diff.mean())}
+    return results
+
+
+# 在新进程中测量从启动到模型可用的耗时（包含导入依赖库）
+_COLD_LOAD_SCRIPT = """
+import sys, time
+start = time.perf_counter()
+from model_registry import ModelRegistry
+entry = ModelRegistry(sys.argv[1], artifacts_dir=sys.argv[3] or None).get(sys.argv[2])
+print(time.perf_counter() - start, entry.load_seconds, entry.source)
+"""
+
+
+def cold_load(models_dir, model_filename, artifacts_dir=None):
+    """在新进程中加载模型，返回 (启动到可用的秒数, 加载本身的秒数, 加载来源)"""
+    result = subprocess.run(
+        [sys.executable, '-c', _COLD_LOAD_SCRIPT, models_dir, model_filename, artifacts_dir or ''],
+        capture_output=True, text=True, check=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)))
+    total, load_seconds, source = result.stdout.split()[-3:]
+    return float(total), float(load_seconds), source
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="模型导出：将 pickle 模型转换为原生/数组格式，并与原模型做一致性检查")
+    parser.add_argument('command', choices=['export', 'verify', 'benchmark'],
+                        help="export 导出模型，verify 检查导出产物、融合内核和编译树与原模型的一致性，"
+                             "benchmark 比较冷启动加载耗时")
+    parser.add_argument('--models-dir', default="models", help="模型文件目录")
+    parser.add_argument('--artifacts-dir', default=DEFAULT_ARTIFACTS_DIR, help="导出产物目录")
+    parser.add_argument('--model', action='append', help="只处理指定的模型文件，可重复指定")
+    parser.add_argument('--samples', type=int, default=20000, help="一致性检查的抽样点数")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help="一致性检查允许的最大误差")
+    parser.add_argument('--repeat', type=int, default=3, help="冷启动测量的重复次数，取最小值")
+    args = parser.parse_args(argv)
+
+    model_files = args.model or available_models(args.models_dir)
+    failed = False
+    for model_file in model_files:
+        if args.command == 'export':
+            try:
+                manifest = export_model(args.models_dir, model_file, args.artifacts_dir)
+            except ValueError as e:
+                print(f"跳过 {model_file}: {e}")
+                continue
+            print(f"导出 {model_file}: 格式 {manifest['kind']}，{len(manifest['features'])} 个特征，"
+                  f"文件 {sorted(manifest['files'].values())}")
+        elif args.command == 'verify':
+            results = verify(args.models_dir, model_file, args.artifacts_dir, args.samples)
+            if not results:
+                print(f"{model_file}: 没有可检查的导出产物、融合内核或编译树")
+            for name, result in results.items():
+                ok = result['max_abs_diff'] <= args.tolerance
+                failed = failed or not ok
+                print(f"{model_file} [{name}]: {'通过' if ok else '不一致'}，抽样 {result['samples']} 点，"
+                      f"最大误差 {result['max_abs_diff']:.2e}，平均误差 {result['mean_abs_diff']:.2e}")
+        else:
+            timings = {}
+            for label, directory in (('pickle', None), ('artifact', args.artifacts_dir)):
+                runs = [cold_load(args.models_dir, model_file, directory) for _ in range(args.repeat)]
+                timings[label] = min(runs)
+            print(f"{model_file}: 冷启动 pickle {timings['pickle'][0] * 1000:.0f} ms "
+                  f"(加载 {timings['pickle'][1] * 1000:.1f} ms) -> "
+                  f"{timings['artifact'][2]} {timings['artifact'][0] * 1000:.0f} ms "
+                  f"(加载 {timings['artifact'][1] * 1000:.1f} ms)")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import plotly.graph_objects as go
+
+from feature_pipeline import classify_risk, classify_risks, normalize_input, predict_one
+from model_registry import DEFAULT_MAX_MODELS
+from sensitivity import RISK_THRESHOLDS
+
+# 对比打分的线程数：与注册表最多常驻的模型数一致，每个模型一个线程
+DEFAULT_COMPARE_WORKERS = DEFAULT_MAX_MODELS
+# 风险等级 -> 图表颜色
+RISK_LEVEL_COLORS = {'low': '#2ca02c', 'medium': '#ff7f0e', 'high': '#d62728'}
+
+
+class ComparisonResult:
+    """同一条输入在多个模型上的预测结果；ensemble 为成功模型风险值的平均，未启用时为None"""
+
+    def __init__(self, rows, errors, ensemble, elapsed_seconds):
+        self.rows = rows
+        self.errors = errors
+        self.ensemble = ensemble
+        self.elapsed_seconds = elapsed_seconds
+
+    def table(self):
+        """按模型展示的结果表（中文列名）"""
+        return [{
+            '模型文件': row['model_file'],
+            '模型类型': row['model_type'],
+            '推理引擎': row['engine'],
+            '预测风险值': round(row['risk'], 4),
+            '风险等级': row['risk_level'].upper(),
+            '预测耗时(ms)': round(row['predict_seconds'] * 1000, 3),
+            '本次加载耗时(ms)': round(row['load_seconds'] * 1000, 1) if row['load_seconds'] else None,
+        } for row in self.rows]
+
+
+def _score(registry, model_file, input_features):
+    """在工作线程中获取模型并对单条输入打分；模型未常驻时在此加载，多个模型的加载也并发进行"""
+    resident = registry.is_loaded(model_file)
+    entry = registry.get(model_file)
+    start = time.perf_counter()
+    risk = predict_one(entry, input_features)
+    predict_seconds = time.perf_counter() - start
+    return {
+        'model_file': model_file,
+        'model_type': entry.model_type,
+        'engine': entry.engine_name(),
+        'risk': risk,
+        'risk_level': classify_risk(risk),
+        'predict_seconds': predict_seconds,
+        'load_seconds': 0.0 if resident else entry.load_seconds,
+    }
+
+
+def compare_models(registry, model_files, input_features, ensemble=False, executor=None):
+    """在线程池中用多个模型并发预测同一条输入（原生库预测时释放GIL），单个模型失败不影响其他模型"""
+    if not model_files:
+        raise ValueError("请至少选择一个模型")
+    executor = executor or get_comparison_executor()
+    start = time.perf_counter()
+    input_features = normalize_input(input_features)
+    futures = {model_file: executor.submit(_score, registry, model_file, input_features)
+               for model_file in model_files}
+
+    rows, errors = [], {}
+    for model_file, future in futures.items():
+        try:
+            rows.append(future.result())
+        except Exception as e:
+            errors[model_file] = str(e)
+
+    ensemble_result = None
+    if ensemble and rows:
+        risks = np.array([row['risk'] for row in rows])
+        ensemble_result = {
+            'risk': float(risks.mean()),
+            'risk_level': classify_risk(float(risks.mean())),
+            # 模型间的分歧：风险值的标准差与最大最小差
+            'std': float(risks.std()),
+            'range': float(risks.max() - risks.min()),
+            'models': len(rows),
+        }
+    return ComparisonResult(rows, errors, ensemble_result, time.perf_counter() - start)
+
+
+def comparison_figure(result):
+    """各模型预测风险值的柱状图，按风险等级着色，启用集成时画出平均值"""
+    names = [row['model_file'] for row in result.rows]
+    risks = [row['risk'] for row in result.rows]
+    fig = go.Figure(go.Bar(
+        x=names, y=risks, text=[f"{risk:.4f}" for risk in risks], textposition='outside',
+        marker_color=[RISK_LEVEL_COLORS[level] for level in classify_risks(risks)],
+        customdata=[row['predict_seconds'] * 1000 for row in result.rows],
+        hovertemplate="%{x}<br>风险值 %{y:.4f}<br>预测耗时 %{customdata:.3f} ms<extra></extra>"))
+    for threshold, label in RISK_THRESHOLDS.items():
+        fig.add_hline(y=threshold, line_dash='dot', line_color='gray', annotation_text=label)
+    if result.ensemble is not None:
+        fig.add_hline(y=result.ensemble['risk'], line_color='black',
+                      annotation_text=f"平均集成 {result.ensemble['risk']:.4f}", annotation_position='bottom right')
+    fig.update_yaxes(title_text="预测风险值", range=[0, 1.05])
+    fig.update_layout(showlegend=False)
+    return fig
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_comparison_executor(workers=DEFAULT_COMPARE_WORKERS):
+    """获取进程内共享的对比打分线程池，各会话共用，不随页面重新运行而重建"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="model-compare")
+        return _executor
@@ -0,0 +1,284 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from feature_pipeline import (compile_encoder, compile_linear_kernel, normalize_input, predict_columns,
+                              predict_one, raw_columns_from_frame, sample_raw_frame)
+from model_artifacts import (DEFAULT_ARTIFACTS_DIR, available_models, default_model, infer_model_type, is_current,
+                             load_artifact, load_pickled, read_manifest, source_version)
+from perf_metrics import get_metrics
+from tree_compiler import DEFAULT_COMPILED_MAX_ROWS, DEFAULT_TREE_ENGINE, TREE_ENGINES, compile_trees
+
+# 模型缓存默认上限：最多常驻的模型数量与总字节预算
+DEFAULT_MAX_MODELS = 6
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+# 预热时合成的批量输入行数与单条预测次数
+WARM_UP_ROWS = 256
+WARM_UP_SINGLE_ROWS = 8
+
+
+class ModelEntry:
+    """已加载模型及其缩放器，所有会话共享同一个实例，使用方不应修改"""
+
+    def __init__(self, filename, model_type, model, scaler, load_seconds, size_bytes, version=None,
+                 source='pickle', tree_engine=DEFAULT_TREE_ENGINE, compiled_max_rows=DEFAULT_COMPILED_MAX_ROWS):
+        self.filename = filename
+        # 加载来源: pickle 或 artifact（导出的原生/数组格式）
+        self.source = source
+        # 模型文件的版本标记，文件被替换后与磁盘上的不一致
+        self.version = version
+        self.model_type = model_type
+        self.model = model
+        self.scaler = scaler
+        # 编译一次的特征编码器，单条和批量预测共用
+        self.encoder = compile_encoder(model_type, model, scaler)
+        # 线性模型的融合打分内核，其他模型为None
+        self.kernel = compile_linear_kernel(model_type, model, self.encoder)
+        # 树模型编译为节点数组，不是树模型或结构不受支持时为None，使用原生库预测
+        self.trees = None
+        if tree_engine not in TREE_ENGINES:
+            raise ValueError(f"未知的推理引擎 {tree_engine}，可选值为 {TREE_ENGINES}")
+        self.tree_engine = tree_engine
+        self.compiled_max_rows = compiled_max_rows
+        if self.kernel is None and tree_engine != 'native':
+            try:
+                self.trees = compile_trees(model)
+            except ValueError:
+                self.trees = None
+        self.load_seconds = load_seconds
+        self.size_bytes = size_bytes
+        self.loaded_at = time.time()
+        self.last_used = self.loaded_at
+        self.hits = 0
+        # 预热完成后为True，首次预测不再承担原生库的一次性初始化开销
+        self.ready = False
+        self.warm_up_seconds = None
+
+    def predictor(self, n_rows):
+        """预测 n_rows 行时使用的模型：auto 模式下小批量使用编译后的树，否则使用模型自身的predict"""
+        if self.trees is not None and (self.tree_engine == 'compiled' or n_rows <= self.compiled_max_rows):
+            return self.trees
+        return self.model
+
+    def engine_name(self):
+        """推理引擎名称，用于展示"""
+        if self.kernel is not None:
+            return '融合内核'
+        if self.trees is not None:
+            return '编译树' if self.tree_engine == 'compiled' else f'编译树(≤{self.compiled_max_rows}行)/原生'
+        return '原生'
+
+    def warm_up(self, rows=WARM_UP_ROWS, seed=0):
+        """用合成输入跑一次批量预测和几次单条预测，触发原生库和编译树的一次性初始化，完成后标记为就绪"""
+        start = time.perf_counter()
+        raw_df = sample_raw_frame(rows, seed)
+        predict_columns(self, raw_columns_from_frame(raw_df))
+        for input_features in raw_df.head(WARM_UP_SINGLE_ROWS).to_dict('records'):
+            predict_one(self, normalize_input(input_features))
+        self.warm_up_seconds = time.perf_counter() - start
+        self.ready = True
+        return self.warm_up_seconds
+
+    def touch(self):
+        """记录一次使用"""
+        self.hits += 1
+        self.last_used = time.time()
+
+
+class ModelRegistry:
+    """进程级模型注册表：每个模型文件只反序列化一次，按LRU和字节预算淘汰"""
+
+    def __init__(self, models_dir, max_models=DEFAULT_MAX_MODELS, max_bytes=DEFAULT_MAX_BYTES,
+                 artifacts_dir=DEFAULT_ARTIFACTS_DIR, tree_engine=DEFAULT_TREE_ENGINE):
+        self.models_dir = models_dir
+        self.tree_engine = tree_engine
+        # 导出产物目录，为None时只从 pickle 加载
+        self.artifacts_dir = artifacts_dir
+        self.max_models = max_models
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        self._reload_listeners = []
+        # 预加载：模型文件 -> 完成事件，以及加载失败的错误信息
+        self._preload_events = {}
+        self.preload_errors = {}
+        self.loads = 0
+        self.evictions = 0
+
+    def add_reload_listener(self, listener):
+        """注册模型文件变化时的回调，参数为模型文件名"""
+        self._reload_listeners.append(listener)
+
+    def artifact_version(self, model_filename):
+        """模型及缩放器文件的版本标记（修改时间和大小）"""
+        return source_version(self.models_dir, model_filename)
+
+    def get(self, model_filename):
+        """获取模型，未加载或磁盘上的文件已变化时重新加载；并发请求同一模型时只加载一次"""
+        version = self.artifact_version(model_filename)
+        with self._lock:
+            entry = self._entries.get(model_filename)
+            if entry is not None and entry.version != version:
+                # 模型文件已被替换，丢弃旧实例
+                del self._entries[model_filename]
+                entry = None
+                for listener in self._reload_listeners:
+                    listener(model_filename)
+            if entry is not None:
+                self._entries.move_to_end(model_filename)
+                entry.touch()
+                return entry
+            load_lock = self._load_locks.setdefault(model_filename, threading.Lock())
+
+        with load_lock:
+            # 等待锁期间其他线程可能已经完成加载
+            with self._lock:
+                entry = self._entries.get(model_filename)
+                if entry is not None:
+                    self._entries.move_to_end(model_filename)
+                    entry.touch()
+                    return entry
+
+            with get_metrics().span('model_load'):
+                entry = self._load(model_filename)
+
+            with self._lock:
+                self._entries[model_filename] = entry
+                self.loads += 1
+                entry.touch()
+                self._evict_over_budget()
+            return entry
+
+    def _load(self, model_filename):
+        """加载模型和缩放器：优先使用与当前模型文件一致的导出产物，否则反序列化 pickle"""
+        start = time.perf_counter()
+        version = self.artifact_version(model_filename)
+        loaded = None
+        if self.artifacts_dir:
+            manifest = read_manifest(self.artifacts_dir, model_filename)
+            if is_current(manifest, version):
+                try:
+                    loaded = load_artifact(self.artifacts_dir, model_filename, manifest) + ('artifact',)
+                except (OSError, ValueError):
+                    # 导出产物损坏或与当前特征定义不一致时回退到 pickle
+                    loaded = None
+        if loaded is None:
+            loaded = load_pickled(self.models_dir, model_filename) + ('pickle',)
+        model, scaler, size_bytes, source = loaded
+
+        load_seconds = time.perf_counter() - start
+        return ModelEntry(model_filename, infer_model_type(model_filename), model, scaler,
+                          load_seconds, size_bytes, version, source, self.tree_engine)
+
+    def preload(self, model_files, warm_up=True):
+        """加载并预热指定的模型，返回 {模型文件: 错误信息}；单个模型失败不影响其他模型"""
+        errors = {}
+        for model_file in model_files:
+            with self._lock:
+                event = self._preload_events.setdefault(model_file, threading.Event())
+            try:
+                entry = self.get(model_file)
+                if warm_up and not entry.ready:
+                    with get_metrics().span('model_warm_up'):
+                        entry.warm_up()
+                self.preload_errors.pop(model_file, None)
+            except Exception as e:
+                errors[model_file] = self.preload_errors[model_file] = str(e)
+            finally:
+                event.set()
+        return errors
+
+    def preload_in_background(self, model_files, warm_up=True):
+        """在后台线程中预加载并预热模型，不阻塞调用方；已在预加载或已完成的模型不会重复处理"""
+        with self._lock:
+            model_files = [model_file for model_file in model_files if model_file not in self._preload_events]
+            for model_file in model_files:
+                self._preload_events[model_file] = threading.Event()
+        if not model_files:
+            return None
+        thread = threading.Thread(target=self.preload, args=(model_files, warm_up), name="model-preload",
+                                  daemon=True)
+        thread.start()
+        return thread
+
+    def is_preloading(self, model_filename):
+        """模型是否已排队预加载但尚未完成"""
+        with self._lock:
+            event = self._preload_events.get(model_filename)
+        return event is not None and not event.is_set()
+
+    def wait_preloaded(self, model_filename, timeout=None):
+        """等待模型预加载完成，返回是否已就绪（未排队预加载的模型直接返回当前状态）"""
+        with self._lock:
+            event = self._preload_events.get(model_filename)
+        if event is not None:
+            event.wait(timeout)
+        return self.is_ready(model_filename)
+
+    def is_ready(self, model_filename):
+        """模型是否已常驻内存并完成预热"""
+        with self._lock:
+            entry = self._entries.get(model_filename)
+        return entry is not None and entry.ready and entry.version == self.artifact_version(model_filename)
+
+    def _evict_over_budget(self):
+        """淘汰最久未使用的模型，直到满足数量和字节预算（至少保留一个）"""
+        while len(self._entries) > 1 and (
+                (self.max_models and len(self._entries) > self.max_models) or
+                (self.max_bytes and self.total_bytes() > self.max_bytes)):
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def evict_idle(self, max_idle_seconds):
+        """淘汰超过指定时间未使用的模型，返回淘汰数量"""
+        now = time.time()
+        with self._lock:
+            idle = [name for name, entry in self._entries.items()
+                    if now - entry.last_used > max_idle_seconds]
+            for name in idle:
+                del self._entries[name]
+            self.evictions += len(idle)
+        return len(idle)
+
+    def is_loaded(self, model_filename):
+        """模型是否已常驻内存"""
+        with self._lock:
+            return model_filename in self._entries
+
+    def total_bytes(self):
+        """当前常驻模型的总大小（按序列化大小估算）"""
+        return sum(entry.size_bytes for entry in self._entries.values())
+
+    def stats(self):
+        """每个常驻模型的加载耗时、占用大小和使用情况"""
+        with self._lock:
+            entries = list(self._entries.values())
+        now = time.time()
+        return [{
+            '模型文件': entry.filename,
+            '模型类型': entry.model_type,
+            '加载来源': entry.source,
+            '推理引擎': entry.engine_name(),
+            '加载耗时(ms)': round(entry.load_seconds * 1000, 1),
+            '预热耗时(ms)': round(entry.warm_up_seconds * 1000, 1) if entry.warm_up_seconds is not None else None,
+            '占用大小(KB)': round(entry.size_bytes / 1024, 1),
+            '使用次数': entry.hits,
+            '空闲时间(s)': round(now - entry.last_used, 1),
+        } for entry in entries]
+
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+def get_registry(models_dir="models", artifacts_dir=DEFAULT_ARTIFACTS_DIR, tree_engine=DEFAULT_TREE_ENGINE):
+    """获取进程内共享的模型注册表"""
+    key = os.path.abspath(models_dir)
+    with _registries_lock:
+        registry = _registries.get(key)
+        if registry is None:
+            registry = ModelRegistry(models_dir, artifacts_dir=artifacts_dir, tree_engine=tree_engine)
+            _registries[key] = registry
+        return registry
@@ -0,0 +1,288 @@
+import argparse
+import atexit
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from feature_pipeline import RAW_FEATURE_COLUMNS, predict_columns, raw_columns_from_frame, sample_raw_frame
+from model_artifacts import DEFAULT_ARTIFACTS_DIR, source_version
+from model_registry import available_models, default_model, get_registry
+from tree_compiler import DEFAULT_TREE_ENGINE
+
+# 每个分块的行数：分块越大进程间通信开销占比越小，但首块结果返回越晚、占用内存越多
+DEFAULT_CHUNK_ROWS = 65536
+# 每个工作进程最多排队的分块数，限制流式预测时驻留内存的分块数量
+MAX_PENDING_PER_WORKER = 2
+# 等待所有工作进程加载完模型的最长时间（秒）
+WORKER_START_TIMEOUT = 300
+
+
+def default_workers():
+    """默认工作进程数：可用的CPU核数"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+# 工作进程内的模型条目，由 _init_worker 在进程启动时加载一次
+_worker_entry = None
+_worker_load_seconds = None
+_worker_barrier = None
+
+
+def _init_worker(models_dir, model_file, artifacts_dir, tree_engine, threads, barrier):
+    """工作进程初始化：限制原生库线程数，从导出产物（内存映射）或 pickle 加载模型"""
+    global _worker_entry, _worker_load_seconds, _worker_barrier
+    # 多个进程并行时每个进程只用指定数量的线程，避免LightGBM/XGBoost的OpenMP线程互相争抢CPU
+    os.environ['OMP_NUM_THREADS'] = str(threads)
+    start = time.perf_counter()
+    _worker_entry = get_registry(models_dir, artifacts_dir, tree_engine).get(model_file)
+    _worker_entry.warm_up()
+    _worker_load_seconds = time.perf_counter() - start
+    _worker_barrier = barrier
+
+
+def _worker_info():
+    """预热任务：等待所有工作进程都加载完模型，保证每个进程恰好执行一个预热任务"""
+    _worker_barrier.wait(WORKER_START_TIMEOUT)
+    return {'pid': os.getpid(), 'source': _worker_entry.source, 'load_seconds': _worker_load_seconds}
+
+
+def _score_chunk(columns):
+    """在工作进程中对一个按列存放的分块打分"""
+    return predict_columns(_worker_entry, columns)
+
+
+def _frame_columns(chunk):
+    """分块可以是规范化后的DataFrame或按列的数组字典；DataFrame转换为紧凑的数组再发送给工作进程"""
+    if isinstance(chunk, dict):
+        return chunk
+    return raw_columns_from_frame(chunk)
+
+
+def _slice_columns(columns, begin, end):
+    return {col: values[begin:end] for col, values in columns.items()}
+
+
+class ParallelScorer:
+    """多进程批量打分：输入按行分块分发到进程池，每个工作进程启动时加载一次模型，结果按输入顺序返回"""
+
+    def __init__(self, model_file, models_dir="models", workers=None, chunk_rows=DEFAULT_CHUNK_ROWS,
+                 artifacts_dir=DEFAULT_ARTIFACTS_DIR, tree_engine=DEFAULT_TREE_ENGINE, threads_per_worker=1):
+        if chunk_rows <= 0:
+            raise ValueError(f"分块行数必须为正数，当前为 {chunk_rows}")
+        self.model_file = model_file
+        self.models_dir = models_dir
+        # 创建时模型文件的版本标记，文件被替换后共享进程池据此重建
+        self.version = source_version(models_dir, model_file)
+        self.workers = workers or default_workers()
+        if self.workers <= 0:
+            raise ValueError(f"工作进程数必须为正数，当前为 {self.workers}")
+        self.chunk_rows = chunk_rows
+        self.artifacts_dir = artifacts_dir
+        self.tree_engine = tree_engine
+        self.threads_per_worker = threads_per_worker
+        self.max_pending = self.workers * MAX_PENDING_PER_WORKER
+        self.start_seconds = None
+        self.worker_sources = []
+        self.chunks = 0
+        self.rows = 0
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """启动进程池并等待所有工作进程加载完模型，返回启动耗时（秒）"""
+        with self._lock:
+            if self._executor is not None:
+                return self.start_seconds
+            start = time.perf_counter()
+            # 使用 spawn 启动：Streamlit 等多线程进程中 fork 不安全，新进程也不会继承父进程已加载的模型
+            context = multiprocessing.get_context('spawn')
+            barrier = context.Barrier(self.workers)
+            executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=context, initializer=_init_worker,
+                initargs=(self.models_dir, self.model_file, self.artifacts_dir, self.tree_engine,
+                          self.threads_per_worker, barrier))
+            try:
+                # spawn 方式下进程按需创建：一次提交与进程数相同的预热任务，所有进程都启动并加载完模型后才返回
+                futures = [executor.submit(_worker_info) for _ in range(self.workers)]
+                infos = [future.result() for future in futures]
+            except (BrokenProcessPool, threading.BrokenBarrierError):
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise ValueError(f"工作进程加载模型 {self.model_file} 失败")
+            self._executor = executor
+            self.worker_sources = sorted({info['source'] for info in infos})
+            self.start_seconds = time.perf_counter() - start
+            return self.start_seconds
+
+    def close(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True, cancel_futures=True)
+                self._executor = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _split(self, chunks):
+        """把输入分块再按 chunk_rows 切分为发送给工作进程的任务"""
+        for chunk in chunks:
+            columns = _frame_columns(chunk)
+            n_rows = len(columns[RAW_FEATURE_COLUMNS[0]])
+            if n_rows <= self.chunk_rows:
+                yield columns
+                continue
+            for begin in range(0, n_rows, self.chunk_rows):
+                yield _slice_columns(columns, begin, min(begin + self.chunk_rows, n_rows))
+
+    def imap(self, chunks):
+        """流式打分：chunks 为规范化后的DataFrame或按列数组的可迭代对象，按输入顺序逐块产出预测值，
+        同时在途的分块不超过 workers * MAX_PENDING_PER_WORKER 个"""
+        self.start()
+        pending = deque()
+        try:
+            for columns in self._split(chunks):
+                if len(pending) >= self.max_pending:
+                    yield self._collect(pending.popleft())
+                pending.append(self._executor.submit(_score_chunk, columns))
+            while pending:
+                yield self._collect(pending.popleft())
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def _collect(self, future):
+        predictions = future.result()
+        self.chunks += 1
+        self.rows += len(predictions)
+        return predictions
+
+    def predict_columns(self, columns):
+        """对按列存放的原始输入打分，返回与输入等长的预测值"""
+        n_rows = len(columns[RAW_FEATURE_COLUMNS[0]])
+        out = np.empty(n_rows)
+        offset = 0
+        for predictions in self.imap([columns]):
+            out[offset:offset + len(predictions)] = predictions
+            offset += len(predictions)
+        return out
+
+    def predict_frame(self, raw_df):
+        """对规范化后的原始输入表打分"""
+        return self.predict_columns(raw_columns_from_frame(raw_df))
+
+    def stats(self):
+        return {
+            '模型文件': self.model_file,
+            '工作进程数': self.workers,
+            '分块行数': self.chunk_rows,
+            '模型加载来源': '/'.join(self.worker_sources),
+            '启动耗时(s)': round(self.start_seconds, 3) if self.start_seconds is not None else None,
+            '已处理分块': self.chunks,
+            '已处理行数': self.rows,
+        }
+
+
+_scorer = None
+_scorer_lock = threading.Lock()
+
+
+def get_parallel_scorer(model_file, models_dir="models", workers=None, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """获取进程内共享的打分进程池；模型、模型文件版本或进程数变化时关闭旧进程池再创建新的"""
+    global _scorer
+    workers = workers or default_workers()
+    version = source_version(models_dir, model_file)
+    with _scorer_lock:
+        if _scorer is not None and (_scorer.model_file, _scorer.models_dir, _scorer.version, _scorer.workers) != \
+                (model_file, models_dir, version, workers):
+            _scorer.close()
+            _scorer = None
+        if _scorer is None:
+            _scorer = ParallelScorer(model_file, models_dir, workers, chunk_rows)
+        _scorer.chunk_rows = chunk_rows
+        return _scorer
+
+
+def _close_scorer():
+    if _scorer is not None:
+        _scorer.close()
+
+
+atexit.register(_close_scorer)
+
+
+def benchmark(model_file, models_dir="models", rows=1_000_000, workers_list=(1, 2, 4), chunk_rows=DEFAULT_CHUNK_ROWS,
+              repeat=3, seed=0):
+    """比较进程内单线程打分与不同工作进程数的吞吐量，返回每种配置的结果"""
+    columns = raw_columns_from_frame(sample_raw_frame(rows, seed))
+    entry = get_registry(models_dir).get(model_file)
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        reference = predict_columns(entry, columns)
+        timings.append(time.perf_counter() - start)
+    baseline = rows / min(timings)
+    results = [{'workers': 0, 'start_seconds': 0.0, 'rows_per_second': baseline, 'speedup': 1.0,
+                'max_abs_diff': 0.0}]
+
+    for workers in workers_list:
+        with ParallelScorer(model_file, models_dir, workers, chunk_rows) as scorer:
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                predictions = scorer.predict_columns(columns)
+                timings.append(time.perf_counter() - start)
+        throughput = rows / min(timings)
+        results.append({
+            'workers': workers,
+            'start_seconds': scorer.start_seconds,
+            'rows_per_second': throughput,
+            'speedup': throughput / baseline,
+            'max_abs_diff': float(np.max(np.abs(predictions - reference))),
+        })
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="多进程批量打分基准测试：比较进程内打分与不同工作进程数的吞吐量")
+    parser.add_argument('--models-dir', default="models", help="模型文件目录")
+    parser.add_argument('--model', action='append', help="只测试指定的模型文件，可重复指定，默认测试默认模型")
+    parser.add_argument('--rows', type=int, default=1_000_000, help="随机生成的输入行数")
+    parser.add_argument('--workers', type=int, nargs='+', help="要测试的工作进程数，默认从1翻倍到CPU核数")
+    parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS, help="每个分块的行数")
+    parser.add_argument('--repeat', type=int, default=3, help="每种配置重复次数，取最快一次")
+    args = parser.parse_args(argv)
+
+    workers_list = args.workers
+    if not workers_list:
+        workers_list = [1]
+        while workers_list[-1] * 2 <= default_workers():
+            workers_list.append(workers_list[-1] * 2)
+        if workers_list[-1] != default_workers():
+            workers_list.append(default_workers())
+
+    model_files = args.model or [default_model(available_models(args.models_dir))]
+    for model_file in model_files:
+        print(f"{model_file}: {args.rows:,} 行，分块 {args.chunk_rows:,} 行，CPU核数 {default_workers()}")
+        for result in benchmark(model_file, args.models_dir, args.rows, workers_list, args.chunk_rows, args.repeat):
+            label = "进程内" if result['workers'] == 0 else f"{result['workers']} 进程"
+            print(f"  {label:>8}: {result['rows_per_second']:>14,.0f} 行/秒，加速比 {result['speedup']:.2f}x，"
+                  f"启动 {result['start_seconds']:.2f} s，最大误差 {result['max_abs_diff']:.1e}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,243 @@
+import atexit
+import bisect
+import os
+import threading
+import time
+
+# 直方图桶上界（秒），与 Prometheus 的 le 标签对应，覆盖几十微秒到十秒
+DEFAULT_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0)
+METRIC_NAME = "accident_stage_duration_seconds"
+DEFAULT_EXPORT_PATH = os.path.join("metrics", "accident_app.prom")
+# 后台导出指标文件的间隔（秒）
+DEFAULT_EXPORT_INTERVAL = 15.0
+
+# 阶段名 -> 面板中显示的名称，未列出的阶段直接显示阶段名
+STAGE_LABELS = {
+    'db_connect': '数据库连接',
+    'feature_metadata': '特征元数据查询',
+    'model_load': '模型加载',
+    'risk_table_lookup': '风险表查表',
+    'cache_lookup': '预测缓存查询',
+    'feature_encode': '特征构造与缩放',
+    'predict': '模型预测',
+    'prediction_log': '预测记录入队',
+    'prediction_log_write': '预测记录写库(批)',
+    'prediction_total': '单条预测总耗时',
+    'batch_predict': '批量预测',
+    'chart_render': '图表加载',
+    'training_stats': '训练数据统计',
+    'sensitivity_sweep': '敏感性分析',
+    'model_compare': '多模型对比',
+    'explain': '逐条解释',
+    'service_predict': '服务单条预测',
+    'service_batch': '服务批量预测',
+}
+
+
+class Histogram:
+    """固定桶的耗时直方图，记录次数、总和与最大值"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        # 最后一个桶为 +Inf
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q):
+        """按桶内线性插值估计分位数（秒）"""
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            if count and cumulative + count >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.max
+                return min(lower + (upper - lower) * (rank - cumulative) / count, self.max)
+            cumulative += count
+        return self.max
+
+
+class _Span:
+    """计时区间：退出时把耗时记入对应阶段的直方图"""
+
+    __slots__ = ('metrics', 'stage', 'start')
+
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+class _NoopSpan:
+    """关闭监控时使用的空区间，不计时也不加锁"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class StageMetrics:
+    """按阶段聚合的耗时直方图，进程内所有会话共享；关闭时 span() 返回空区间，开销可忽略"""
+
+    def __init__(self, enabled=True, buckets=DEFAULT_BUCKETS):
+        self.enabled = enabled
+        self.buckets = tuple(buckets)
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+
+    def span(self, stage):
+        """以上下文管理器的方式记录一个阶段的耗时"""
+        if not self.enabled:
+            return _NOOP_SPAN
+        return _Span(self, stage)
+
+    def observe(self, stage, seconds):
+        """记录一个已知耗时（秒），例如模型注册表统计的加载耗时"""
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def reset(self):
+        with self._lock:
+            self._histograms = {}
+            self.started_at = time.time()
+
+    def _snapshot(self):
+        with self._lock:
+            return {stage: (list(h.counts), h.count, h.sum, h.max, h.quantile(0.5), h.quantile(0.95),
+                            h.quantile(0.99))
+                    for stage, h in self._histograms.items()}
+
+    def stats(self):
+        """每个阶段的次数、平均值、估计的 p50/p95/p99 和最大值（毫秒），用于侧边栏面板"""
+        rows = []
+        for stage, (_, count, total, maximum, p50, p95, p99) in sorted(self._snapshot().items()):
+            rows.append({
+                '阶段': STAGE_LABELS.get(stage, stage),
+                '次数': count,
+                '平均(ms)': round(total / count * 1000, 3) if count else 0.0,
+                'P50(ms)': round(p50 * 1000, 3),
+                'P95(ms)': round(p95 * 1000, 3),
+                'P99(ms)': round(p99 * 1000, 3),
+                '最大(ms)': round(maximum * 1000, 3),
+            })
+        return rows
+
+    def prometheus_text(self):
+        """Prometheus 文本格式的直方图"""
+        lines = [
+            f"# HELP {METRIC_NAME} Duration of prediction pipeline stages in seconds.",
+            f"# TYPE {METRIC_NAME} histogram",
+        ]
+        for stage, (counts, count, total, _, _, _, _) in sorted(self._snapshot().items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{METRIC_NAME}_bucket{{stage="{stage}",le="{bound:g}"}} {cumulative}')
+            lines.append(f'{METRIC_NAME}_bucket{{stage="{stage}",le="+Inf"}} {count}')
+            lines.append(f'{METRIC_NAME}_sum{{stage="{stage}"}} {total:.9g}')
+            lines.append(f'{METRIC_NAME}_count{{stage="{stage}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path=DEFAULT_EXPORT_PATH):
+        """写出 Prometheus 文本文件（供 node_exporter textfile collector 采集），先写临时文件再替换"""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+        return path
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics():
+    """获取进程内共享的阶段耗时统计"""
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = StageMetrics()
+        return _metrics
+
+
+class PrometheusExporter:
+    """后台线程按固定间隔写出 Prometheus 文本文件，页面渲染不再写盘"""
+
+    def __init__(self, metrics, path=DEFAULT_EXPORT_PATH, interval=DEFAULT_EXPORT_INTERVAL):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self.exports = 0
+        self.last_export_at = None
+        self.last_error = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="metrics-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self):
+        """立即写出一次指标文件，失败时记录错误而不抛出"""
+        try:
+            self.metrics.write_prometheus(self.path)
+        except OSError as e:
+            self.last_error = str(e)
+            return False
+        self.exports += 1
+        self.last_export_at = time.time()
+        self.last_error = None
+        return True
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.export()
+
+    def stop(self, timeout=5.0):
+        """停止后台线程，并写出最后一次指标"""
+        self._stop.set()
+        self._thread.join(timeout)
+        self.export()
+
+
+_exporter = None
+_exporter_lock = threading.Lock()
+
+
+def get_prometheus_exporter(**kwargs):
+    """获取进程内共享的指标文件导出线程（供 node_exporter textfile collector 采集），进程退出时写出最后一次指标"""
+    global _exporter
+    with _exporter_lock:
+        if _exporter is None:
+            _exporter = PrometheusExporter(get_metrics(), **kwargs)
+            atexit.register(_exporter.stop)
+        return _exporter
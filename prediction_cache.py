@@ -0,0 +1,99 @@
+import threading
+from collections import OrderedDict
+
+from feature_pipeline import BOOLEAN_COLUMNS, CATEGORICAL_OPTIONS, RAW_FEATURE_COLUMNS
+
+DEFAULT_MAX_ENTRIES = 50000
+
+
+def canonical_input(input_features):
+    """将表单输入规范化为可哈希的元组，数值统一类型以保证相同输入得到相同键"""
+    key = []
+    for col in RAW_FEATURE_COLUMNS:
+        value = input_features[col]
+        if col in CATEGORICAL_OPTIONS:
+            key.append(str(value))
+        elif col in BOOLEAN_COLUMNS:
+            key.append(bool(value))
+        else:
+            key.append(round(float(value), 6))
+    return tuple(key)
+
+
+class PredictionCache:
+    """预测结果LRU缓存，键为 (模型文件, 模型版本, 规范化输入, 结果类型)；模型文件变化后旧结果不会再命中。
+    结果类型区分预测值与逐条解释等随预测一起缓存的结果"""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _key(entry, input_features, kind):
+        return entry.filename, entry.version, canonical_input(input_features), kind
+
+    def get(self, entry, input_features, kind='prediction'):
+        """查找缓存的预测值（或 kind 指定的其他结果），未命中返回None"""
+        key = self._key(entry, input_features, kind)
+        with self._lock:
+            prediction = self._entries.get(key)
+            if prediction is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return prediction
+
+    def put(self, entry, input_features, prediction, kind='prediction'):
+        """写入预测值（或 kind 指定的其他结果），超过容量时淘汰最久未使用的结果"""
+        key = self._key(entry, input_features, kind)
+        with self._lock:
+            self._entries[key] = prediction
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate_model(self, filename):
+        """删除指定模型文件的所有缓存结果"""
+        with self._lock:
+            stale = [key for key in self._entries if key[0] == filename]
+            for key in stale:
+                del self._entries[key]
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            size = len(self._entries)
+        lookups = self.hits + self.misses
+        return {
+            'size': size,
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_prediction_cache(registry=None, **kwargs):
+    """获取进程内共享的预测结果缓存，并在模型文件变化时清除该模型的缓存结果"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = PredictionCache(**kwargs)
+            if registry is not None:
+                registry.add_reload_listener(_cache.invalidate_model)
+        return _cache
@@ -0,0 +1,236 @@
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+
+from perf_metrics import get_metrics
+
+DEFAULT_BATCH_SIZE = 200
+# 未攒满一批时最长等待多久写入一次（秒）
+DEFAULT_FLUSH_INTERVAL = 1.0
+# 内存队列上限，写满后新记录溢写到磁盘
+DEFAULT_MAX_QUEUE = 10000
+DEFAULT_SPILL_PATH = os.path.join("spill", "web_predictions.jsonl")
+# 当前生效模型ID的缓存时间（秒）
+DEFAULT_CONFIG_TTL = 60
+
+INSERT_SQL = """
+    INSERT INTO web_predictions
+    (model_config_id, input_features, predicted_risk, risk_level, session_id)
+    VALUES (%s, %s, %s, %s, %s)
+"""
+
+
+class PredictionLogger:
+    """预测记录后台写入队列：请求线程只入队，后台线程按批次 executemany 写入数据库"""
+
+    def __init__(self, pool, batch_size=DEFAULT_BATCH_SIZE, flush_interval=DEFAULT_FLUSH_INTERVAL,
+                 max_queue=DEFAULT_MAX_QUEUE, spill_path=DEFAULT_SPILL_PATH,
+                 config_ttl=DEFAULT_CONFIG_TTL):
+        self.pool = pool
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spill_path = spill_path
+        self.config_ttl = config_ttl
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._spill_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._model_config_id = None
+        self._model_config_loaded_at = 0.0
+        self._listeners = []
+
+        # 统计信息
+        self.enqueued = 0
+        self.written = 0
+        self.spilled = 0
+        self.dropped = 0
+        self.failed_batches = 0
+        # 溢写文件中无法解析的行数，这些行移到隔离文件中
+        self.quarantined = 0
+        self.last_error = None
+
+        self._thread = threading.Thread(target=self._run, name="prediction-logger", daemon=True)
+        self._thread.start()
+
+    def log(self, input_features, predicted_risk, risk_level, session_id):
+        """记录一次预测，不访问数据库；返回 'queued'、'spilled' 或 'dropped'"""
+        row = {
+            'input_features': json.dumps(input_features),
+            'predicted_risk': float(predicted_risk),
+            'risk_level': risk_level,
+            'session_id': session_id,
+        }
+        try:
+            self._queue.put_nowait(row)
+            self.enqueued += 1
+            return 'queued'
+        except queue.Full:
+            return 'spilled' if self._spill([row]) else 'dropped'
+
+    def _spill(self, rows):
+        """数据库写入跟不上时把记录追加到磁盘文件，未配置溢写文件或写盘失败则丢弃"""
+        if self.spill_path:
+            try:
+                with self._spill_lock:
+                    os.makedirs(os.path.dirname(self.spill_path) or '.', exist_ok=True)
+                    with open(self.spill_path, 'a', encoding='utf-8') as f:
+                        for row in rows:
+                            f.write(json.dumps(row, ensure_ascii=False) + '\n')
+                self.spilled += len(rows)
+                return True
+            except OSError:
+                pass
+        self.dropped += len(rows)
+        return False
+
+    def _active_model_config_id(self, cursor):
+        """查询当前生效的模型配置ID，结果缓存 config_ttl 秒"""
+        now = time.monotonic()
+        if self._model_config_id is None or now - self._model_config_loaded_at > self.config_ttl:
+            cursor.execute("SELECT id FROM model_configs WHERE is_active = TRUE")
+            result = cursor.fetchone()
+            self._model_config_id = result[0] if result else 1
+            self._model_config_loaded_at = now
+        return self._model_config_id
+
+    def _write(self, rows):
+        """批量写入数据库"""
+        with get_metrics().span('prediction_log_write'), self.pool.connection() as conn:
+            cursor = conn.cursor()
+            model_config_id = self._active_model_config_id(cursor)
+            cursor.executemany(INSERT_SQL, [
+                (model_config_id, row['input_features'], row['predicted_risk'],
+                 row['risk_level'], row['session_id'])
+                for row in rows
+            ])
+            conn.commit()
+            cursor.close()
+        self.written += len(rows)
+        for listener in self._listeners:
+            listener(len(rows))
+
+    def add_listener(self, listener):
+        """注册写入成功的回调，参数为本批写入的记录数"""
+        self._listeners.append(listener)
+
+    def _flush(self, rows):
+        """写入一批记录，失败（数据库错误或其他异常）时整批溢写到磁盘"""
+        try:
+            self._write(rows)
+            return True
+        except Exception as e:
+            self.failed_batches += 1
+            self.last_error = str(e)
+            self._spill(rows)
+            return False
+
+    def _replay_path(self):
+        return self.spill_path + '.replay'
+
+    def _read_replay(self, replay_path):
+        """读取待补写的记录；无法解析的行（如进程中断时写了一半的最后一行）追加到 .bad 隔离文件后跳过"""
+        rows = []
+        bad_lines = []
+        with open(replay_path, encoding='utf-8', errors='replace') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    bad_lines.append(line if line.endswith('\n') else line + '\n')
+                    continue
+                if isinstance(row, dict):
+                    rows.append(row)
+                else:
+                    bad_lines.append(line)
+        if bad_lines:
+            with open(self.spill_path + '.bad', 'a', encoding='utf-8') as f:
+                f.writelines(bad_lines)
+            self.quarantined += len(bad_lines)
+        return rows
+
+    def _replay_spill(self):
+        """数据库恢复后把磁盘上溢写的记录补写回数据库；上次补写中断时留下的 .replay 文件优先补写"""
+        if not self.spill_path:
+            return
+        replay_path = self._replay_path()
+        with self._spill_lock:
+            if not os.path.exists(replay_path):
+                if not os.path.exists(self.spill_path):
+                    return
+                os.replace(self.spill_path, replay_path)
+        rows = self._read_replay(replay_path)
+        self.spilled = max(self.spilled - len(rows), 0)
+        for i in range(0, len(rows), self.batch_size):
+            if not self._flush(rows[i:i + self.batch_size]):
+                # 写入失败的批次已重新溢写，剩余部分也放回磁盘等待下次补写
+                self._spill(rows[i + self.batch_size:])
+                break
+        os.remove(replay_path)
+
+    def _run(self):
+        """后台线程：攒满 batch_size 条或等待超过 flush_interval 即写入一次；单次出错只记录错误，线程继续运行"""
+        if self.spill_path and os.path.exists(self._replay_path()):
+            # 上次进程在补写过程中退出
+            self._run_step(self._replay_spill)
+        while not self._stop.is_set() or not self._queue.empty():
+            self._run_step(self._write_next_batch)
+
+    def _run_step(self, step):
+        try:
+            step()
+        except Exception as e:
+            self.last_error = str(e)
+
+    def _write_next_batch(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        if batch and self._flush(batch):
+            self._replay_spill()
+
+    def stop(self, timeout=5.0):
+        """停止后台线程，写完队列中剩余的记录"""
+        self._stop.set()
+        self._thread.join(timeout)
+
+    def pending(self):
+        """队列中等待写入的记录数"""
+        return self._queue.qsize()
+
+    def stats(self):
+        return {
+            'pending': self.pending(),
+            'enqueued': self.enqueued,
+            'written': self.written,
+            'spilled': self.spilled,
+            'dropped': self.dropped,
+            'failed_batches': self.failed_batches,
+            'quarantined': self.quarantined,
+            'last_error': self.last_error,
+        }
+
+
+_logger = None
+_logger_lock = threading.Lock()
+
+
+def get_prediction_logger(pool, **kwargs):
+    """获取进程内共享的预测记录队列，进程退出时写完剩余记录"""
+    global _logger
+    with _logger_lock:
+        if _logger is None:
+            _logger = PredictionLogger(pool, **kwargs)
+            atexit.register(_logger.stop)
+        return _logger
@@ -0,0 +1,465 @@
+import argparse
+import json
+import multiprocessing
+import os
+import pickle
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from db_pool import get_pool
+from feature_pipeline import (BOOLEAN_COLUMNS, CATEGORICAL_OPTIONS, DEFAULT_FEATURE_SPEC, FEATURE_SPECS,
+                              RAW_FEATURE_COLUMNS, compile_encoder, predict_matrix)
+from model_artifacts import DEFAULT_ARTIFACTS_DIR, export_model, scaler_filename_for
+from parallel_scoring import default_workers
+from training_stats import DEFAULT_HOLDOUT_FRACTION, TARGET_COLUMN, TRAINING_TABLE, holdout_condition
+
+# 每次从服务端游标取回的行数，只有这一块原始行驻留在内存中
+DEFAULT_FETCH_ROWS = 50000
+DEFAULT_VALIDATION_FRACTION = DEFAULT_HOLDOUT_FRACTION
+DEFAULT_SEED = 42
+# 流式读取时附带的留出集标记列
+HOLDOUT_COLUMN = 'holdout'
+
+# 模型类型 -> 模型文件名前缀，前缀经 infer_model_type 可推回模型类型
+MODEL_FILE_PREFIXES = {
+    'lightgbm': 'lightgbm',
+    'xgboost': 'xgboost',
+    'ridge': 'ridge_regression',
+    'lasso': 'lasso_regression',
+    'linear_regression': 'linear_regression',
+    'random_forest': 'random_forest',
+}
+# 默认重新训练的模型，与 models/ 中现有的模型一致
+DEFAULT_CANDIDATES = ['lightgbm', 'xgboost', 'ridge', 'lasso', 'linear_regression']
+# 训练时需要标准化特征的模型，缩放器与模型一起保存
+SCALED_MODEL_TYPES = ['linear_regression', 'ridge', 'lasso']
+
+# model_configs 表中可能使用的列名，只写入表中存在的列
+CONFIG_NAME_COLUMNS = ['model_name', 'name']
+CONFIG_TYPE_COLUMNS = ['model_type', 'algorithm']
+CONFIG_FILE_COLUMNS = ['model_file', 'model_path', 'file_path']
+CONFIG_VERSION_COLUMNS = ['version', 'model_version']
+CONFIG_PARAMS_COLUMNS = ['parameters', 'hyperparameters', 'params', 'config']
+
+_TRUE_TEXT = ['1', 'true', 'yes', 'y', '是']
+_FALSE_TEXT = ['0', 'false', 'no', 'n', '否']
+
+
+def create_candidate(model_type, threads=1, seed=DEFAULT_SEED):
+    """创建候选模型，超参数与 models/ 中现有模型的训练参数一致"""
+    if model_type == 'lightgbm':
+        from lightgbm import LGBMRegressor
+        return LGBMRegressor(n_estimators=200, learning_rate=0.1, num_leaves=63, subsample=0.8, reg_alpha=0.1,
+                             random_state=seed, n_jobs=threads, verbose=-1)
+    if model_type == 'xgboost':
+        from xgboost import XGBRegressor
+        return XGBRegressor(n_estimators=200, learning_rate=0.1, max_depth=6, subsample=0.8,
+                            random_state=seed, n_jobs=threads)
+    if model_type == 'random_forest':
+        from sklearn.ensemble import RandomForestRegressor
+        return RandomForestRegressor(n_estimators=100, min_samples_leaf=5, random_state=seed, n_jobs=threads)
+    if model_type == 'ridge':
+        from sklearn.linear_model import Ridge
+        return Ridge(alpha=10.0, max_iter=10000, random_state=seed)
+    if model_type == 'lasso':
+        from sklearn.linear_model import Lasso
+        return Lasso(alpha=0.001, max_iter=10000, random_state=seed)
+    if model_type == 'linear_regression':
+        from sklearn.linear_model import LinearRegression
+        return LinearRegression()
+    raise ValueError(f"不支持的模型类型 {model_type}，可选值为 {list(MODEL_FILE_PREFIXES)}")
+
+
+def _category_codes(column, raw):
+    """分类字段转换为可选值下标（int8）"""
+    text = np.asarray([str(value).strip().lower() for value in raw])
+    codes = np.full(len(text), -1, dtype=np.int8)
+    for i, option in enumerate(CATEGORICAL_OPTIONS[column]):
+        codes[text == option] = i
+    if (codes < 0).any():
+        raise ValueError(f"字段 {column} 存在无效取值: {sorted(set(text[codes < 0]))[:5]}，"
+                         f"可选值为 {CATEGORICAL_OPTIONS[column]}")
+    return codes
+
+
+def _bool_codes(column, raw):
+    """布尔字段转换为0/1（int8），兼容 TINYINT 和字符串两种存储方式"""
+    values = np.asarray(raw)
+    if values.dtype.kind in 'biuf':
+        return (values != 0).astype(np.int8)
+    text = np.char.lower(np.char.strip(values.astype(str)))
+    invalid = ~np.isin(text, _TRUE_TEXT + _FALSE_TEXT)
+    if invalid.any():
+        raise ValueError(f"字段 {column} 存在无法识别的布尔值: {sorted(set(text[invalid]))[:5]}")
+    return np.isin(text, _TRUE_TEXT).astype(np.int8)
+
+
+def _numeric_values(column, raw):
+    values = np.asarray(raw, dtype=np.float32)
+    if np.isnan(values).any():
+        raise ValueError(f"字段 {column} 存在空值")
+    return values
+
+
+def rows_to_columns(rows):
+    """一块数据库行转换为紧凑的按列数组：分类字段为可选值下标，布尔字段和留出集标记为0/1，数值字段为float32"""
+    columns = {}
+    for column, raw in zip(RAW_FEATURE_COLUMNS + [TARGET_COLUMN, HOLDOUT_COLUMN], zip(*rows)):
+        if column == HOLDOUT_COLUMN:
+            columns[column] = np.asarray(raw, dtype=np.int8)
+        elif column in CATEGORICAL_OPTIONS:
+            columns[column] = _category_codes(column, raw)
+        elif column in BOOLEAN_COLUMNS:
+            columns[column] = _bool_codes(column, raw)
+        else:
+            columns[column] = _numeric_values(column, raw)
+    return columns
+
+
+class TrainingArrays:
+    """按列累积的训练数据，按预计行数预分配，超出时成倍扩容"""
+
+    def __init__(self, capacity=0):
+        self.rows = 0
+        self.columns = None
+        self._capacity = max(capacity, 1)
+
+    def append(self, chunk):
+        n = len(chunk[TARGET_COLUMN])
+        if self.columns is None:
+            self.columns = {col: np.empty(self._capacity, dtype=values.dtype) for col, values in chunk.items()}
+        if self.rows + n > self._capacity:
+            self._capacity = max(self._capacity * 2, self.rows + n)
+            for col, values in self.columns.items():
+                grown = np.empty(self._capacity, dtype=values.dtype)
+                grown[:self.rows] = values[:self.rows]
+                self.columns[col] = grown
+        for col, values in chunk.items():
+            self.columns[col][self.rows:self.rows + n] = values
+        self.rows += n
+
+    def finish(self):
+        """去掉预分配的空余部分，返回按列数组"""
+        if self.columns is None:
+            return {}
+        return {col: values[:self.rows] for col, values in self.columns.items()}
+
+
+def stream_training_data(pool, fetch_rows=DEFAULT_FETCH_ROWS, limit=None,
+                         validation_fraction=DEFAULT_VALIDATION_FRACTION, where=None):
+    """用非缓冲（服务端）游标分块读取 training_data，每块转换为紧凑数组后产出，附带留出集标记"""
+    query = (f"SELECT {', '.join(RAW_FEATURE_COLUMNS + [TARGET_COLUMN])}, "
+             f"{holdout_condition(validation_fraction)} AS {HOLDOUT_COLUMN} FROM {TRAINING_TABLE}")
+    if where:
+        query += f" WHERE {where}"
+    if limit:
+        query += f" LIMIT {int(limit)}"
+    connection = pool.acquire()
+    broken = True
+    try:
+        # 连接池的连接默认缓冲整个结果集，这里显式使用非缓冲游标逐块读取
+        cursor = connection.cursor(buffered=False)
+        cursor.execute(query)
+        while True:
+            rows = cursor.fetchmany(fetch_rows)
+            if not rows:
+                break
+            yield rows_to_columns(rows)
+        cursor.close()
+        broken = False
+    finally:
+        # 中途退出时结果集没有读完，连接不能再复用
+        pool.release(connection, broken)
+
+
+def load_training_arrays(pool, fetch_rows=DEFAULT_FETCH_ROWS, limit=None,
+                         validation_fraction=DEFAULT_VALIDATION_FRACTION, progress=None):
+    """流式读取全部训练数据，返回按列数组"""
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT COUNT(*) FROM {TRAINING_TABLE}")
+        expected = cursor.fetchone()[0]
+        cursor.close()
+    if limit:
+        expected = min(expected, limit)
+
+    arrays = TrainingArrays(expected)
+    for chunk in stream_training_data(pool, fetch_rows, limit, validation_fraction):
+        arrays.append(chunk)
+        if progress is not None:
+            progress(arrays.rows, expected)
+    return arrays.finish()
+
+
+def _init_worker(threads):
+    """训练进程初始化：限制原生库的线程数，多个模型并行训练时互不争抢CPU"""
+    os.environ['OMP_NUM_THREADS'] = str(threads)
+
+
+def _metrics(target, predictions):
+    errors = predictions - target
+    mse = float(np.mean(errors ** 2))
+    variance = float(np.var(target))
+    return {
+        'mse': mse,
+        'mae': float(np.mean(np.abs(errors))),
+        'r2': 1.0 - mse / variance if variance > 0 else 0.0,
+    }
+
+
+def _json_params(model):
+    """可写入 JSON 的超参数"""
+    params = model.get_params() if hasattr(model, 'get_params') else {}
+    return {key: value for key, value in params.items()
+            if isinstance(value, (bool, int, float, str)) and not (isinstance(value, float) and np.isnan(value))}
+
+
+def _write_pickle(obj, path):
+    """先写临时文件再替换，模型注册表不会读到写了一半的文件"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(obj, f)
+    os.replace(tmp_path, path)
+
+
+def train_model(model_type, data_dir, models_dir, version, threads=1, seed=DEFAULT_SEED):
+    """训练一个候选模型：用与推理相同的特征定义编码内存映射的训练数组，拟合后写出版本化的模型文件"""
+    start = time.perf_counter()
+    columns = {col: np.load(os.path.join(data_dir, f"{col}.npy"), mmap_mode='r')
+               for col in RAW_FEATURE_COLUMNS + [TARGET_COLUMN, HOLDOUT_COLUMN]}
+    target = np.asarray(columns.pop(TARGET_COLUMN), dtype=np.float64)
+    # 留出集由主键决定，与模型评估使用的划分一致
+    validation = np.asarray(columns.pop(HOLDOUT_COLUMN)) != 0
+    train = ~validation
+    encoder = compile_encoder(model_type)
+    features = encoder.encode_columns(columns)
+
+    scaler = None
+    if model_type in SCALED_MODEL_TYPES:
+        from sklearn.preprocessing import StandardScaler
+        scaler = StandardScaler().fit(features[train])
+        features = scaler.transform(features).astype(encoder.dtype)
+
+    model = create_candidate(model_type, threads, seed)
+    fit_kwargs = {}
+    if model_type == 'lightgbm':
+        # 与现有模型一样把分类编码列作为 LightGBM 的分类特征
+        spec = FEATURE_SPECS.get(model_type, DEFAULT_FEATURE_SPEC)
+        fit_kwargs['categorical_feature'] = [i for i, (_, op) in enumerate(spec) if op[0] == 'code']
+    fit_start = time.perf_counter()
+    model.fit(features[train], target[train], **fit_kwargs)
+    fit_seconds = time.perf_counter() - fit_start
+
+    metrics = {'train': _metrics(target[train], predict_matrix(model, features[train]))}
+    if validation.any():
+        metrics['validation'] = _metrics(target[validation], predict_matrix(model, features[validation]))
+
+    model_file = f"{MODEL_FILE_PREFIXES[model_type]}_{version}.pkl"
+    # 先写缩放器，模型文件出现时缩放器已经就绪
+    if scaler is not None:
+        _write_pickle(scaler, os.path.join(models_dir, scaler_filename_for(model_file)))
+    _write_pickle(model, os.path.join(models_dir, model_file))
+
+    return {
+        'model_type': model_type,
+        'model_file': model_file,
+        'params': _json_params(model),
+        'rows': {'train': int(train.sum()), 'validation': int(validation.sum())},
+        'metrics': metrics,
+        'fit_seconds': fit_seconds,
+        'seconds': time.perf_counter() - start,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def train_models(model_types, data_dir, models_dir, version, workers=None, seed=DEFAULT_SEED):
+    """并行训练多个候选模型：每个模型一个进程，CPU核数在进程间平均分配；返回 {模型类型: 结果或错误}"""
+    workers = min(workers or default_workers(), len(model_types))
+    threads = max(1, default_workers() // workers)
+    results = {}
+    if workers == 1:
+        _init_worker(threads)
+        for model_type in model_types:
+            try:
+                results[model_type] = train_model(model_type, data_dir, models_dir, version, threads, seed)
+            except (ValueError, MemoryError) as e:
+                results[model_type] = {'model_type': model_type, 'error': str(e)}
+        return results
+
+    # 使用 spawn 启动，训练进程不继承父进程的原生库线程状态；训练数据通过内存映射共享，不复制
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                             initargs=(threads,)) as executor:
+        futures = {model_type: executor.submit(train_model, model_type, data_dir, models_dir, version, threads,
+                                               seed)
+                   for model_type in model_types}
+        for model_type, future in futures.items():
+            try:
+                results[model_type] = future.result()
+            except Exception as e:
+                results[model_type] = {'model_type': model_type, 'error': str(e)}
+    return results
+
+
+def _first_existing(columns, candidates):
+    for column in candidates:
+        if column in columns:
+            return column
+    return None
+
+
+def register_models(pool, results, version, activate=False):
+    """在 model_configs 中为新模型各写入一行，返回 {模型文件: 配置ID}；activate 时新模型替换当前生效的模型"""
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM model_configs LIMIT 0")
+        cursor.fetchall()
+        table_columns = {col[0] for col in cursor.description}
+        name_column = _first_existing(table_columns, CONFIG_NAME_COLUMNS)
+        if name_column is None:
+            cursor.close()
+            raise ValueError(f"model_configs 表缺少模型名称列，可用列为 {sorted(table_columns)}")
+
+        optional = [
+            (_first_existing(table_columns, CONFIG_TYPE_COLUMNS), lambda result: result['model_type']),
+            (_first_existing(table_columns, CONFIG_FILE_COLUMNS), lambda result: result['model_file']),
+            (_first_existing(table_columns, CONFIG_VERSION_COLUMNS), lambda result: version),
+            (_first_existing(table_columns, CONFIG_PARAMS_COLUMNS),
+             lambda result: json.dumps(result.get('params', {}), ensure_ascii=False)),
+        ]
+        optional = [(column, value) for column, value in optional if column is not None]
+        columns = [name_column] + [column for column, _ in optional]
+        if 'is_active' in table_columns:
+            columns.append('is_active')
+
+        conn.start_transaction()
+        if activate and 'is_active' in table_columns:
+            cursor.execute("UPDATE model_configs SET is_active = FALSE WHERE is_active = TRUE")
+        config_ids = {}
+        sql = (f"INSERT INTO model_configs ({', '.join(columns)}) "
+               f"VALUES ({', '.join(['%s'] * len(columns))})")
+        for result in results:
+            row = [os.path.splitext(result['model_file'])[0]] + [value(result) for _, value in optional]
+            if 'is_active' in table_columns:
+                row.append(bool(activate))
+            cursor.execute(sql, row)
+            config_ids[result['model_file']] = cursor.lastrowid
+        conn.commit()
+        cursor.close()
+    return config_ids
+
+
+def retrain(pool, model_types=DEFAULT_CANDIDATES, models_dir="models", artifacts_dir=DEFAULT_ARTIFACTS_DIR,
+            workers=None, fetch_rows=DEFAULT_FETCH_ROWS, limit=None,
+            validation_fraction=DEFAULT_VALIDATION_FRACTION, seed=DEFAULT_SEED, register=True, activate=False,
+            progress=None):
+    """从 training_data 重新训练候选模型，写出版本化的模型文件、导出产物和 model_configs 记录，返回运行报告"""
+    for model_type in model_types:
+        if model_type not in MODEL_FILE_PREFIXES:
+            raise ValueError(f"不支持的模型类型 {model_type}，可选值为 {list(MODEL_FILE_PREFIXES)}")
+    version = time.strftime('v%Y%m%d_%H%M%S')
+    timings = {}
+    start = time.perf_counter()
+
+    columns = load_training_arrays(pool, fetch_rows, limit, validation_fraction, progress)
+    rows = len(columns.get(TARGET_COLUMN, ()))
+    if rows == 0:
+        raise ValueError("training_data 表中没有数据")
+    array_bytes = sum(values.nbytes for values in columns.values())
+    timings['load'] = time.perf_counter() - start
+
+    # 训练数组落盘为 .npy，训练进程以内存映射方式读取，多个进程共享同一份页缓存
+    data_dir = tempfile.mkdtemp(prefix="retrain_")
+    try:
+        for col, values in columns.items():
+            np.save(os.path.join(data_dir, f"{col}.npy"), values)
+        del columns
+        os.makedirs(models_dir, exist_ok=True)
+        step = time.perf_counter()
+        results = train_models(model_types, data_dir, models_dir, version, workers, seed)
+        timings['train'] = time.perf_counter() - step
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    trained = [result for result in results.values() if 'error' not in result]
+    step = time.perf_counter()
+    if artifacts_dir:
+        for result in trained:
+            try:
+                export_model(models_dir, result['model_file'], artifacts_dir)
+                result['artifact'] = True
+            except (OSError, ValueError) as e:
+                result['artifact'] = f"导出失败: {e}"
+    timings['export'] = time.perf_counter() - step
+
+    step = time.perf_counter()
+    if register and trained:
+        for model_file, config_id in register_models(pool, trained, version, activate).items():
+            for result in trained:
+                if result['model_file'] == model_file:
+                    result['config_id'] = config_id
+    timings['register'] = time.perf_counter() - step
+    timings['total'] = time.perf_counter() - start
+
+    return {
+        'version': version,
+        'rows': rows,
+        'array_mb': array_bytes / 1024 / 1024,
+        'results': results,
+        'timings': timings,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'children_peak_rss_mb': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="从 training_data 流式读取数据并行重新训练模型，"
+                                                 "写出版本化的模型文件、导出产物和 model_configs 记录")
+    parser.add_argument('--model', action='append', choices=list(MODEL_FILE_PREFIXES),
+                        help="要训练的模型类型，可重复指定，默认训练 models/ 中已有的五种模型")
+    parser.add_argument('--models-dir', default="models", help="模型文件输出目录")
+    parser.add_argument('--artifacts-dir', default=DEFAULT_ARTIFACTS_DIR, help="导出产物目录")
+    parser.add_argument('--no-export', action='store_true', help="不导出原生/数组格式的产物")
+    parser.add_argument('--workers', type=int, help="并行训练的进程数，默认为CPU核数与模型数中的较小值")
+    parser.add_argument('--fetch-rows', type=int, default=DEFAULT_FETCH_ROWS, help="每次从游标读取的行数")
+    parser.add_argument('--limit', type=int, help="只读取前若干行，用于快速试跑")
+    parser.add_argument('--validation-fraction', type=float, default=DEFAULT_VALIDATION_FRACTION,
+                        help="按主键取模留出作验证集的比例，与 evaluate.py 的留出集一致")
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help="模型的随机种子")
+    parser.add_argument('--no-register', action='store_true', help="不写入 model_configs")
+    parser.add_argument('--activate', action='store_true', help="把新模型设为生效模型，替换当前生效的模型")
+    args = parser.parse_args(argv)
+
+    def progress(done, expected):
+        print(f"\r已读取 {done:,} / {expected:,} 行", end='', flush=True)
+
+    report = retrain(get_pool(), args.model or DEFAULT_CANDIDATES, args.models_dir,
+                     None if args.no_export else args.artifacts_dir, args.workers, args.fetch_rows, args.limit,
+                     args.validation_fraction, args.seed, not args.no_register, args.activate, progress)
+    print()
+    timings = report['timings']
+    print(f"版本 {report['version']}: {report['rows']:,} 行，训练数组 {report['array_mb']:.1f} MB；"
+          f"读取 {timings['load']:.1f} s，训练 {timings['train']:.1f} s，导出 {timings['export']:.1f} s，"
+          f"登记 {timings['register']:.1f} s，总计 {timings['total']:.1f} s")
+    print(f"峰值内存: 主进程 {report['peak_rss_mb']:.0f} MB，训练进程 {report['children_peak_rss_mb']:.0f} MB")
+    failed = False
+    for result in report['results'].values():
+        if 'error' in result:
+            failed = True
+            print(f"  {result['model_type']}: 训练失败: {result['error']}")
+            continue
+        validation = result['metrics'].get('validation', result['metrics']['train'])
+        print(f"  {result['model_file']}: 拟合 {result['fit_seconds']:.1f} s，峰值内存 {result['peak_rss_mb']:.0f} MB，"
+              f"验证集 MSE {validation['mse']:.6f} MAE {validation['mae']:.4f} R2 {validation['r2']:.4f}"
+              + (f"，配置ID {result['config_id']}" if 'config_id' in result else ""))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
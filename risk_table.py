@@ -0,0 +1,259 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from feature_pipeline import (BOOLEAN_COLUMNS, CATEGORICAL_OPTIONS, RAW_FEATURE_COLUMNS, normalize_raw_frame,
+                              predict_columns, predict_frame)
+from model_registry import available_models, get_registry
+from prediction_cache import canonical_input
+
+DEFAULT_TABLES_DIR = "risk_tables"
+# 每次送入模型的网格点数
+DEFAULT_CHUNK_ROWS = 500000
+# 单个模型的网格点上限，超过时不生成风险表
+DEFAULT_MAX_CELLS = 200_000_000
+# 风险表与实时预测的最大允许误差（风险表以 float32 存储）
+DEFAULT_TOLERANCE = 1e-6
+# 风险表不存在时，间隔多少秒后重新检查（期间 materialize 生成的风险表无需重启进程即可生效）
+MISSING_RECHECK_SECONDS = 30
+
+# 预测表单的离散取值网格
+GRID_VALUES = {
+    'road_type': CATEGORICAL_OPTIONS['road_type'],
+    'num_lanes': list(range(1, 9)),
+    'curvature': [round(i * 0.1, 1) for i in range(11)],
+    'speed_limit': list(range(20, 121)),
+    'lighting': CATEGORICAL_OPTIONS['lighting'],
+    'weather': CATEGORICAL_OPTIONS['weather'],
+    'road_signs_present': [False, True],
+    'public_road': [False, True],
+    'time_of_day': CATEGORICAL_OPTIONS['time_of_day'],
+    'holiday': [False, True],
+    'school_season': [False, True],
+    'num_reported_accidents': list(range(0, 11)),
+}
+
+
+def table_paths(tables_dir, model_filename):
+    """风险表数据文件和清单文件的路径"""
+    stem = os.path.splitext(model_filename)[0]
+    return os.path.join(tables_dir, f"{stem}.npy"), os.path.join(tables_dir, f"{stem}.json")
+
+
+def _json_version(version):
+    """将模型版本标记转换为JSON可比较的形式"""
+    return json.loads(json.dumps(version))
+
+
+def _write_json_atomic(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _grid_columns(axes, flat_index):
+    """把网格平铺下标还原为按列存放的原始输入（分类字段为可选值下标）"""
+    n_rows = len(flat_index)
+    columns = {}
+    # 模型不依赖的字段取网格第一个值，不影响预测结果
+    for col in RAW_FEATURE_COLUMNS:
+        if col in CATEGORICAL_OPTIONS:
+            columns[col] = np.zeros(n_rows, dtype=np.int64)
+        else:
+            columns[col] = np.full(n_rows, float(GRID_VALUES[col][0]))
+    if axes:
+        axis_indices = np.unravel_index(flat_index, [len(values) for _, values in axes])
+        for (field, values), indices in zip(axes, axis_indices):
+            if field in CATEGORICAL_OPTIONS:
+                columns[field] = indices
+            else:
+                columns[field] = np.asarray(values, dtype=np.float64)[indices]
+    return columns
+
+
+def materialize(entry, tables_dir=DEFAULT_TABLES_DIR, chunk_rows=DEFAULT_CHUNK_ROWS,
+                max_cells=DEFAULT_MAX_CELLS, progress=None):
+    """对模型依赖字段的整个离散网格做批量预测，结果写入可内存映射的 .npy 文件"""
+    axes = [(field, GRID_VALUES[field]) for field in entry.encoder.input_fields]
+    shape = [len(values) for _, values in axes]
+    total = int(np.prod(shape)) if shape else 1
+    if total > max_cells:
+        raise ValueError(f"{entry.filename} 的网格点数 {total:,} 超过上限 {max_cells:,}")
+
+    os.makedirs(tables_dir, exist_ok=True)
+    data_path, manifest_path = table_paths(tables_dir, entry.filename)
+    tmp_path = data_path + '.tmp'
+
+    start = time.perf_counter()
+    table = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float32, shape=(total,))
+    # 融合内核不经过特征矩阵，其他模型复用同一块特征矩阵缓冲区
+    features = None if entry.kernel is not None else np.empty(
+        (min(chunk_rows, total), entry.encoder.n_features), dtype=entry.encoder.dtype)
+    for begin in range(0, total, chunk_rows):
+        end = min(begin + chunk_rows, total)
+        columns = _grid_columns(axes, np.arange(begin, end))
+        table[begin:end] = predict_columns(entry, columns, None if features is None else features[:end - begin])
+        if progress:
+            progress(end, total)
+    table.flush()
+    del table
+    # 先删除旧清单再替换数据文件，读取方不会把新数据与旧清单配对
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+    os.replace(tmp_path, data_path)
+
+    manifest = {
+        'model_file': entry.filename,
+        'model_type': entry.model_type,
+        'artifact_version': _json_version(entry.version),
+        'category_codes': entry.encoder.category_codes,
+        'axes': [[field, list(values)] for field, values in axes],
+        'cells': total,
+        'dtype': 'float32',
+        'seconds': round(time.perf_counter() - start, 3),
+        'created_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+    _write_json_atomic(manifest_path, manifest)
+    return manifest
+
+
+class RiskTable:
+    """内存映射的预计算风险表，按编码后的输入做 O(1) 查表"""
+
+    def __init__(self, data_path, manifest):
+        self.manifest = manifest
+        self.model_file = manifest['model_file']
+        self.artifact_version = manifest['artifact_version']
+        self.category_codes = manifest.get('category_codes')
+        self.values = np.load(data_path, mmap_mode='r')
+
+        self._positions = [RAW_FEATURE_COLUMNS.index(field) for field, _ in manifest['axes']]
+        self._lookups = []
+        for field, values in manifest['axes']:
+            self._lookups.append({self._canonical(field, value): i for i, value in enumerate(values)})
+        shape = [len(values) for _, values in manifest['axes']]
+        self._strides = [int(np.prod(shape[i + 1:])) for i in range(len(shape))]
+
+    @staticmethod
+    def _canonical(field, value):
+        if field in CATEGORICAL_OPTIONS:
+            return str(value)
+        if field in BOOLEAN_COLUMNS:
+            return bool(value)
+        return round(float(value), 6)
+
+    def is_current(self, entry):
+        """风险表是否由当前版本的模型文件、按当前的分类编码生成"""
+        return (self.model_file == entry.filename and self.artifact_version == _json_version(entry.version)
+                and self.category_codes == entry.encoder.category_codes)
+
+    def lookup(self, input_features):
+        """查表得到风险值；输入不在网格上时返回None"""
+        key = canonical_input(input_features)
+        index = 0
+        for position, lookup, stride in zip(self._positions, self._lookups, self._strides):
+            i = lookup.get(key[position])
+            if i is None:
+                return None
+            index += i * stride
+        return float(self.values[index])
+
+
+def load_table(entry, tables_dir=DEFAULT_TABLES_DIR):
+    """加载模型对应的风险表；不存在或已过期时返回None"""
+    data_path, manifest_path = table_paths(tables_dir, entry.filename)
+    if not (os.path.exists(data_path) and os.path.exists(manifest_path)):
+        return None
+    with open(manifest_path, encoding='utf-8') as f:
+        manifest = json.load(f)
+    table = RiskTable(data_path, manifest)
+    return table if table.is_current(entry) else None
+
+
+_tables = {}
+_tables_lock = threading.Lock()
+
+
+def get_risk_table(entry, tables_dir=DEFAULT_TABLES_DIR):
+    """获取进程内共享的风险表，按模型文件和版本缓存；不存在时每隔 MISSING_RECHECK_SECONDS 秒重新检查"""
+    key = (entry.filename, entry.version, tables_dir)
+    now = time.monotonic()
+    with _tables_lock:
+        cached = _tables.get(key)
+        if cached is None or (cached[0] is None and now - cached[1] >= MISSING_RECHECK_SECONDS):
+            cached = _tables[key] = (load_table(entry, tables_dir), now)
+        return cached[0]
+
+
+def verify(entry, table, samples=20000, seed=0):
+    """随机抽取表单输入，比较查表结果与实时预测的差异"""
+    rng = np.random.default_rng(seed)
+    raw_df = pd.DataFrame({
+        col: np.asarray(values, dtype=object)[rng.integers(0, len(values), samples)]
+        for col, values in GRID_VALUES.items()
+    }, columns=RAW_FEATURE_COLUMNS)
+    raw_df = normalize_raw_frame(raw_df)
+
+    looked_up = np.array([table.lookup(row) for row in raw_df.to_dict('records')], dtype=float)
+    live = predict_frame(entry, raw_df)
+    diff = np.abs(live - looked_up)
+    return {'samples': samples, 'max_abs_diff': float(diff.max()),
+            'mean_abs_diff': float(diff.mean())}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="预计算风险表：对离散输入网格批量预测并生成查找表")
+    parser.add_argument('command', choices=['materialize', 'verify'],
+                        help="materialize 生成风险表，verify 与实时预测做一致性检查")
+    parser.add_argument('--models-dir', default="models", help="模型文件目录")
+    parser.add_argument('--tables-dir', default=DEFAULT_TABLES_DIR, help="风险表输出目录")
+    parser.add_argument('--model', action='append', help="只处理指定的模型文件，可重复指定")
+    parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS, help="每批预测的网格点数")
+    parser.add_argument('--max-cells', type=int, default=DEFAULT_MAX_CELLS, help="单个模型的网格点上限")
+    parser.add_argument('--samples', type=int, default=20000, help="一致性检查的抽样点数")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help="一致性检查允许的最大误差")
+    args = parser.parse_args(argv)
+
+    registry = get_registry(args.models_dir)
+    model_files = args.model or available_models(args.models_dir)
+
+    failed = False
+    for model_file in model_files:
+        entry = registry.get(model_file)
+        if args.command == 'materialize':
+            def progress(done, total):
+                print(f"\r  {model_file}: {done:,}/{total:,} ({done / total:.0%})", end='', flush=True)
+            try:
+                manifest = materialize(entry, args.tables_dir, args.chunk_rows, args.max_cells, progress)
+            except ValueError as e:
+                print(f"跳过 {model_file}: {e}")
+                continue
+            print(f"\n生成风险表 {model_file}: {manifest['cells']:,} 个网格点，"
+                  f"依赖字段 {[field for field, _ in manifest['axes']]}，"
+                  f"耗时 {manifest['seconds']:.1f} 秒 "
+                  f"({manifest['cells'] / max(manifest['seconds'], 1e-9):,.0f} 点/秒)")
+        else:
+            table = load_table(entry, args.tables_dir)
+            if table is None:
+                print(f"{model_file}: 风险表不存在或已过期")
+                failed = True
+                continue
+            result = verify(entry, table, args.samples)
+            ok = result['max_abs_diff'] <= args.tolerance
+            failed = failed or not ok
+            print(f"{model_file}: {'通过' if ok else '不一致'}，抽样 {result['samples']} 点，"
+                  f"最大误差 {result['max_abs_diff']:.2e}，平均误差 {result['mean_abs_diff']:.2e}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,319 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+import pandas as pd
+
+from feature_pipeline import (classify_risk, classify_risks, normalize_input, normalize_raw_frame, predict_frame,
+                              predict_one)
+from model_registry import available_models, default_model, get_registry
+from perf_metrics import get_metrics
+from prediction_cache import get_prediction_cache
+from risk_table import get_risk_table
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8600
+# 请求体大小上限（字节）
+MAX_BODY_BYTES = 16 * 1024 * 1024
+# 单次批量请求的最大行数
+MAX_BATCH_ROWS = 100000
+PROMETHEUS_CONTENT_TYPE = b'text/plain; version=0.0.4; charset=utf-8'
+
+
+class HTTPError(Exception):
+    """带HTTP状态码的请求错误"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class ScoringService:
+    """无界面的打分服务：与应用共用特征编码、模型注册表、风险表和预测缓存，不访问数据库"""
+
+    def __init__(self, models_dir="models", model=None, registry=None):
+        self.models_dir = models_dir
+        self.registry = registry or get_registry(models_dir)
+        self.default_model = model or default_model(available_models(models_dir))
+        self.prediction_cache = get_prediction_cache(self.registry)
+        self.metrics = get_metrics()
+        self.started_at = time.time()
+        self.requests = 0
+        self.errors = 0
+        self.rows = 0
+
+    def preload(self, model_files=None):
+        """启动时加载并预热模型，请求处理时不再加载，首个请求也不承担原生库的初始化开销"""
+        errors = self.registry.preload(model_files or [self.default_model])
+        if errors:
+            raise ValueError('; '.join(f"{model_file}: {error}" for model_file, error in errors.items()))
+
+    def _model_file(self, payload):
+        """请求体中的模型文件名，未指定时为默认模型；只接受 models 目录下的文件名，不接受路径"""
+        model_file = payload.get('model') if payload else None
+        if model_file is None:
+            return self.default_model
+        if not isinstance(model_file, str) or not model_file or os.path.basename(model_file) != model_file:
+            raise HTTPError(400, "model 必须是模型文件名（字符串，不含路径）")
+        return model_file
+
+    def _entry(self, payload):
+        model_file = self._model_file(payload)
+        if not model_file:
+            raise HTTPError(404, "没有可用的模型")
+        # 已常驻的模型不再列目录
+        if not self.registry.is_loaded(model_file) and model_file not in available_models(self.models_dir):
+            raise HTTPError(404, f"模型 {model_file} 不存在")
+        entry = self.registry.get(model_file)
+        if not entry.ready:
+            # 按需加载的模型同时预热，之后该模型的单条请求直接在事件循环上处理
+            entry.warm_up()
+        return entry
+
+    def needs_load(self, payload):
+        """请求的模型是否需要加载或预热（未常驻、未预热或文件已被替换），需要时请求放到线程池中执行"""
+        model_file = self._model_file(payload)
+        return not (model_file and self.registry.is_ready(model_file))
+
+    def predict(self, payload):
+        """单条预测：优先查风险表，其次查预测缓存，最后调用模型"""
+        entry = self._entry(payload)
+        input_features = payload.get('input', payload)
+        if not isinstance(input_features, dict):
+            raise HTTPError(400, "input 必须是包含12个字段的JSON对象")
+        input_features = normalize_input(input_features)
+
+        risk_table = get_risk_table(entry)
+        prediction = risk_table.lookup(input_features) if risk_table else None
+        source = 'table'
+        if prediction is None:
+            prediction = self.prediction_cache.get(entry, input_features)
+            source = 'cache'
+        if prediction is None:
+            with self.metrics.span('service_predict'):
+                prediction = predict_one(entry, input_features)
+            self.prediction_cache.put(entry, input_features, prediction)
+            source = 'model'
+        self.rows += 1
+
+        result = {
+            'model': entry.filename,
+            'model_type': entry.model_type,
+            'risk': prediction,
+            'risk_level': classify_risk(prediction),
+            'source': source,
+        }
+        if payload.get('return_features'):
+            result['features'] = entry.encoder.features_dict(input_features)
+        return result
+
+    def predict_batch(self, payload):
+        """批量预测：inputs 为记录列表或按列的字典，每个模型只调用一次predict"""
+        entry = self._entry(payload)
+        inputs = payload.get('inputs')
+        if isinstance(inputs, list):
+            valid = bool(inputs) and all(isinstance(record, dict) for record in inputs)
+        elif isinstance(inputs, dict):
+            valid = bool(inputs) and all(isinstance(values, list) for values in inputs.values())
+        else:
+            valid = False
+        if not valid:
+            raise HTTPError(400, "inputs 必须是非空的记录（JSON对象）列表，或字段 -> 取值列表的字典")
+        raw_df = normalize_raw_frame(pd.DataFrame(inputs))
+        if len(raw_df) > MAX_BATCH_ROWS:
+            raise HTTPError(413, f"单次最多预测 {MAX_BATCH_ROWS} 行，本次 {len(raw_df)} 行")
+
+        start = time.perf_counter()
+        with self.metrics.span('service_batch'):
+            predictions = predict_frame(entry, raw_df)
+        self.rows += len(raw_df)
+        return {
+            'model': entry.filename,
+            'model_type': entry.model_type,
+            'rows': len(raw_df),
+            'risks': predictions.tolist(),
+            'risk_levels': classify_risks(predictions).tolist(),
+            'elapsed_ms': round((time.perf_counter() - start) * 1000, 3),
+        }
+
+    def health(self, payload=None):
+        return {
+            'status': 'ok',
+            'default_model': self.default_model,
+            'loaded_models': [stats['模型文件'] for stats in self.registry.stats()],
+            'uptime_seconds': round(time.time() - self.started_at, 1),
+            'requests': self.requests,
+            'errors': self.errors,
+            'rows': self.rows,
+            'prediction_cache': self.prediction_cache.stats(),
+        }
+
+    def prometheus(self, payload=None):
+        """Prometheus 文本格式的分阶段耗时直方图"""
+        return self.metrics.prometheus_text()
+
+    def models(self, payload=None):
+        return {
+            'default_model': self.default_model,
+            'models': [{'model': model_file, 'loaded': self.registry.is_loaded(model_file)}
+                       for model_file in available_models(self.models_dir)],
+            'loaded': self.registry.stats(),
+        }
+
+
+class ScoringApp:
+    """不依赖Web框架的ASGI应用，路由: GET /health、GET /models、GET /metrics、POST /predict、POST /predict/batch"""
+
+    def __init__(self, service, preload=None):
+        self.service = service
+        self.preload_models = preload
+        # (方法, 路径) -> (处理函数, 是否放到线程池中执行，或按请求体判断的函数)
+        self.routes = {
+            ('GET', '/health'): (service.health, False),
+            ('GET', '/models'): (service.models, False),
+            ('GET', '/metrics'): (service.prometheus, False),
+            # 单条预测在事件循环上直接处理；模型需要加载（反序列化和编译耗时可达秒级）时放到线程池中
+            ('POST', '/predict'): (service.predict, service.needs_load),
+            # 批量预测耗时较长，放到线程池中执行，不阻塞事件循环上的单条请求
+            ('POST', '/predict/batch'): (service.predict_batch, True),
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    if self.preload_models is not None:
+                        self.service.preload(self.preload_models)
+                except Exception as e:
+                    await send({'type': 'lifespan.startup.failed', 'message': f"模型预加载失败: {e}"})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _http(self, scope, receive, send):
+        self.service.requests += 1
+        try:
+            route = self.routes.get((scope['method'], scope['path']))
+            if route is None:
+                if any(path == scope['path'] for _, path in self.routes):
+                    raise HTTPError(405, f"{scope['path']} 不支持 {scope['method']} 请求")
+                raise HTTPError(404, f"路径 {scope['path']} 不存在")
+            handler, offload = route
+
+            payload = None
+            if scope['method'] == 'POST':
+                payload = self._parse_json(await self._read_body(receive))
+            if callable(offload):
+                offload = offload(payload)
+            if offload:
+                result = await asyncio.get_running_loop().run_in_executor(None, handler, payload)
+            else:
+                result = handler(payload)
+            if isinstance(result, str):
+                # Prometheus 文本格式
+                await self._send(send, 200, result.encode('utf-8'), PROMETHEUS_CONTENT_TYPE)
+            else:
+                await self._send_json(send, 200, result)
+        except HTTPError as e:
+            self.service.errors += 1
+            await self._send_json(send, e.status, {'error': e.message})
+        except ValueError as e:
+            # 输入校验失败
+            self.service.errors += 1
+            await self._send_json(send, 400, {'error': str(e)})
+        except Exception as e:
+            self.service.errors += 1
+            await self._send_json(send, 500, {'error': f"预测过程中出现错误: {e}"})
+
+    @staticmethod
+    async def _read_body(receive):
+        chunks = []
+        size = 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                raise HTTPError(400, "客户端已断开连接")
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > MAX_BODY_BYTES:
+                raise HTTPError(413, f"请求体超过 {MAX_BODY_BYTES // (1024 * 1024)} MB")
+            chunks.append(chunk)
+            if not message.get('more_body'):
+                return b''.join(chunks)
+
+    @staticmethod
+    def _parse_json(body):
+        try:
+            payload = json.loads(body or b'{}')
+        except ValueError:
+            raise HTTPError(400, "请求体不是合法的JSON")
+        if not isinstance(payload, dict):
+            raise HTTPError(400, "请求体必须是JSON对象")
+        return payload
+
+    @staticmethod
+    async def _send(send, status, data, content_type):
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', content_type),
+                        (b'content-length', str(len(data)).encode())],
+        })
+        await send({'type': 'http.response.body', 'body': data})
+
+    async def _send_json(self, send, status, body):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        await self._send(send, status, data, b'application/json; charset=utf-8')
+
+
+def create_app(models_dir="models", model=None, preload=None):
+    """创建ASGI应用；preload 为启动时加载的模型文件列表，None 表示只加载默认模型"""
+    service = ScoringService(models_dir, model)
+    if preload is None:
+        preload = [service.default_model] if service.default_model else []
+    return ScoringApp(service, preload)
+
+
+# 供 `uvicorn scoring_service:app --workers N` 使用，每个工作进程各自加载模型
+app = create_app()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="交通事故风险打分服务（ASGI），不依赖 Streamlit 和数据库")
+    parser.add_argument('--host', default=DEFAULT_HOST, help="监听地址")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help="监听端口")
+    parser.add_argument('--models-dir', default="models", help="模型文件目录")
+    parser.add_argument('--model', help="未指定模型的请求使用的默认模型文件")
+    parser.add_argument('--preload', action='append',
+                        help="启动时加载的模型文件，可重复指定；all 表示全部模型，默认只加载默认模型")
+    args = parser.parse_args(argv)
+
+    try:
+        import uvicorn
+    except ImportError:
+        print("未安装 uvicorn，请先执行 pip install uvicorn")
+        return 1
+
+    preload = args.preload
+    if preload and 'all' in preload:
+        preload = available_models(args.models_dir)
+    uvicorn.run(create_app(args.models_dir, args.model, preload), host=args.host, port=args.port,
+                log_level='warning')
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
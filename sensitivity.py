@@ -0,0 +1,145 @@
+import time
+
+import numpy as np
+import plotly.graph_objects as go
+
+from feature_pipeline import (BOOLEAN_COLUMNS, CATEGORICAL_OPTIONS, NUMERIC_RANGES, RAW_FEATURE_COLUMNS,
+                              normalize_input, predict_columns, raw_columns_from_dict)
+from training_charts import FIELD_LABELS
+
+# 数值型因素默认的取值点数；曲率 0~1 取 11 个点即步长 0.1
+DEFAULT_POINTS = 11
+MAX_POINTS = 51
+# 同时改变的因素数上限：一个因素画曲线，两个因素画热力图
+MAX_FACTORS = 2
+# 风险等级分界线，与 feature_pipeline.classify_risks 一致
+RISK_THRESHOLDS = {0.3: '中风险', 0.7: '高风险'}
+
+
+def factor_values(factor, points=DEFAULT_POINTS, value_range=None):
+    """因素的扫描取值：分类型为全部可选值，布尔型为否/是，数值型在取值范围内等间距取点（整数字段取整去重）"""
+    if factor in CATEGORICAL_OPTIONS:
+        return list(CATEGORICAL_OPTIONS[factor])
+    if factor in BOOLEAN_COLUMNS:
+        return [False, True]
+    if factor not in NUMERIC_RANGES:
+        raise ValueError(f"未知的因素 {factor}，可选值为 {RAW_FEATURE_COLUMNS}")
+    low, high, integer = NUMERIC_RANGES[factor]
+    if value_range is not None:
+        low, high = value_range
+    values = np.linspace(low, high, max(int(points), 2))
+    if integer:
+        return np.unique(np.round(values)).astype(int).tolist()
+    return values.round(6).tolist()
+
+
+def _encode_values(factor, values):
+    """把因素取值转换为 raw_columns_from_dict 相同的按列表示（分类字段为可选值下标）"""
+    if factor in CATEGORICAL_OPTIONS:
+        return np.array([CATEGORICAL_OPTIONS[factor].index(value) for value in values], dtype=np.int8)
+    return np.asarray(values, dtype=np.float64)
+
+
+def sweep_columns(input_features, factors, values):
+    """以单条输入为基准构造扫描网格的按列输入：第一个因素变化最快，最后一行为基准输入本身"""
+    shape = [len(v) for v in values]
+    grid_rows = int(np.prod(shape))
+    base = raw_columns_from_dict(input_features)
+    columns = {col: np.repeat(arr, grid_rows + 1) for col, arr in base.items()}
+
+    repeat = 1
+    for factor, factor_grid, size in zip(factors, values, shape):
+        # 第 k 个因素的下标：每个取值重复前面各因素取值数之积次，再整体平铺
+        index = np.tile(np.repeat(np.arange(size), repeat), grid_rows // (size * repeat))
+        columns[factor][:grid_rows] = _encode_values(factor, factor_grid)[index]
+        repeat *= size
+    return columns
+
+
+class SweepResult:
+    """敏感性扫描结果：risks 为一维（一个因素）或 (第二个因素取值数, 第一个因素取值数) 的二维数组"""
+
+    def __init__(self, factors, values, risks, base_features, base_risk, elapsed_seconds):
+        self.factors = factors
+        self.values = values
+        self.risks = risks
+        self.base_features = base_features
+        self.base_risk = base_risk
+        self.elapsed_seconds = elapsed_seconds
+
+    @property
+    def rows(self):
+        return int(self.risks.size)
+
+
+def sweep(entry, input_features, factors, values):
+    """保持其余输入不变，对一到两个因素的全部取值组合（及基准输入）做一次批量预测"""
+    if not 1 <= len(factors) <= MAX_FACTORS:
+        raise ValueError(f"请选择 1 到 {MAX_FACTORS} 个因素")
+    if len(set(factors)) != len(factors):
+        raise ValueError("不能重复选择同一个因素")
+    if len(values) != len(factors) or any(len(v) == 0 for v in values):
+        raise ValueError("每个因素至少需要一个取值")
+    for factor in factors:
+        if factor not in RAW_FEATURE_COLUMNS:
+            raise ValueError(f"未知的因素 {factor}，可选值为 {RAW_FEATURE_COLUMNS}")
+
+    start = time.perf_counter()
+    base_features = normalize_input(input_features)
+    predictions = predict_columns(entry, sweep_columns(base_features, factors, values))
+    # 第一个因素为横轴，二维时按 (纵轴, 横轴) 排列，与热力图的 z 一致
+    risks = predictions[:-1].reshape([len(v) for v in reversed(values)])
+    return SweepResult(list(factors), [list(v) for v in values], risks, base_features, float(predictions[-1]),
+                       time.perf_counter() - start)
+
+
+def field_label(factor):
+    return FIELD_LABELS.get(factor, factor)
+
+
+def _display_values(factor, values):
+    if factor in BOOLEAN_COLUMNS:
+        return ['是' if value else '否' for value in values]
+    return list(values)
+
+
+def _display_value(factor, value):
+    return _display_values(factor, [value])[0]
+
+
+def sweep_figure(result):
+    """一个因素画风险曲线（分类型/布尔型为柱状图），两个因素画风险热力图，并标出当前输入"""
+    x_factor = result.factors[0]
+    x = _display_values(x_factor, result.values[0])
+    base_x = _display_value(x_factor, result.base_features[x_factor])
+
+    if len(result.factors) == 1:
+        fig = go.Figure()
+        hovertemplate = f"{field_label(x_factor)} %{{x}}<br>风险值 %{{y:.4f}}<extra></extra>"
+        if x_factor in NUMERIC_RANGES:
+            fig.add_trace(go.Scatter(x=x, y=result.risks, mode='lines+markers', name="风险值",
+                                     hovertemplate=hovertemplate))
+        else:
+            fig.add_trace(go.Bar(x=x, y=result.risks, name="风险值", hovertemplate=hovertemplate))
+        fig.add_trace(go.Scatter(x=[base_x], y=[result.base_risk], mode='markers', name="当前输入",
+                                 marker={'symbol': 'star', 'size': 14}))
+        for threshold, label in RISK_THRESHOLDS.items():
+            fig.add_hline(y=threshold, line_dash='dot', line_color='gray', annotation_text=label)
+        fig.update_xaxes(title_text=field_label(x_factor))
+        fig.update_yaxes(title_text="预测风险值", range=[0, 1])
+        return fig
+
+    y_factor = result.factors[1]
+    y = _display_values(y_factor, result.values[1])
+    base_y = _display_value(y_factor, result.base_features[y_factor])
+    fig = go.Figure(go.Heatmap(
+        x=x, y=y, z=result.risks, zmin=0, zmax=1, colorscale='RdYlGn_r', colorbar={'title': '风险值'},
+        hovertemplate=f"{field_label(x_factor)} %{{x}}<br>{field_label(y_factor)} %{{y}}<br>"
+                      f"风险值 %{{z:.4f}}<extra></extra>"))
+    fig.add_trace(go.Scatter(x=[base_x], y=[base_y], mode='markers', name="当前输入",
+                             marker={'symbol': 'star', 'size': 14, 'color': 'black'},
+                             hovertemplate=f"当前输入<br>风险值 {result.base_risk:.4f}<extra></extra>"))
+    fig.update_xaxes(title_text=field_label(x_factor))
+    fig.update_yaxes(title_text=field_label(y_factor))
+    fig.update_layout(height=520, showlegend=False)
+    return fig
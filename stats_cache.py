@@ -0,0 +1,88 @@
+import threading
+import time
+
+# 统计数据缓存时间（秒）
+DEFAULT_TTL = 300
+# web_predictions 以增量计数为主，间隔较长时间再与数据库重新对齐一次（秒）
+DEFAULT_RESYNC_INTERVAL = 3600
+
+
+class StatsCache:
+    """首页统计数据缓存，所有会话共享；预测记录数由预测记录队列写入成功后增量累加"""
+
+    def __init__(self, pool, ttl=DEFAULT_TTL, resync_interval=DEFAULT_RESYNC_INTERVAL,
+                 approximate=False):
+        self.pool = pool
+        self.ttl = ttl
+        self.resync_interval = resync_interval
+        # 为True时从 information_schema 读取近似行数，避免大表上的 COUNT(*)
+        self.approximate = approximate
+
+        self._lock = threading.Lock()
+        self._counts = {}
+        self._refreshed_at = 0.0
+        self._predictions_synced_at = 0.0
+
+    def _count(self, cursor, tables):
+        """统计指定表的行数"""
+        if self.approximate:
+            placeholders = ', '.join(['%s'] * len(tables))
+            cursor.execute(f"""
+                SELECT TABLE_NAME, TABLE_ROWS FROM information_schema.TABLES
+                WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME IN ({placeholders})
+            """, tables)
+            counts = {name: int(rows or 0) for name, rows in cursor.fetchall()}
+            return {table: counts.get(table, 0) for table in tables}
+
+        counts = {}
+        for table in tables:
+            cursor.execute(f"SELECT COUNT(*) FROM {table}")
+            counts[table] = cursor.fetchone()[0]
+        return counts
+
+    def get(self):
+        """获取统计数据，超过TTL时重新查询；web_predictions 只在需要对齐时重新统计"""
+        with self._lock:
+            now = time.monotonic()
+            if not self._counts or now - self._refreshed_at > self.ttl:
+                tables = ['training_data', 'model_configs']
+                resync = ('web_predictions' not in self._counts or
+                          now - self._predictions_synced_at > self.resync_interval)
+                if resync:
+                    tables.append('web_predictions')
+
+                with self.pool.connection() as conn:
+                    cursor = conn.cursor()
+                    self._counts.update(self._count(cursor, tables))
+                    cursor.close()
+
+                self._refreshed_at = now
+                if resync:
+                    self._predictions_synced_at = now
+            return dict(self._counts)
+
+    def add_predictions(self, count):
+        """预测记录写入成功后累加计数"""
+        with self._lock:
+            if 'web_predictions' in self._counts:
+                self._counts['web_predictions'] += count
+
+    def invalidate(self):
+        """使缓存失效，下次获取时全部重新统计"""
+        with self._lock:
+            self._counts = {}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_stats_cache(pool, prediction_logger=None, **kwargs):
+    """获取进程内共享的统计缓存，并订阅预测记录队列的写入事件"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = StatsCache(pool, **kwargs)
+            if prediction_logger is not None:
+                prediction_logger.add_listener(_cache.add_predictions)
+        return _cache
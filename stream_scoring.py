@@ -0,0 +1,503 @@
+import argparse
+import io
+import json
+import os
+import sys
+import time
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from batch_prediction import file_format
+from feature_pipeline import classify_risks, normalize_raw_frame, predict_frame
+from model_registry import available_models, default_model, get_registry
+
+# 每次读入、预测并写出的行数，决定流式任务的内存上限
+DEFAULT_CHUNK_ROWS = 100000
+# 断点文件的格式版本
+CHECKPOINT_VERSION = 2
+# 页面上的流式任务只能读写该目录下的文件
+DEFAULT_DATA_DIR = "data"
+# CSV 每次从文件读入的字节数
+CSV_BLOCK_BYTES = 8 * 1024 * 1024
+
+
+def resolve_data_path(data_dir, path):
+    """把相对数据目录的路径解析为绝对路径；解析后（包括经过符号链接）不在数据目录内时抛出 ValueError"""
+    root = os.path.realpath(data_dir)
+    resolved = os.path.realpath(os.path.join(root, path))
+    if resolved == root or os.path.commonpath([root, resolved]) != root:
+        raise ValueError(f"路径 {path} 不在数据目录 {data_dir} 内")
+    return resolved
+
+
+def checkpoint_path(output_path):
+    """断点文件路径：与输出文件同目录，记录已写出的行数和输出位置"""
+    return f"{os.path.normpath(output_path)}.progress.json"
+
+
+def _file_signature(path):
+    """输入文件的签名（大小和修改时间），文件变化后断点失效"""
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _json_version(version):
+    """将模型版本标记转换为JSON可比较的形式"""
+    return json.loads(json.dumps(version))
+
+
+def _read_json(path):
+    """读取JSON文件，不存在或无法解析时返回None"""
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json_atomic(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class _CsvSource:
+    """按固定行数分块读取CSV：按引号配对找到记录边界，把整条记录的字节块交给pandas解析；
+    记录下一块起始的字节偏移，断点续跑时直接定位到该偏移，不必重新读取已处理的行"""
+
+    def __init__(self, path, chunk_rows, offset=0):
+        self._file = open(path, 'rb')
+        self.total_bytes = max(os.fstat(self._file.fileno()).st_size, 1)
+        self._chunk_rows = chunk_rows
+        self._pending = b''
+        self.offset = 0
+        self._header = self._read_records(1)
+        if offset > self.offset:
+            self._file.seek(offset)
+            self._pending = b''
+            self.offset = offset
+
+    def _read_records(self, n_records):
+        """从当前偏移读出 n_records 条完整记录的字节，文件末尾不足时返回剩余的全部字节；
+        引号外的换行才是记录边界（字段内的引号按 CSV 规范成对出现）"""
+        parts = []
+        found = 0
+        quoted = 0
+        block = self._pending or self._file.read(CSV_BLOCK_BYTES)
+        self._pending = b''
+        while block:
+            view = np.frombuffer(block, dtype=np.uint8)
+            quotes = np.cumsum(view == ord('"'))
+            ends = np.flatnonzero((view == ord('\n')) & ((quotes + quoted) % 2 == 0))
+            if found + len(ends) >= n_records:
+                cut = int(ends[n_records - found - 1]) + 1
+                parts.append(block[:cut])
+                self._pending = block[cut:]
+                break
+            found += len(ends)
+            quoted = (quoted + int(quotes[-1])) % 2
+            parts.append(block)
+            block = self._file.read(CSV_BLOCK_BYTES)
+        data = b''.join(parts)
+        self.offset += len(data)
+        return data
+
+    def __iter__(self):
+        while True:
+            data = self._read_records(self._chunk_rows)
+            if not data:
+                return
+            chunk = pd.read_csv(io.BytesIO(self._header + data), encoding='utf-8-sig')
+            # 只有空行的块没有数据
+            if len(chunk):
+                yield chunk
+
+    def position(self):
+        return self.offset
+
+    def fraction(self, rows_done):
+        return min(self.offset / self.total_bytes, 1.0)
+
+    def close(self):
+        self._file.close()
+
+
+class _ParquetSource:
+    """按固定行数分块读取Parquet，断点续跑时整组跳过已处理的行组"""
+
+    def __init__(self, path, chunk_rows, skip_rows=0):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ValueError("读取Parquet文件需要安装 pyarrow")
+        self._file = pq.ParquetFile(path)
+        self.total_rows = self._file.metadata.num_rows
+        self._chunk_rows = chunk_rows
+        # 跳过完整落在已处理范围内的行组，剩余的行在第一个分块中切掉
+        self._row_groups = []
+        self._skip = skip_rows
+        for index in range(self._file.metadata.num_row_groups):
+            rows = self._file.metadata.row_group(index).num_rows
+            if self._skip >= rows and not self._row_groups:
+                self._skip -= rows
+                continue
+            self._row_groups.append(index)
+
+    def __iter__(self):
+        skip = self._skip
+        for batch in self._file.iter_batches(batch_size=self._chunk_rows, row_groups=self._row_groups):
+            if skip:
+                dropped = min(skip, batch.num_rows)
+                batch = batch.slice(dropped)
+                skip -= dropped
+                if batch.num_rows == 0:
+                    continue
+            yield batch.to_pandas()
+
+    def position(self):
+        return None
+
+    def fraction(self, rows_done):
+        return min(rows_done / self.total_rows, 1.0) if self.total_rows else 1.0
+
+    def close(self):
+        self._file.close()
+
+
+def open_source(path, chunk_rows, skip_rows=0, offset=0):
+    """按扩展名打开分块读取的输入文件；CSV 从字节偏移 offset 处继续，Parquet 跳过前 skip_rows 行"""
+    if file_format(path) == 'csv':
+        return _CsvSource(path, chunk_rows, offset)
+    return _ParquetSource(path, chunk_rows, skip_rows)
+
+
+class _CsvSink:
+    """逐块追加写出CSV；续跑时先截断到断点记录的位置，丢弃中断时写了一半的分块"""
+
+    def __init__(self, path, offset):
+        self.path = path
+        mode = 'r+b' if offset and os.path.exists(path) else 'wb'
+        self._file = open(path, mode)
+        self._file.truncate(offset)
+        self._file.seek(offset)
+
+    def write(self, index, results):
+        # 首块带BOM和表头，便于Excel正确识别中文
+        if index == 0:
+            data = results.to_csv(index=False).encode('utf-8-sig')
+        else:
+            data = results.to_csv(index=False, header=False).encode('utf-8')
+        self._file.write(data)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def position(self):
+        return self._file.tell()
+
+    def close(self):
+        self._file.close()
+
+
+class _ParquetSink:
+    """每块写出为目录下的一个 part 文件，pandas.read_parquet 可直接读取整个目录"""
+
+    def __init__(self, path, chunks_done):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        # 删除断点之后（中断时写出）的分块
+        _remove_parts(path, chunks_done)
+
+    def write(self, index, results):
+        part_path = os.path.join(self.path, f"part-{index:06d}.parquet")
+        tmp_path = f"{part_path}.tmp"
+        try:
+            results.to_parquet(tmp_path, index=False)
+        except ImportError:
+            raise ValueError("导出Parquet文件需要安装 pyarrow 或 fastparquet")
+        os.replace(tmp_path, part_path)
+
+    def position(self):
+        return None
+
+    def close(self):
+        pass
+
+
+def _part_index(name):
+    """part 文件名中的分块序号，不是本模块写出的 part 文件时返回None"""
+    if not name.startswith('part-'):
+        return None
+    try:
+        return int(name[len('part-'):].split('.')[0])
+    except ValueError:
+        return None
+
+
+def _remove_parts(path, first_index=0):
+    """删除目录中序号不小于 first_index 的 part 文件（包括写了一半的临时文件），不动其他文件"""
+    for name in os.listdir(path):
+        index = _part_index(name)
+        if index is not None and index >= first_index:
+            os.remove(os.path.join(path, name))
+
+
+def open_sink(path, fmt, checkpoint):
+    if fmt == 'csv':
+        return _CsvSink(path, checkpoint['output_bytes'] if checkpoint else 0)
+    return _ParquetSink(path, checkpoint['chunks'] if checkpoint else 0)
+
+
+def _score_chunks(entry, frames, scorer=None):
+    """对规范化后的分块逐块预测，产出 (分块, 预测值)；scorer 为多进程打分器时分块在工作进程中并行预测"""
+    if scorer is None:
+        for frame in frames:
+            yield frame, predict_frame(entry, frame)
+        return
+
+    # 工作进程按 scorer.chunk_rows 再切分，预测值按顺序返回，凑满一个输入分块后再产出
+    pending = deque()
+
+    def tracked():
+        for frame in frames:
+            pending.append(frame)
+            yield frame
+
+    buffered = []
+    buffered_rows = 0
+    for predictions in scorer.imap(tracked()):
+        buffered.append(predictions)
+        buffered_rows += len(predictions)
+        while pending and buffered_rows >= len(pending[0]):
+            frame = pending.popleft()
+            merged = np.concatenate(buffered)
+            yield frame, merged[:len(frame)]
+            buffered = [merged[len(frame):]]
+            buffered_rows -= len(frame)
+
+
+class StreamingJob:
+    """流式批量预测任务：分块读入、规范化、编码预测并逐块写出，内存占用只与分块大小有关；
+    每写完一块更新断点文件，中断后再次运行从断点继续"""
+
+    def __init__(self, entry, input_path, output_path, chunk_rows=DEFAULT_CHUNK_ROWS, output_format=None,
+                 scorer=None):
+        if chunk_rows <= 0:
+            raise ValueError(f"分块行数必须为正数，当前为 {chunk_rows}")
+        if os.path.realpath(input_path) == os.path.realpath(output_path):
+            raise ValueError("结果文件不能与输入文件相同")
+        self.entry = entry
+        self.input_path = input_path
+        self.output_path = output_path
+        self.input_format = file_format(input_path)
+        self.output_format = output_format or file_format(output_path)
+        self.chunk_rows = chunk_rows
+        self.scorer = scorer
+        self.rows_done = 0
+        self.chunks_done = 0
+        self.resumed_rows = 0
+        self.rows_read = 0
+        self.fraction = 0.0
+        self.elapsed_seconds = 0.0
+        self.completed = False
+
+    def _job_key(self):
+        return {
+            'checkpoint_version': CHECKPOINT_VERSION,
+            'input': os.path.abspath(self.input_path),
+            'input_signature': _file_signature(self.input_path),
+            'model': self.entry.filename,
+            'model_version': _json_version(self.entry.version),
+            'output_format': self.output_format,
+            'chunk_rows': self.chunk_rows,
+        }
+
+    def load_checkpoint(self):
+        """读取与本任务匹配的断点，输入文件、模型或分块参数变化时返回None"""
+        checkpoint = _read_json(checkpoint_path(self.output_path))
+        if checkpoint is None:
+            return None
+        key = self._job_key()
+        if any(checkpoint.get(name) != value for name, value in key.items()):
+            return None
+        # 输出文件被删除或截短时断点同样失效
+        if self.output_format == 'csv':
+            if (not os.path.isfile(self.output_path) or
+                    os.path.getsize(self.output_path) < checkpoint['output_bytes']):
+                return None
+        elif not os.path.isdir(self.output_path):
+            return None
+        return checkpoint
+
+    def _save_checkpoint(self, sink, input_bytes, completed=False):
+        checkpoint = self._job_key()
+        checkpoint.update({
+            'rows': self.rows_done,
+            'chunks': self.chunks_done,
+            'input_bytes': input_bytes,
+            'output_bytes': sink.position(),
+            'completed': completed,
+            'updated_at': time.time(),
+        })
+        _write_json_atomic(checkpoint_path(self.output_path), checkpoint)
+
+    def reset(self):
+        """丢弃断点和断点记录的结果（CSV 结果文件或 Parquet 目录中的 part 文件），下次运行从头开始；
+        没有本模块写出的断点时不删除任何文件"""
+        path = checkpoint_path(self.output_path)
+        checkpoint = _read_json(path)
+        if not isinstance(checkpoint, dict) or 'checkpoint_version' not in checkpoint:
+            return
+        if checkpoint.get('output_format') == 'csv':
+            if os.path.isfile(self.output_path):
+                os.remove(self.output_path)
+        elif os.path.isdir(self.output_path):
+            _remove_parts(self.output_path)
+            if not os.listdir(self.output_path):
+                os.rmdir(self.output_path)
+        os.remove(path)
+
+    def _check_output_free(self):
+        """没有断点时结果路径必须不存在（或为空目录），不覆盖不是本任务写出的文件"""
+        path = self.output_path
+        if os.path.isdir(path) and self.output_format == 'parquet' and not os.listdir(path):
+            return
+        if os.path.exists(path):
+            raise ValueError(f"结果路径 {path} 已存在且不是本任务的输出，请更换结果文件路径")
+
+    @property
+    def rows_per_second(self):
+        rows = self.rows_done - self.resumed_rows
+        return rows / self.elapsed_seconds if self.elapsed_seconds > 0 else 0.0
+
+    def run(self, progress=None):
+        """执行任务，每写出一块调用一次 progress(job)；返回本任务"""
+        checkpoint = self.load_checkpoint()
+        if checkpoint is None:
+            # 断点与当前任务不匹配时从头开始
+            self.reset()
+            self._check_output_free()
+        else:
+            self.rows_done = self.resumed_rows = self.rows_read = checkpoint['rows']
+            self.chunks_done = checkpoint['chunks']
+            if checkpoint.get('completed'):
+                self.completed = True
+                self.fraction = 1.0
+                return self
+
+        start = time.perf_counter()
+        input_offset = (checkpoint.get('input_bytes') or 0) if checkpoint else 0
+        source = open_source(self.input_path, self.chunk_rows, self.rows_done, input_offset)
+        sink = open_sink(self.output_path, self.output_format, checkpoint)
+        # 多进程打分时输入会预读几块，每块读完时的输入位置按顺序排队，写出该块时取出
+        input_positions = deque()
+
+        def frames():
+            for raw_chunk in source:
+                input_positions.append(source.position())
+                yield self._normalize(raw_chunk)
+
+        try:
+            if checkpoint is None:
+                # 立即写入断点，结果文件从创建起即归本任务所有
+                self._save_checkpoint(sink, source.position())
+            input_bytes = source.position()
+            for inputs, predictions in _score_chunks(self.entry, frames(), self.scorer):
+                results = inputs.copy()
+                results['predicted_risk'] = predictions
+                results['risk_level'] = classify_risks(predictions)
+                sink.write(self.chunks_done, results)
+                self.rows_done += len(results)
+                self.chunks_done += 1
+                input_bytes = input_positions.popleft()
+                self._save_checkpoint(sink, input_bytes)
+                self.fraction = source.fraction(self.rows_done)
+                self.elapsed_seconds = time.perf_counter() - start
+                if progress is not None:
+                    progress(self)
+            self.completed = True
+            self.fraction = 1.0
+            self._save_checkpoint(sink, input_bytes, completed=True)
+        finally:
+            self.elapsed_seconds = time.perf_counter() - start
+            source.close()
+            sink.close()
+        return self
+
+    def _normalize(self, raw_chunk):
+        first_row = self.rows_read + 1
+        self.rows_read += len(raw_chunk)
+        try:
+            return normalize_raw_frame(raw_chunk)
+        except ValueError as e:
+            raise ValueError(f"第 {first_row:,}-{self.rows_read:,} 行的数据有误: {e}")
+
+    def stats(self):
+        return {
+            'rows': self.rows_done,
+            'chunks': self.chunks_done,
+            'resumed_rows': self.resumed_rows,
+            'fraction': self.fraction,
+            'rows_per_second': self.rows_per_second,
+            'elapsed_seconds': self.elapsed_seconds,
+            'completed': self.completed,
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="流式批量预测：分块读取大文件（CSV/Parquet），逐块预测并写出，中断后可续跑")
+    parser.add_argument('input', help="输入文件，CSV 或 Parquet")
+    parser.add_argument('output', help="输出文件；Parquet 输出为目录，每块一个 part 文件")
+    parser.add_argument('--models-dir', default="models", help="模型文件目录")
+    parser.add_argument('--model', help="使用的模型文件，默认使用默认模型")
+    parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS, help="每块的行数")
+    parser.add_argument('--format', choices=['csv', 'parquet'], help="输出格式，默认按输出文件扩展名判断")
+    parser.add_argument('--workers', type=int, default=1, help="并行工作进程数，大于1时使用多进程打分")
+    parser.add_argument('--restart', action='store_true', help="忽略断点，从头开始")
+    args = parser.parse_args(argv)
+
+    model_file = args.model or default_model(available_models(args.models_dir))
+    if not model_file:
+        print("没有可用的模型")
+        return 1
+    entry = get_registry(args.models_dir).get(model_file)
+
+    scorer = None
+    if args.workers > 1:
+        from parallel_scoring import ParallelScorer
+        scorer = ParallelScorer(model_file, args.models_dir, args.workers, args.chunk_rows)
+
+    try:
+        job = StreamingJob(entry, args.input, args.output, args.chunk_rows, args.format, scorer)
+        checkpoint = job.load_checkpoint()
+        if args.restart:
+            job.reset()
+        elif checkpoint is not None and checkpoint.get('completed'):
+            print(f"任务已完成: {args.output} 共 {checkpoint['rows']:,} 行，如需重新预测请加 --restart")
+            return 0
+        elif checkpoint is not None:
+            print(f"从断点继续: 已完成 {checkpoint['rows']:,} 行")
+
+        def progress(job):
+            print(f"\r  已处理 {job.rows_done:,} 行 ({job.fraction:.1%})，{job.rows_per_second:,.0f} 行/秒",
+                  end='', flush=True)
+
+        job.run(progress)
+    except ValueError as e:
+        print(f"\n流式预测失败: {e}")
+        return 1
+    finally:
+        if scorer is not None:
+            scorer.close()
+
+    print(f"\n完成 {args.output}: 共 {job.rows_done:,} 行，本次 {job.rows_done - job.resumed_rows:,} 行，"
+          f"耗时 {job.elapsed_seconds:.1f} 秒 ({job.rows_per_second:,.0f} 行/秒)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
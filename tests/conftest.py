@@ -0,0 +1,39 @@
+import os
+import sys
+import warnings
+
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from feature_pipeline import native_frame, raw_columns_from_frame, sample_raw_frame  # noqa: E402
+from model_artifacts import available_models, export_model  # noqa: E402
+
+MODELS_DIR = os.path.join(ROOT, "models")
+# 与原生库预测的最大允许误差
+TOLERANCE = 1e-9
+
+
+def native_predict(model_type, model, scaler, columns):
+    """原模型在原生输入（pandas 分类特征、未折叠的缩放器）上的预测，截断到[0, 1]，作为一致性基准"""
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        predictions = model.predict(native_frame(model_type, model, columns, scaler))
+    return np.clip(np.asarray(predictions, dtype=float), 0.0, 1.0)
+
+
+@pytest.fixture(scope="session")
+def raw_columns():
+    """覆盖全部分类取值的随机表单输入（按列表示）"""
+    return raw_columns_from_frame(sample_raw_frame(5000, seed=7))
+
+
+@pytest.fixture(scope="session")
+def artifacts_dir(tmp_path_factory):
+    """把全部模型导出到临时目录"""
+    directory = str(tmp_path_factory.mktemp("artifacts"))
+    for model_file in available_models(MODELS_DIR):
+        export_model(MODELS_DIR, model_file, directory)
+    return directory
@@ -0,0 +1,18 @@
+import numpy as np
+import pytest
+from conftest import MODELS_DIR, TOLERANCE
+
+from batch_prediction import predict_batch
+from feature_pipeline import classify_risk, normalize_input, predict_one, sample_raw_frame
+from model_registry import available_models, get_registry
+
+
+@pytest.mark.parametrize('model_file', available_models(MODELS_DIR))
+def test_predict_batch_matches_predict_one(model_file):
+    """批量预测与逐条预测（表单路径）的风险值和风险等级一致"""
+    entry = get_registry(MODELS_DIR).get(model_file)
+    raw_df = sample_raw_frame(300, seed=21)
+    results = predict_batch(entry, raw_df).results
+    single = [predict_one(entry, normalize_input(row)) for row in raw_df.to_dict('records')]
+    np.testing.assert_allclose(results['predicted_risk'], single, rtol=0, atol=TOLERANCE)
+    assert list(results['risk_level']) == [classify_risk(risk) for risk in results['predicted_risk']]
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+from conftest import MODELS_DIR, TOLERANCE, native_predict
+
+from feature_pipeline import compile_encoder, predict_matrix, training_categories
+from model_artifacts import available_models, infer_model_type, load_pickled
+
+MODEL_FILES = available_models(MODELS_DIR)
+
+
+@pytest.mark.parametrize('model_file', MODEL_FILES)
+def test_encoder_matches_native_categorical_input(model_file, raw_columns):
+    """编码器的预测与原生库在 pandas 分类输入上的预测一致"""
+    model_type = infer_model_type(model_file)
+    model, scaler, _ = load_pickled(MODELS_DIR, model_file)
+    encoder = compile_encoder(model_type, model, scaler)
+    n_rows = len(raw_columns['weather'])
+    features = encoder.encode_columns(raw_columns, np.empty((n_rows, encoder.n_features)))
+    predictions = predict_matrix(model, features)
+    np.testing.assert_allclose(predictions, native_predict(model_type, model, scaler, raw_columns),
+                               rtol=0, atol=TOLERANCE)
+
+
+@pytest.mark.parametrize('model_file', [f for f in MODEL_FILES if infer_model_type(f) in ('lightgbm', 'xgboost')])
+def test_encoder_uses_training_category_order(model_file):
+    """分类特征的编码与模型训练时的类别顺序一致，而不是表单可选值的顺序"""
+    model_type = infer_model_type(model_file)
+    model, _, _ = load_pickled(MODELS_DIR, model_file)
+    categories = training_categories(model_type, model)
+    assert categories, f"{model_file} 未读取到训练时的类别"
+    encoder = compile_encoder(model_type, model)
+    for field, codes in encoder.category_codes.items():
+        assert codes == {category: i for i, category in enumerate(categories[field])}
+
+
+class _OldBooster:
+    """读不到类别顺序的XGBoost模型（xgboost<3.1 或未安装 pyarrow）"""
+    feature_types = ['float', 'c']
+
+    def get_categories(self, export_to_arrow=False):
+        raise TypeError("get_categories() got an unexpected keyword argument 'export_to_arrow'")
+
+
+class _OldXGBoostModel:
+    def get_booster(self):
+        return _OldBooster()
+
+
+def test_xgboost_unreadable_categories_raise():
+    """含分类特征的XGBoost模型读不到类别顺序时报错，而不是按表单可选值的顺序编码"""
+    with pytest.raises(ValueError, match="类别顺序"):
+        compile_encoder('xgboost', _OldXGBoostModel())
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+from conftest import MODELS_DIR, TOLERANCE, native_predict
+
+from feature_pipeline import (LINEAR_MODEL_TYPES, compile_encoder, compile_linear_kernel, normalize_input,
+                              predict_matrix, raw_columns_from_frame, sample_raw_frame)
+from model_artifacts import available_models, infer_model_type, load_artifact, load_pickled, verify
+
+MODEL_FILES = available_models(MODELS_DIR)
+LINEAR_MODEL_FILES = [f for f in MODEL_FILES if infer_model_type(f) in LINEAR_MODEL_TYPES]
+
+
+@pytest.mark.parametrize('model_file', MODEL_FILES)
+def test_artifact_matches_native(model_file, artifacts_dir, raw_columns):
+    """导出产物加载后的预测与 pickle 中的原模型在原生输入上的预测一致"""
+    model_type = infer_model_type(model_file)
+    model, scaler, _ = load_artifact(artifacts_dir, model_file)[:3]
+    encoder = compile_encoder(model_type, model, scaler)
+    n_rows = len(raw_columns['weather'])
+    features = encoder.encode_columns(raw_columns, np.empty((n_rows, encoder.n_features)))
+    predictions = predict_matrix(model, features)
+    original, original_scaler, _ = load_pickled(MODELS_DIR, model_file)
+    np.testing.assert_allclose(predictions, native_predict(model_type, original, original_scaler, raw_columns),
+                               rtol=0, atol=TOLERANCE)
+
+
+@pytest.mark.parametrize('model_file', LINEAR_MODEL_FILES)
+def test_linear_kernel_matches_sklearn(model_file, raw_columns):
+    """融合内核的批量和单条预测与 sklearn 的 scaler.transform + predict 一致"""
+    model_type = infer_model_type(model_file)
+    model, scaler, _ = load_pickled(MODELS_DIR, model_file)
+    kernel = compile_linear_kernel(model_type, model, compile_encoder(model_type, model, scaler))
+    assert kernel is not None
+    expected = native_predict(model_type, model, scaler, raw_columns)
+    np.testing.assert_allclose(np.clip(kernel.predict_columns(raw_columns), 0.0, 1.0), expected,
+                               rtol=0, atol=TOLERANCE)
+
+    raw_df = sample_raw_frame(20, seed=3)
+    single = [kernel.predict_one(normalize_input(row)) for row in raw_df.to_dict('records')]
+    np.testing.assert_allclose(np.clip(single, 0.0, 1.0),
+                               native_predict(model_type, model, scaler, raw_columns_from_frame(raw_df)),
+                               rtol=0, atol=TOLERANCE)
+
+
+@pytest.mark.parametrize('model_file', MODEL_FILES)
+def test_verify_passes(model_file, artifacts_dir):
+    """导出命令的一致性检查对全部比较项通过"""
+    results = verify(MODELS_DIR, model_file, artifacts_dir, samples=2000)
+    assert '导出产物' in results
+    for name, result in results.items():
+        assert result['max_abs_diff'] <= TOLERANCE, name
@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+from conftest import MODELS_DIR, TOLERANCE
+
+from feature_pipeline import predict_frame, sample_raw_frame
+from model_registry import available_models, default_model, get_registry
+from parallel_scoring import ParallelScorer
+from stream_scoring import _score_chunks
+
+MODEL_FILE = default_model(available_models(MODELS_DIR))
+
+
+@pytest.fixture(scope="module")
+def scorer(artifacts_dir):
+    with ParallelScorer(MODEL_FILE, MODELS_DIR, workers=2, chunk_rows=97, artifacts_dir=artifacts_dir) as scorer:
+        yield scorer
+
+
+def test_parallel_scorer_preserves_order(scorer):
+    """分块在多个工作进程中乱序完成时，结果仍按输入顺序拼接"""
+    raw_df = sample_raw_frame(2000, seed=31)
+    expected = predict_frame(get_registry(MODELS_DIR).get(MODEL_FILE), raw_df)
+    np.testing.assert_allclose(scorer.predict_frame(raw_df), expected, rtol=0, atol=TOLERANCE)
+
+
+def test_score_chunks_regroups_worker_results(scorer):
+    """流式预测时工作进程的结果按输入分块重新拼回，与逐块本地预测一致"""
+    entry = get_registry(MODELS_DIR).get(MODEL_FILE)
+    frames = [sample_raw_frame(rows, seed=rows) for rows in (150, 10, 400, 1)]
+    scored = list(_score_chunks(entry, iter(frames), scorer))
+    assert [frame is original for (frame, _), original in zip(scored, frames)] == [True] * len(frames)
+    for frame, predictions in scored:
+        np.testing.assert_allclose(predictions, predict_frame(entry, frame), rtol=0, atol=TOLERANCE)
@@ -0,0 +1,26 @@
+import time
+
+from perf_metrics import METRIC_NAME, PrometheusExporter, StageMetrics
+
+
+def test_exporter_writes_on_interval(tmp_path):
+    metrics = StageMetrics()
+    with metrics.span('predict'):
+        pass
+    path = tmp_path / 'metrics' / 'app.prom'
+    exporter = PrometheusExporter(metrics, str(path), interval=0.05)
+    deadline = time.monotonic() + 5
+    while exporter.exports < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    exporter.stop()
+    assert exporter.exports >= 2 and exporter.last_error is None
+    assert f'{METRIC_NAME}_count{{stage="predict"}} 1' in path.read_text(encoding='utf-8')
+
+
+def test_exporter_records_write_errors(tmp_path):
+    blocker = tmp_path / 'file'
+    blocker.write_text('')
+    exporter = PrometheusExporter(StageMetrics(), str(blocker / 'app.prom'), interval=3600)
+    assert not exporter.export()
+    assert exporter.last_error
+    exporter.stop()
@@ -0,0 +1,139 @@
+import contextlib
+import json
+import threading
+import time
+
+from prediction_logger import PredictionLogger
+
+
+class _Cursor:
+    def __init__(self, pool):
+        self.pool = pool
+
+    def execute(self, sql, params=None):
+        pass
+
+    def fetchone(self):
+        return (1,)
+
+    def executemany(self, sql, rows):
+        self.pool.before_write()
+        self.pool.rows.extend(rows)
+
+    def close(self):
+        pass
+
+
+class _Connection:
+    def __init__(self, pool):
+        self.pool = pool
+
+    def cursor(self):
+        return _Cursor(self.pool)
+
+    def commit(self):
+        pass
+
+
+class FakePool:
+    """记录写入行的连接池；failures 为接下来写入时依次抛出的异常"""
+
+    def __init__(self, failures=()):
+        self.rows = []
+        self.failures = list(failures)
+        self._lock = threading.Lock()
+
+    def before_write(self):
+        with self._lock:
+            if self.failures:
+                raise self.failures.pop(0)
+
+    @contextlib.contextmanager
+    def connection(self):
+        yield _Connection(self)
+
+
+def _row(i):
+    return {'input_features': json.dumps({'i': i}), 'predicted_risk': 0.5, 'risk_level': 'medium',
+            'session_id': 'test'}
+
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("等待超时")
+        time.sleep(0.01)
+
+
+def _logger(pool, spill_path):
+    return PredictionLogger(pool, batch_size=10, flush_interval=0.05, spill_path=str(spill_path))
+
+
+def test_non_database_error_is_spilled_and_thread_survives(tmp_path):
+    """写入时出现非数据库异常，整批溢写到磁盘，后台线程继续运行并在之后补写"""
+    pool = FakePool([RuntimeError("boom")])
+    logger = _logger(pool, tmp_path / "spill.jsonl")
+    try:
+        logger.log({'i': 0}, 0.5, 'medium', 'test')
+        _wait_for(lambda: logger.failed_batches == 1)
+        assert logger.last_error == "boom"
+        logger.log({'i': 1}, 0.5, 'medium', 'test')
+        _wait_for(lambda: len(pool.rows) == 2)
+        assert logger._thread.is_alive()
+        assert not (tmp_path / "spill.jsonl").exists()
+    finally:
+        logger.stop()
+
+
+def test_torn_spill_line_is_quarantined(tmp_path):
+    """溢写文件最后一行写了一半时，该行移到隔离文件，其余记录照常补写"""
+    spill_path = tmp_path / "spill.jsonl"
+    spill_path.write_text(json.dumps(_row(0)) + '\n' + json.dumps(_row(1)) + '\n{"input_featu', encoding='utf-8')
+    pool = FakePool()
+    logger = _logger(pool, spill_path)
+    try:
+        logger.log({'i': 2}, 0.5, 'medium', 'test')
+        _wait_for(lambda: len(pool.rows) == 3)
+        assert logger.quarantined == 1
+        assert (tmp_path / "spill.jsonl.bad").read_text(encoding='utf-8') == '{"input_featu\n'
+        assert logger._thread.is_alive()
+    finally:
+        logger.stop()
+
+
+def test_leftover_replay_file_is_replayed_on_startup(tmp_path):
+    """上次进程在补写中途退出留下的 .replay 文件在启动时补写"""
+    spill_path = tmp_path / "spill.jsonl"
+    (tmp_path / "spill.jsonl.replay").write_text(
+        ''.join(json.dumps(_row(i)) + '\n' for i in range(3)), encoding='utf-8')
+    pool = FakePool()
+    logger = _logger(pool, spill_path)
+    try:
+        _wait_for(lambda: len(pool.rows) == 3)
+        _wait_for(lambda: not (tmp_path / "spill.jsonl.replay").exists())
+    finally:
+        logger.stop()
+
+
+def test_replay_error_is_recorded_and_thread_survives(tmp_path, monkeypatch):
+    """补写过程中的文件错误只记录到 last_error，后台线程继续写入新记录"""
+    pool = FakePool()
+    logger = _logger(pool, tmp_path / "spill.jsonl")
+    failures = [OSError("disk")]
+    original = logger._replay_spill
+
+    def flaky_replay():
+        if failures:
+            raise failures.pop(0)
+        original()
+
+    monkeypatch.setattr(logger, '_replay_spill', flaky_replay)
+    try:
+        logger.log({'i': 0}, 0.5, 'medium', 'test')
+        _wait_for(lambda: logger.last_error == "disk")
+        logger.log({'i': 1}, 0.5, 'medium', 'test')
+        _wait_for(lambda: len(pool.rows) == 2)
+        assert logger._thread.is_alive()
+    finally:
+        logger.stop()
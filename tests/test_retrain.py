@@ -0,0 +1,96 @@
+import os
+
+import numpy as np
+import pytest
+from conftest import TOLERANCE
+
+from feature_pipeline import (CATEGORICAL_OPTIONS, RAW_FEATURE_COLUMNS, compile_encoder, predict_matrix,
+                              sample_raw_frame)
+from model_artifacts import load_pickled
+from retrain import HOLDOUT_COLUMN, SCALED_MODEL_TYPES, TrainingArrays, rows_to_columns, train_model
+from training_stats import TARGET_COLUMN
+
+
+def _database_rows(n_rows, seed=0):
+    """模拟 training_data 的查询结果：分类字段为文本，布尔字段为 TINYINT，末尾为目标值和留出集标记"""
+    raw_df = sample_raw_frame(n_rows, seed)
+    rng = np.random.default_rng(seed)
+    target = (0.2 * raw_df['curvature'] + 0.002 * raw_df['speed_limit'] + 0.1 * (raw_df['weather'] == 'foggy')
+              + 0.05 * raw_df['num_reported_accidents'] / 10 + rng.normal(0, 0.01, n_rows)).clip(0, 1)
+    rows = []
+    for i, record in enumerate(raw_df.to_dict('records')):
+        row = [int(record[col]) if isinstance(record[col], (bool, np.bool_)) else record[col]
+               for col in RAW_FEATURE_COLUMNS]
+        rows.append(tuple(row) + (float(target.iloc[i]), int(i % 5 == 0)))
+    return rows
+
+
+def test_rows_to_columns_encodes_compact_arrays():
+    rows = [
+        ('Urban', 2, 0.5, 60, 'night', ' Foggy', 1, 0, 'evening', 'false', '是', 3, 0.4, 0),
+        ('highway', 4, 0.1, 120, 'daylight', 'clear', 0, 1, 'morning', 'yes', '否', 0, 0.1, 1),
+    ]
+    columns = rows_to_columns(rows)
+    assert columns['road_type'].tolist() == [CATEGORICAL_OPTIONS['road_type'].index('urban'),
+                                             CATEGORICAL_OPTIONS['road_type'].index('highway')]
+    assert columns['weather'].tolist() == [CATEGORICAL_OPTIONS['weather'].index('foggy'), 0]
+    assert columns['road_type'].dtype == np.int8
+    assert columns['road_signs_present'].tolist() == [1, 0]
+    assert columns['holiday'].tolist() == [0, 1]
+    assert columns['school_season'].tolist() == [1, 0]
+    assert columns['speed_limit'].dtype == np.float32
+    np.testing.assert_allclose(columns[TARGET_COLUMN], [0.4, 0.1])
+    assert columns[HOLDOUT_COLUMN].tolist() == [0, 1]
+
+
+def test_rows_to_columns_rejects_invalid_values():
+    row = ('urban', 2, 0.5, 60, 'night', 'snowy', 1, 0, 'evening', 0, 1, 3, 0.4, 0)
+    with pytest.raises(ValueError, match="weather"):
+        rows_to_columns([row])
+    row = ('urban', 2, 0.5, 60, 'night', 'clear', 'maybe', 0, 'evening', 0, 1, 3, 0.4, 0)
+    with pytest.raises(ValueError, match="road_signs_present"):
+        rows_to_columns([row])
+
+
+def test_training_arrays_grow_past_capacity():
+    chunks = [rows_to_columns(_database_rows(n, seed)) for seed, n in enumerate([7, 30, 1, 64])]
+    arrays = TrainingArrays(capacity=10)
+    for chunk in chunks:
+        arrays.append(chunk)
+    result = arrays.finish()
+    assert arrays.rows == 102
+    for col, values in result.items():
+        np.testing.assert_array_equal(values, np.concatenate([chunk[col] for chunk in chunks]))
+        assert values.dtype == chunks[0][col].dtype
+    assert TrainingArrays().finish() == {}
+
+
+@pytest.fixture(scope="module")
+def training_dir(tmp_path_factory):
+    """按 retrain 的方式把训练数组写成 .npy 文件"""
+    directory = tmp_path_factory.mktemp("training")
+    arrays = TrainingArrays()
+    arrays.append(rows_to_columns(_database_rows(3000)))
+    for col, values in arrays.finish().items():
+        np.save(os.path.join(directory, f"{col}.npy"), values)
+    return str(directory)
+
+
+@pytest.mark.parametrize('model_type', ['linear_regression', 'ridge', 'lasso', 'lightgbm'])
+def test_train_model_writes_loadable_model(model_type, training_dir, tmp_path):
+    """训练得到的模型文件（及缩放器）按推理时的特征编码加载，预测与训练时的验证指标一致"""
+    result = train_model(model_type, training_dir, str(tmp_path), 'vtest')
+    assert result['rows'] == {'train': 2400, 'validation': 600}
+    model, scaler, _ = load_pickled(str(tmp_path), result['model_file'])
+    encoder = compile_encoder(model_type, model, scaler)
+    # 线性模型与 models/ 中现有的模型一样带缩放器，且推理时能折叠进编码器
+    assert (scaler is not None) == (model_type in SCALED_MODEL_TYPES)
+    assert encoder.scaled == (model_type in SCALED_MODEL_TYPES)
+
+    columns = {col: np.load(os.path.join(training_dir, f"{col}.npy")) for col in RAW_FEATURE_COLUMNS}
+    target = np.load(os.path.join(training_dir, f"{TARGET_COLUMN}.npy")).astype(np.float64)
+    validation = np.load(os.path.join(training_dir, f"{HOLDOUT_COLUMN}.npy")) != 0
+    predictions = predict_matrix(model, encoder.encode_columns(columns))
+    mse = float(np.mean((predictions[validation] - target[validation]) ** 2))
+    np.testing.assert_allclose(mse, result['metrics']['validation']['mse'], rtol=1e-5, atol=TOLERANCE)
+    assert result['metrics']['validation']['r2'] > 0.5
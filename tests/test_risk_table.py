@@ -0,0 +1,40 @@
+import os
+
+import pytest
+from conftest import MODELS_DIR
+
+import risk_table
+from model_registry import available_models, get_registry
+from risk_table import DEFAULT_TOLERANCE, get_risk_table, load_table, materialize, table_paths, verify
+
+# 网格最小的模型，风险表可以在测试中生成
+XGBOOST_FILE = next(f for f in available_models(MODELS_DIR) if f.startswith('xgboost'))
+
+
+@pytest.fixture(scope="module")
+def entry():
+    return get_registry(MODELS_DIR).get(XGBOOST_FILE)
+
+
+def test_materialize_writes_table_and_manifest(entry, tmp_path):
+    tables_dir = str(tmp_path)
+    manifest = materialize(entry, tables_dir)
+    data_path, manifest_path = table_paths(tables_dir, entry.filename)
+    assert sorted(os.listdir(tables_dir)) == sorted(os.path.basename(p) for p in (data_path, manifest_path))
+
+    table = load_table(entry, tables_dir)
+    assert table is not None and table.manifest == manifest
+    assert verify(entry, table, samples=2000)['max_abs_diff'] <= DEFAULT_TOLERANCE
+
+
+def test_missing_table_rechecked(entry, tmp_path, monkeypatch):
+    """风险表不存在的结果只缓存 MISSING_RECHECK_SECONDS 秒，之后生成的风险表无需重启即可使用"""
+    tables_dir = str(tmp_path)
+    assert get_risk_table(entry, tables_dir) is None
+    materialize(entry, tables_dir)
+    assert get_risk_table(entry, tables_dir) is None
+
+    monkeypatch.setattr(risk_table, 'MISSING_RECHECK_SECONDS', 0)
+    table = get_risk_table(entry, tables_dir)
+    assert table is not None
+    assert get_risk_table(entry, tables_dir) is table
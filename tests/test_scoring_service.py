@@ -0,0 +1,110 @@
+import asyncio
+import json
+
+import numpy as np
+import pytest
+from conftest import MODELS_DIR, TOLERANCE
+
+from feature_pipeline import predict_one, sample_raw_frame
+from model_registry import get_registry
+from scoring_service import ScoringApp, ScoringService
+
+
+@pytest.fixture(scope="module")
+def app():
+    return ScoringApp(ScoringService(MODELS_DIR))
+
+
+def call(app, method, path, body=None):
+    """在进程内发送一次ASGI请求，返回 (状态码, 解析后的响应体)"""
+    if body is not None and not isinstance(body, bytes):
+        body = json.dumps(body).encode('utf-8')
+    scope = {'type': 'http', 'method': method, 'path': path}
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': body or b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(app(scope, receive, send))
+    status = messages[0]['status']
+    data = messages[1]['body']
+    headers = dict(messages[0]['headers'])
+    if headers[b'content-type'].startswith(b'application/json'):
+        return status, json.loads(data)
+    return status, data.decode('utf-8')
+
+
+def _records(samples, seed):
+    return json.loads(sample_raw_frame(samples, seed=seed).to_json(orient='records'))
+
+
+def test_health(app):
+    status, body = call(app, 'GET', '/health')
+    assert status == 200
+    assert body['status'] == 'ok'
+    assert body['default_model'] == app.service.default_model
+
+
+def test_predict_matches_predict_one(app):
+    record = _records(1, seed=11)[0]
+    status, body = call(app, 'POST', '/predict', {'input': record})
+    assert status == 200
+    entry = get_registry(MODELS_DIR).get(body['model'])
+    assert abs(body['risk'] - predict_one(entry, record)) <= TOLERANCE
+    assert body['source'] in ('table', 'cache', 'model')
+
+
+def test_predict_batch_matches_single(app):
+    records = _records(50, seed=12)
+    status, body = call(app, 'POST', '/predict/batch', {'inputs': records})
+    assert status == 200
+    assert body['rows'] == len(records)
+    single = [call(app, 'POST', '/predict', {'input': record})[1]['risk'] for record in records]
+    np.testing.assert_allclose(body['risks'], single, rtol=0, atol=TOLERANCE)
+
+    columns = {col: [record[col] for record in records] for col in records[0]}
+    status, by_column = call(app, 'POST', '/predict/batch', {'inputs': columns})
+    assert status == 200
+    assert by_column['risks'] == body['risks']
+
+
+@pytest.mark.parametrize('model', ['../secrets.toml', '/etc/passwd', 'models/xgboost.pkl', ['x'], {'a': 1}, 1, ''])
+def test_invalid_model_name_rejected(app, model):
+    record = _records(1, seed=13)[0]
+    for path, body in (('/predict', {'model': model, 'input': record}),
+                       ('/predict/batch', {'model': model, 'inputs': [record]})):
+        status, response = call(app, 'POST', path, body)
+        assert status == 400, (path, model, response)
+
+
+def test_unknown_model_not_found(app):
+    status, _ = call(app, 'POST', '/predict', {'model': 'missing.pkl', 'input': _records(1, seed=14)[0]})
+    assert status == 404
+
+
+@pytest.mark.parametrize('path,body', [
+    ('/predict', {'input': None}),
+    ('/predict', {'input': [1, 2]}),
+    ('/predict', {'input': 'weather'}),
+    ('/predict', {'input': {'weather': 'clear'}}),
+    ('/predict/batch', {'inputs': None}),
+    ('/predict/batch', {'inputs': []}),
+    ('/predict/batch', {'inputs': [None]}),
+    ('/predict/batch', {'inputs': [[1, 2]]}),
+    ('/predict/batch', {'inputs': {'weather': 'clear'}}),
+    ('/predict', b'not json'),
+    ('/predict', [1, 2]),
+    ('/predict/batch', b'null'),
+])
+def test_bad_payload_rejected(app, path, body):
+    status, response = call(app, 'POST', path, body)
+    assert status == 400, response
+    assert 'error' in response
+
+
+def test_unknown_route_and_method(app):
+    assert call(app, 'GET', '/nothing')[0] == 404
+    assert call(app, 'GET', '/predict')[0] == 405
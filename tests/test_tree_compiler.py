@@ -0,0 +1,64 @@
+import warnings
+
+import numpy as np
+import pytest
+from conftest import MODELS_DIR, TOLERANCE, native_predict
+
+from feature_pipeline import compile_encoder, normalize_input, raw_columns_from_frame, sample_raw_frame
+from model_artifacts import available_models, infer_model_type, load_artifact, load_pickled
+from tree_compiler import compile_trees, parity_matrices
+
+TREE_MODEL_FILES = [f for f in available_models(MODELS_DIR) if infer_model_type(f) in ('lightgbm', 'xgboost')]
+
+
+def _compiled_predictions(model_type, model, columns):
+    encoder = compile_encoder(model_type, model)
+    return np.clip(compile_trees(model).predict(encoder.encode_columns(columns)), 0.0, 1.0)
+
+
+@pytest.mark.parametrize('model_file', TREE_MODEL_FILES)
+def test_compiled_trees_match_native(model_file, raw_columns):
+    """编译后的树与原生库在 pandas 分类输入上的预测一致"""
+    model_type = infer_model_type(model_file)
+    model, _, _ = load_pickled(MODELS_DIR, model_file)
+    np.testing.assert_allclose(_compiled_predictions(model_type, model, raw_columns),
+                               native_predict(model_type, model, None, raw_columns), rtol=0, atol=TOLERANCE)
+
+
+@pytest.mark.parametrize('model_file', TREE_MODEL_FILES)
+def test_compiled_artifact_trees_match_native(model_file, artifacts_dir, raw_columns):
+    """由导出产物编译的树与 pickle 中的原模型在原生输入上的预测一致"""
+    model_type = infer_model_type(model_file)
+    artifact_model = load_artifact(artifacts_dir, model_file)[0]
+    original, _, _ = load_pickled(MODELS_DIR, model_file)
+    np.testing.assert_allclose(_compiled_predictions(model_type, artifact_model, raw_columns),
+                               native_predict(model_type, original, None, raw_columns), rtol=0, atol=TOLERANCE)
+
+
+@pytest.mark.parametrize('model_file', TREE_MODEL_FILES)
+def test_compiled_trees_single_rows(model_file):
+    """逐条预测（在线请求的形态）与原生库一致"""
+    model_type = infer_model_type(model_file)
+    model, _, _ = load_pickled(MODELS_DIR, model_file)
+    trees = compile_trees(model)
+    encoder = compile_encoder(model_type, model)
+    raw_df = sample_raw_frame(50, seed=11)
+    single = [trees.predict(encoder.encode_one(normalize_input(row)))[0] for row in raw_df.to_dict('records')]
+    np.testing.assert_allclose(np.clip(single, 0.0, 1.0),
+                               native_predict(model_type, model, None, raw_columns_from_frame(raw_df)),
+                               rtol=0, atol=TOLERANCE)
+
+
+@pytest.mark.parametrize('model_file', TREE_MODEL_FILES)
+def test_compiled_trees_at_split_thresholds(model_file):
+    """特征取值落在分裂阈值及其相邻浮点数上、或带缺失值时，与原生库走相同的分支"""
+    model_type = infer_model_type(model_file)
+    model, _, _ = load_pickled(MODELS_DIR, model_file)
+    trees = compile_trees(model)
+    dtype = compile_encoder(model_type, model).dtype
+    for name, matrix in parity_matrices(trees, samples=5000, seed=5).items():
+        matrix = matrix.astype(dtype)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            expected = np.asarray(model.predict(matrix), dtype=float)
+        np.testing.assert_allclose(trees.predict(matrix), expected, rtol=0, atol=TOLERANCE, err_msg=name)
@@ -0,0 +1,135 @@
+import threading
+from collections import OrderedDict
+
+import plotly.express as px
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+
+from feature_pipeline import BOOLEAN_COLUMNS, CATEGORICAL_OPTIONS, NUMERIC_COLUMNS
+from training_stats import GROUP_COLUMNS, MOMENT_COLUMNS, NUMERIC_BIN_WIDTHS, TARGET_COLUMN
+
+# 字段名 -> 图表中显示的名称
+FIELD_LABELS = {
+    'road_type': '道路类型',
+    'num_lanes': '车道数',
+    'curvature': '曲率',
+    'speed_limit': '限速',
+    'lighting': '光照条件',
+    'weather': '天气',
+    'road_signs_present': '有道路标志',
+    'public_road': '公共道路',
+    'time_of_day': '时段',
+    'holiday': '节假日',
+    'school_season': '学期内',
+    'num_reported_accidents': '事故报告数',
+    TARGET_COLUMN: '事故概率',
+}
+
+
+def _label(column):
+    return FIELD_LABELS.get(column, column)
+
+
+def risk_histogram_figure(summary):
+    """事故概率分布直方图"""
+    bins = summary.bin_summary(TARGET_COLUMN)
+    fig = go.Figure(go.Bar(
+        x=(bins['left'] + bins['right']) / 2, y=bins['count'], width=bins['right'] - bins['left'],
+        customdata=bins[['left', 'right']],
+        hovertemplate="事故概率 %{customdata[0]:.2f} ~ %{customdata[1]:.2f}<br>样本数 %{y:,}<extra></extra>"))
+    fig.update_layout(xaxis_title="事故概率", yaxis_title="样本数", bargap=0)
+    return fig
+
+
+def group_mean_figure(summary, columns):
+    """各字段不同取值下的平均事故概率，柱子标注样本占比"""
+    cols = 2
+    rows = (len(columns) + cols - 1) // cols
+    fig = make_subplots(rows=rows, cols=cols, subplot_titles=[_label(col) for col in columns])
+    for i, column in enumerate(columns):
+        group = summary.group_summary(column)
+        fig.add_trace(go.Bar(
+            x=group['value'], y=group['mean_risk'], error_y={'type': 'data', 'array': group['std_risk']},
+            text=[f"{share:.1%}" for share in group['share']], customdata=group[['count', 'std_risk']],
+            hovertemplate="%{x}<br>平均事故概率 %{y:.4f}<br>标准差 %{customdata[1]:.4f}<br>"
+                          "样本数 %{customdata[0]:,}<extra></extra>",
+            name=_label(column), showlegend=False), row=i // cols + 1, col=i % cols + 1)
+    fig.update_yaxes(title_text="平均事故概率")
+    fig.update_layout(height=320 * rows)
+    return fig
+
+
+def numeric_distribution_figure(summary, column):
+    """数值字段的分布（柱）与各区间平均事故概率（折线）"""
+    bins = summary.bin_summary(column)
+    # 整数字段按原值分组，横轴为取值；连续字段横轴为区间中点
+    x = (bins['left'] + bins['right']) / 2 if column in NUMERIC_BIN_WIDTHS else bins['left']
+    fig = make_subplots(specs=[[{'secondary_y': True}]])
+    fig.add_trace(go.Bar(x=x, y=bins['count'], name="样本数", opacity=0.7), secondary_y=False)
+    fig.add_trace(go.Scatter(x=x, y=bins['mean_risk'], name="平均事故概率", mode='lines+markers'),
+                  secondary_y=True)
+    fig.update_xaxes(title_text=_label(column))
+    fig.update_yaxes(title_text="样本数", secondary_y=False)
+    fig.update_yaxes(title_text="平均事故概率", secondary_y=True)
+    return fig
+
+
+def _heatmap(matrix, zmin, zmax, color_scale):
+    labels = [_label(col) for col in matrix.columns]
+    fig = px.imshow(matrix.to_numpy(), x=labels, y=labels, zmin=zmin, zmax=zmax,
+                    color_continuous_scale=color_scale, text_auto='.2f', aspect='auto')
+    fig.update_layout(height=max(400, 60 * len(labels)))
+    return fig
+
+
+def cramers_v_figure(summary, columns=GROUP_COLUMNS):
+    """分类型与布尔型字段两两之间的克莱姆V热力图"""
+    return _heatmap(summary.cramers_v(columns), 0, 1, 'Blues')
+
+
+def correlation_figure(summary, columns=MOMENT_COLUMNS):
+    """数值字段与事故概率的皮尔逊相关系数热力图"""
+    return _heatmap(summary.correlation(columns), -1, 1, 'RdBu_r')
+
+
+# 图表名称 -> (说明, 根据汇总生成图表的函数)
+INTERACTIVE_CHARTS = {
+    "事故概率分布直方图": ("展示事故概率的整体分布情况", risk_histogram_figure),
+    "分类型各个情况事故发生平均概率": ("各类别特征不同取值下的事故平均概率，误差线为标准差",
+                          lambda summary: group_mean_figure(summary, list(CATEGORICAL_OPTIONS))),
+    "布尔型事故发生平均概率分布图": ("布尔型特征不同取值下的事故平均概率，误差线为标准差",
+                         lambda summary: group_mean_figure(summary, BOOLEAN_COLUMNS)),
+    "分类型克莱姆V热力图": ("分类变量之间的关联强度热力图", cramers_v_figure),
+    "曲率——事故报告数——事故发生概率相关性热力图": (
+        "曲率、事故报告数与事故概率的相关性热力图",
+        lambda summary: correlation_figure(summary, ['curvature', 'num_reported_accidents', TARGET_COLUMN])),
+    "数值型特征与事故概率相关性热力图": ("所有数值型特征与事故概率的相关性热力图", correlation_figure),
+}
+INTERACTIVE_CHARTS.update({
+    f"{_label(column)}分布与平均事故概率": (
+        f"{_label(column)}的样本分布及各区间的平均事故概率",
+        lambda summary, column=column: numeric_distribution_figure(summary, column))
+    for column in NUMERIC_COLUMNS
+})
+
+# 最多缓存的图表数，汇总更新后旧图表自然被淘汰
+MAX_CACHED_FIGURES = 32
+
+_figures = OrderedDict()
+_figures_lock = threading.Lock()
+
+
+def build_figure(name, summary):
+    """生成指定图表，同一份汇总的同一图表只生成一次，各会话共享"""
+    key = (name, id(summary), summary.built_at)
+    with _figures_lock:
+        figure = _figures.get(key)
+        if figure is not None:
+            _figures.move_to_end(key)
+            return figure
+    figure = INTERACTIVE_CHARTS[name][1](summary)
+    with _figures_lock:
+        _figures[key] = figure
+        while len(_figures) > MAX_CACHED_FIGURES:
+            _figures.popitem(last=False)
+    return figure
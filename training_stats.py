@@ -0,0 +1,308 @@
+import itertools
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+from mysql.connector import Error
+
+from feature_pipeline import BOOLEAN_COLUMNS, CATEGORICAL_OPTIONS, NUMERIC_COLUMNS
+
+TRAINING_TABLE = "training_data"
+TARGET_COLUMN = "accident_risk"
+ID_COLUMN = "id"
+# 联合分组统计的字段：分类型和布尔型字段的组合最多 3^4 * 2^4 个格子，由此可推出各字段的均值和两两列联表
+GROUP_COLUMNS = list(CATEGORICAL_OPTIONS) + BOOLEAN_COLUMNS
+# 参与相关系数计算的字段
+MOMENT_COLUMNS = NUMERIC_COLUMNS + [TARGET_COLUMN]
+# 事故概率直方图的分箱数，事故概率取值范围为 [0, 1]
+RISK_BINS = 50
+# 数值字段的分箱宽度，未列出的字段为整数取值，按原值分组
+NUMERIC_BIN_WIDTHS = {'curvature': 0.05}
+
+# 留出集按主键取模划分：重新训练和模型评估使用同一划分，新增的行按同样的规则落入训练集或留出集
+HOLDOUT_BUCKETS = 100
+DEFAULT_HOLDOUT_FRACTION = 0.2
+
+# 两次检查版本标记之间的最短间隔（秒），期间直接使用缓存，不访问数据库
+DEFAULT_CHECK_INTERVAL = 300
+# 增量更新无法发现已有行的修改和删除，间隔较长时间后整表重新统计一次（秒）
+DEFAULT_RESYNC_INTERVAL = 86400
+
+# 版本标记查询，按顺序尝试：有自增主键时可以只统计新增的行，否则使用表的近似行数和更新时间
+MARKER_QUERIES = [
+    f"SELECT COUNT(*), MAX({ID_COLUMN}) FROM {TRAINING_TABLE}",
+    f"""SELECT TABLE_ROWS, UPDATE_TIME FROM information_schema.TABLES
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = '{TRAINING_TABLE}'""",
+]
+
+
+def holdout_condition(fraction=DEFAULT_HOLDOUT_FRACTION):
+    """行属于留出集的 SQL 条件"""
+    return f"MOD({ID_COLUMN}, {HOLDOUT_BUCKETS}) < {int(round(fraction * HOLDOUT_BUCKETS))}"
+
+
+def _group_label(column, value):
+    """分组取值统一为字符串：布尔字段兼容 TINYINT 和字符串两种存储方式"""
+    if column in BOOLEAN_COLUMNS:
+        return 'True' if str(value).strip().lower() in ('1', 'true', 'yes') else 'False'
+    return str(value).strip().lower()
+
+
+def _joint_query(where):
+    columns = ', '.join(GROUP_COLUMNS)
+    return (f"SELECT {columns}, COUNT(*), SUM({TARGET_COLUMN}), SUM({TARGET_COLUMN} * {TARGET_COLUMN}) "
+            f"FROM {TRAINING_TABLE} {where} GROUP BY {columns}")
+
+
+def _moment_query(where):
+    sums = [f"SUM({col})" for col in MOMENT_COLUMNS]
+    products = [f"SUM({a} * {b})" for a, b in itertools.combinations_with_replacement(MOMENT_COLUMNS, 2)]
+    return f"SELECT COUNT(*), {', '.join(sums + products)} FROM {TRAINING_TABLE} {where}"
+
+
+def _bins_query(where):
+    """事故概率与各数值字段的分箱计数，合并为一个 UNION ALL 查询"""
+    risk_bin = f"LEAST(GREATEST(FLOOR({TARGET_COLUMN} * {RISK_BINS}), 0), {RISK_BINS - 1})"
+    parts = [f"SELECT '{TARGET_COLUMN}', {risk_bin} AS bin, COUNT(*), SUM({TARGET_COLUMN}) "
+             f"FROM {TRAINING_TABLE} {where} GROUP BY bin"]
+    for col in NUMERIC_COLUMNS:
+        width = NUMERIC_BIN_WIDTHS.get(col, 1)
+        parts.append(f"SELECT '{col}', FLOOR({col} / {width}) AS bin, COUNT(*), SUM({TARGET_COLUMN}) "
+                     f"FROM {TRAINING_TABLE} {where} GROUP BY bin")
+    return " UNION ALL ".join(parts)
+
+
+def _cramers_v(table):
+    """列联表的克莱姆V系数"""
+    n = table.sum()
+    rows, cols = table.shape
+    if n == 0 or min(rows, cols) < 2:
+        return 0.0
+    expected = np.outer(table.sum(axis=1), table.sum(axis=0)) / n
+    with np.errstate(divide='ignore', invalid='ignore'):
+        chi2 = np.nansum(np.where(expected > 0, (table - expected) ** 2 / expected, 0.0))
+    return float(np.sqrt(chi2 / n / (min(rows, cols) - 1)))
+
+
+class TrainingSummary:
+    """训练数据的可加汇总：联合分组计数、分箱计数和一、二阶矩；两份汇总相加即为合并后数据的汇总"""
+
+    def __init__(self, joint=None, bins=None, moments=None, version=None, built_at=None):
+        # (分组取值...) -> [行数, 事故概率之和, 事故概率平方和]
+        self.joint = joint or {}
+        # 字段 -> {分箱编号: [行数, 事故概率之和]}
+        self.bins = bins or {}
+        # 行数、各字段之和、两两乘积之和（上三角展开）
+        k = len(MOMENT_COLUMNS)
+        self.moments = moments if moments is not None else np.zeros(1 + k + k * (k + 1) // 2)
+        self.version = version
+        self.built_at = built_at or time.time()
+        # 汇总创建后不再修改，由其推出的表格只计算一次
+        self._joint_frame = None
+
+    @classmethod
+    def query(cls, cursor, min_id=None):
+        """在数据库端聚合，只取回汇总结果；min_id 不为空时只统计主键大于该值的行"""
+        where, params = "", ()
+        if min_id is not None:
+            where, params = f"WHERE {ID_COLUMN} > %s", (min_id,)
+
+        joint = {}
+        cursor.execute(_joint_query(where), params)
+        for row in cursor.fetchall():
+            key = tuple(_group_label(col, value) for col, value in zip(GROUP_COLUMNS, row))
+            cell = joint.setdefault(key, [0, 0.0, 0.0])
+            cell[0] += int(row[-3])
+            cell[1] += float(row[-2] or 0.0)
+            cell[2] += float(row[-1] or 0.0)
+
+        cursor.execute(_moment_query(where), params)
+        moments = np.array([float(value or 0.0) for value in cursor.fetchone()])
+
+        bins = {}
+        cursor.execute(_bins_query(where), params * (1 + len(NUMERIC_COLUMNS)))
+        for column, bin_id, count, risk_sum in cursor.fetchall():
+            if bin_id is None:
+                continue
+            cell = bins.setdefault(column, {}).setdefault(int(bin_id), [0, 0.0])
+            cell[0] += int(count)
+            cell[1] += float(risk_sum or 0.0)
+        return cls(joint, bins, moments)
+
+    def merge(self, other):
+        """返回两份汇总相加后的新汇总"""
+        joint = {key: list(cell) for key, cell in self.joint.items()}
+        for key, cell in other.joint.items():
+            merged = joint.setdefault(key, [0, 0.0, 0.0])
+            for i, value in enumerate(cell):
+                merged[i] += value
+        bins = {col: {b: list(cell) for b, cell in cells.items()} for col, cells in self.bins.items()}
+        for col, cells in other.bins.items():
+            for b, cell in cells.items():
+                merged = bins.setdefault(col, {}).setdefault(b, [0, 0.0])
+                merged[0] += cell[0]
+                merged[1] += cell[1]
+        return TrainingSummary(joint, bins, self.moments + other.moments)
+
+    @property
+    def rows(self):
+        return int(self.moments[0])
+
+    def joint_frame(self):
+        """联合分组表：每个分组一行，包含行数与事故概率之和"""
+        if self._joint_frame is None:
+            records = [key + tuple(cell) for key, cell in self.joint.items()]
+            self._joint_frame = pd.DataFrame(records, columns=GROUP_COLUMNS + ['count', 'risk_sum', 'risk_sq_sum'])
+        return self._joint_frame
+
+    def group_summary(self, column):
+        """字段各取值的样本数、占比、平均事故概率和标准差"""
+        grouped = self.joint_frame().groupby(column)[['count', 'risk_sum', 'risk_sq_sum']].sum()
+        grouped = grouped[grouped['count'] > 0]
+        mean = grouped['risk_sum'] / grouped['count']
+        variance = (grouped['risk_sq_sum'] / grouped['count'] - mean ** 2).clip(lower=0)
+        order = CATEGORICAL_OPTIONS.get(column, ['False', 'True'])
+        result = pd.DataFrame({
+            'value': grouped.index,
+            'count': grouped['count'].astype(int).values,
+            'share': (grouped['count'] / grouped['count'].sum()).values,
+            'mean_risk': mean.values,
+            'std_risk': np.sqrt(variance).values,
+        })
+        result['order'] = result['value'].map({value: i for i, value in enumerate(order)}).fillna(len(order))
+        return result.sort_values(['order', 'value']).drop(columns='order').reset_index(drop=True)
+
+    def bin_summary(self, column):
+        """分箱计数：事故概率或数值字段每个区间的样本数和平均事故概率"""
+        cells = self.bins.get(column, {})
+        width = 1.0 / RISK_BINS if column == TARGET_COLUMN else NUMERIC_BIN_WIDTHS.get(column, 1)
+        records = [(b * width, (b + 1) * width, count, risk_sum / count if count else 0.0)
+                   for b, (count, risk_sum) in sorted(cells.items())]
+        return pd.DataFrame(records, columns=['left', 'right', 'count', 'mean_risk'])
+
+    def cramers_v(self, columns=GROUP_COLUMNS):
+        """分类型和布尔型字段两两之间的克莱姆V系数矩阵"""
+        joint = self.joint_frame()
+        matrix = pd.DataFrame(np.eye(len(columns)), index=columns, columns=columns)
+        for a, b in itertools.combinations(columns, 2):
+            table = joint.groupby([a, b])['count'].sum().unstack(fill_value=0)
+            matrix.loc[a, b] = matrix.loc[b, a] = _cramers_v(table.to_numpy(dtype=float))
+        return matrix
+
+    def correlation(self, columns=MOMENT_COLUMNS):
+        """由一、二阶矩计算数值字段与事故概率之间的皮尔逊相关系数矩阵"""
+        k = len(MOMENT_COLUMNS)
+        n = self.moments[0]
+        if n < 2:
+            return pd.DataFrame(np.nan, index=columns, columns=columns)
+        sums = self.moments[1:1 + k]
+        products = np.zeros((k, k))
+        for value, (i, j) in zip(self.moments[1 + k:], itertools.combinations_with_replacement(range(k), 2)):
+            products[i, j] = products[j, i] = value
+        covariance = products / n - np.outer(sums, sums) / n ** 2
+        std = np.sqrt(np.clip(np.diag(covariance), 0, None))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            corr = covariance / np.outer(std, std)
+        index = [MOMENT_COLUMNS.index(col) for col in columns]
+        return pd.DataFrame(corr[np.ix_(index, index)], index=columns, columns=columns)
+
+
+class TrainingStatsCache:
+    """进程级训练数据统计缓存：版本标记变化时只统计新增的行并与已有汇总合并，无法增量时整表重新统计"""
+
+    def __init__(self, pool, check_interval=DEFAULT_CHECK_INTERVAL, resync_interval=DEFAULT_RESYNC_INTERVAL):
+        self.pool = pool
+        self.check_interval = check_interval
+        self.resync_interval = resync_interval
+        self._lock = threading.Lock()
+        self._summary = None
+        self._checked_at = 0.0
+        self._synced_at = 0.0
+        self._marker_query = None
+        self.full_builds = 0
+        self.incremental_updates = 0
+        self.last_build_seconds = None
+
+    def _read_marker(self, cursor):
+        """读取版本标记，记住第一个可用的查询"""
+        queries = [self._marker_query] if self._marker_query else MARKER_QUERIES
+        last_error = None
+        for query in queries:
+            try:
+                cursor.execute(query)
+                marker = cursor.fetchone()
+                self._marker_query = query
+                return marker
+            except Error as e:
+                last_error = e
+        raise last_error
+
+    def _can_append(self, marker):
+        """只有按自增主键比较、且行数和最大主键都没有减少时才能增量统计"""
+        if self._summary is None or self._marker_query != MARKER_QUERIES[0]:
+            return False
+        old_rows, old_max_id = self._summary.version
+        rows, max_id = marker
+        return old_max_id is not None and max_id is not None and rows >= old_rows and max_id >= old_max_id
+
+    def get(self):
+        """获取训练数据汇总；check_interval 内不访问数据库"""
+        with self._lock:
+            now = time.monotonic()
+            if self._summary is not None and now - self._checked_at < self.check_interval:
+                return self._summary
+
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                marker = tuple(self._read_marker(cursor))
+                resync = now - self._synced_at > self.resync_interval
+                if self._summary is None or resync or marker != self._summary.version:
+                    start = time.perf_counter()
+                    summary = None
+                    if not resync and self._can_append(marker):
+                        delta = TrainingSummary.query(cursor, self._summary.version[1])
+                        # 新增行数与行数变化不一致说明有删除，改为整表重新统计
+                        if self._summary.rows + delta.rows == marker[0]:
+                            summary = self._summary.merge(delta)
+                            self.incremental_updates += 1
+                    if summary is None:
+                        summary = TrainingSummary.query(cursor)
+                        self.full_builds += 1
+                        self._synced_at = now
+                    summary.version = marker
+                    self._summary = summary
+                    self.last_build_seconds = time.perf_counter() - start
+                cursor.close()
+
+            self._checked_at = now
+            return self._summary
+
+    def invalidate(self):
+        """使缓存失效，下次获取时整表重新统计"""
+        with self._lock:
+            self._summary = None
+            self._checked_at = 0.0
+
+    def stats(self):
+        summary = self._summary
+        return {
+            '训练数据行数': summary.rows if summary is not None else None,
+            '统计时间': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(summary.built_at)) if summary else None,
+            '整表统计次数': self.full_builds,
+            '增量更新次数': self.incremental_updates,
+            '最近统计耗时(s)': round(self.last_build_seconds, 3) if self.last_build_seconds is not None else None,
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_training_stats_cache(pool, **kwargs):
+    """获取进程内共享的训练数据统计缓存"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = TrainingStatsCache(pool, **kwargs)
+        return _cache
@@ -0,0 +1,363 @@
+import json
+
+import numpy as np
+
+# 编译后的树一次评估的行数，控制 (树数, 行数) 节点状态矩阵的大小
+DEFAULT_BLOCK_ROWS = 1024
+# 分类分裂用64位掩码表示，类别编码必须小于该值
+MAX_CATEGORY = 64
+# LightGBM判断零值缺失时使用的阈值
+ZERO_THRESHOLD = 1e-35
+
+# 推理引擎: auto 在小批量时使用编译后的树、大批量时使用原生库；compiled 总是使用编译后的树；native 不编译
+TREE_ENGINES = ('auto', 'compiled', 'native')
+DEFAULT_TREE_ENGINE = 'auto'
+# auto 模式下使用编译后的树的最大行数；超过时原生库的多行批处理更快
+DEFAULT_COMPILED_MAX_ROWS = 4
+
+# 节点的缺失值处理方式
+MISSING_NONE = 0   # NaN 按 0 参与比较
+MISSING_ZERO = 1   # 0 和 NaN 走默认方向
+MISSING_NAN = 2    # NaN 走默认方向
+
+# 输出为恒等变换的目标函数，编译后的树直接输出叶子值之和
+LIGHTGBM_IDENTITY_OBJECTIVES = ('regression', 'regression_l1', 'huber', 'fair', 'quantile', 'mape')
+XGBOOST_IDENTITY_OBJECTIVES = ('reg:squarederror', 'reg:absoluteerror', 'reg:pseudohubererror',
+                               'reg:quantileerror')
+LIGHTGBM_MISSING_TYPES = {'None': MISSING_NONE, 'Zero': MISSING_ZERO, 'NaN': MISSING_NAN}
+
+
+class _NodeBuilder:
+    """收集所有树的节点，节点下标在整个模型内全局编号"""
+
+    def __init__(self):
+        self.feature = []
+        self.threshold = []
+        self.left = []
+        self.right = []
+        self.value = []
+        self.default_left = []
+        self.missing = []
+        self.categorical = []
+        self.category_mask = []
+        # 训练时落入节点的样本数（LightGBM）或海森和（XGBoost），用于计算节点的期望输出
+        self.cover = []
+        self.roots = []
+
+    def add(self, feature=0, threshold=0.0, default_left=False, missing=MISSING_NONE,
+            categories=None, value=0.0, cover=0.0):
+        """追加一个节点，子节点先指向自身（叶子保持不动），由 link 设置"""
+        index = len(self.feature)
+        mask = 0
+        if categories is not None:
+            for category in categories:
+                if not 0 <= category < MAX_CATEGORY:
+                    raise ValueError(f"分类取值 {category} 超出编译支持的范围 [0, {MAX_CATEGORY})")
+                mask |= 1 << category
+        self.feature.append(feature)
+        self.threshold.append(threshold)
+        self.left.append(index)
+        self.right.append(index)
+        self.value.append(value)
+        self.default_left.append(default_left)
+        self.missing.append(missing)
+        self.categorical.append(categories is not None)
+        self.category_mask.append(mask)
+        self.cover.append(cover)
+        return index
+
+    def link(self, node, left, right):
+        self.left[node] = left
+        self.right[node] = right
+
+
+class CompiledEnsemble:
+    """展平为连续 NumPy 节点数组的提升树模型，按行块对所有树同时做向量化遍历"""
+
+    def __init__(self, builder, n_features, base_score, max_depth, dtype, strict, source,
+                 block_rows=DEFAULT_BLOCK_ROWS):
+        self.feature = np.asarray(builder.feature, dtype=np.intp)
+        self.threshold = np.asarray(builder.threshold, dtype=dtype)
+        self.left = np.asarray(builder.left, dtype=np.intp)
+        self.right = np.asarray(builder.right, dtype=np.intp)
+        self.value = np.asarray(builder.value, dtype=dtype)
+        self.default_left = np.asarray(builder.default_left, dtype=bool)
+        self.missing = np.asarray(builder.missing, dtype=np.int8)
+        self.categorical = np.asarray(builder.categorical, dtype=bool)
+        self.category_mask = np.asarray(builder.category_mask, dtype=np.uint64)
+        self.cover = np.asarray(builder.cover, dtype=np.float64)
+        self.roots = np.asarray(builder.roots, dtype=np.intp)
+        self.is_leaf = self.left == np.arange(len(self.left))
+        # 节点的期望输出，首次计算特征贡献时生成
+        self._node_mean = None
+
+        self.base_score = dtype(base_score)
+        self.max_depth = max_depth
+        self.dtype = dtype
+        # XGBoost 的分裂条件为 x < 阈值，LightGBM 为 x <= 阈值
+        self.strict = strict
+        self.source = source
+        self.block_rows = block_rows
+        self.n_trees = len(self.roots)
+        self.n_nodes = len(self.feature)
+        self.n_features_in_ = n_features
+        self._has_categorical = bool(self.categorical.any())
+        self._has_zero_missing = bool((self.missing[~self.is_leaf] == MISSING_ZERO).any())
+
+    def predict(self, features):
+        """对特征矩阵打分，返回 float64 预测值"""
+        features = np.asarray(features, dtype=self.dtype)
+        n_rows = features.shape[0]
+        out = np.empty(n_rows, dtype=np.float64)
+        for begin in range(0, n_rows, self.block_rows):
+            end = min(begin + self.block_rows, n_rows)
+            out[begin:end] = self._predict_block(features[begin:end])
+        return out
+
+    def _predict_block(self, features):
+        # 节点状态为 (树数, 行数) 矩阵，每一步所有树同时向下走一层，叶子节点指向自身
+        by_feature = np.ascontiguousarray(features.T)
+        rows = np.arange(features.shape[0])
+        nodes = np.repeat(self.roots[:, None], features.shape[0], axis=1)
+        has_nan = bool(np.isnan(by_feature).any())
+
+        for _ in range(self.max_depth):
+            if self.is_leaf[nodes].all():
+                break
+            nodes = self._descend(nodes, by_feature, rows, has_nan)
+
+        # 从基础分开始按树的顺序依次累加，与原生库的累加顺序一致（XGBoost为 float32 累加）；
+        # 只有一行时 sum 会改用两两求和，因此用 cumsum 保证顺序累加
+        leaf_values = self.value[nodes]
+        leaf_values[0] += self.base_score
+        return np.cumsum(leaf_values, axis=0, dtype=self.dtype)[-1]
+
+    def _descend(self, nodes, by_feature, rows, has_nan):
+        """所有树的当前节点按分裂条件向下走一层，叶子节点保持不动"""
+        x = by_feature[self.feature[nodes], rows]
+        missing = None
+        x_nan = None
+        if has_nan:
+            x_nan = np.isnan(x)
+            mode = self.missing[nodes]
+            missing = (x_nan & (mode != MISSING_NONE))
+            if self._has_zero_missing:
+                missing |= (mode == MISSING_ZERO) & (np.abs(x) <= ZERO_THRESHOLD)
+            x = np.where(x_nan, 0.0, x)
+        elif self._has_zero_missing:
+            missing = (self.missing[nodes] == MISSING_ZERO) & (np.abs(x) <= ZERO_THRESHOLD)
+
+        threshold = self.threshold[nodes]
+        go_left = x < threshold if self.strict else x <= threshold
+        if self._has_categorical:
+            categories = np.clip(x, 0, MAX_CATEGORY - 1).astype(np.uint64)
+            in_mask = ((self.category_mask[nodes] >> categories) & np.uint64(1)).astype(bool) & (x >= 0)
+            if x_nan is not None:
+                in_mask &= ~x_nan
+            go_left = np.where(self.categorical[nodes], in_mask, go_left)
+        if missing is not None:
+            go_left = np.where(missing, self.default_left[nodes], go_left)
+        return np.where(go_left, self.left[nodes], self.right[nodes])
+
+    def node_mean(self):
+        """每个节点的期望输出：叶子为叶子值，内部节点为子节点按覆盖量加权的平均"""
+        if self._node_mean is None:
+            mean = self.value.astype(np.float64)
+            # 子节点的下标总是大于父节点，逆序遍历即自底向上
+            for node in np.flatnonzero(~self.is_leaf)[::-1]:
+                left, right = self.left[node], self.right[node]
+                total = self.cover[left] + self.cover[right]
+                mean[node] = ((self.cover[left] * mean[left] + self.cover[right] * mean[right]) / total
+                              if total > 0 else (mean[left] + mean[right]) / 2)
+            self._node_mean = mean
+        return self._node_mean
+
+    def contributions(self, features):
+        """路径归因（Saabas）：沿每棵树的决策路径，把子节点与当前节点期望输出之差记到当前节点的分裂特征上；
+        返回 (贡献 (行数, 特征数), 基准值 (行数,))，每行贡献之和加基准值等于预测值，计算量与一次预测相当"""
+        features = np.asarray(features, dtype=self.dtype)
+        n_rows = features.shape[0]
+        mean = self.node_mean()
+        out = np.empty((n_rows, self.n_features_in_), dtype=np.float64)
+        for begin in range(0, n_rows, self.block_rows):
+            end = min(begin + self.block_rows, n_rows)
+            out[begin:end] = self._contributions_block(features[begin:end], mean)
+        base = float(self.base_score) + float(mean[self.roots].sum())
+        return out, np.full(n_rows, base)
+
+    def _contributions_block(self, features, mean):
+        by_feature = np.ascontiguousarray(features.T)
+        n_rows = features.shape[0]
+        has_nan = bool(np.isnan(by_feature).any())
+        # (树, 行) 对展平为一维，每一步只保留尚未到达叶子的对，深而不平衡的树不做无用的遍历
+        nodes = np.repeat(self.roots, n_rows)
+        rows = np.tile(np.arange(n_rows), self.n_trees)
+        # 贡献按 行 * 特征数 + 特征 展平累加
+        out = np.zeros(n_rows * self.n_features_in_)
+        for _ in range(self.max_depth):
+            active = ~self.is_leaf[nodes]
+            if not active.any():
+                break
+            nodes, rows = nodes[active], rows[active]
+            children = self._descend(nodes, by_feature, rows, has_nan)
+            out += np.bincount(rows * self.n_features_in_ + self.feature[nodes],
+                               weights=mean[children] - mean[nodes], minlength=out.size)
+            nodes = children
+        return out.reshape(n_rows, self.n_features_in_)
+
+    def stats(self):
+        return {
+            'source': self.source,
+            'trees': self.n_trees,
+            'nodes': self.n_nodes,
+            'max_depth': self.max_depth,
+            'bytes': sum(array.nbytes for array in (
+                self.feature, self.threshold, self.left, self.right, self.value, self.default_left,
+                self.missing, self.categorical, self.category_mask, self.cover, self.roots)),
+        }
+
+
+def _compile_lightgbm(booster, best_iteration=None):
+    dump = booster.dump_model(num_iteration=best_iteration)
+    if dump.get('num_tree_per_iteration', 1) != 1 or dump.get('average_output'):
+        raise ValueError("只支持单输出、非随机森林模式的LightGBM模型")
+    objective = str(dump.get('objective', '')).split()[0]
+    if objective not in LIGHTGBM_IDENTITY_OBJECTIVES:
+        raise ValueError(f"LightGBM目标函数 {objective} 的输出需要变换，不支持编译")
+
+    builder = _NodeBuilder()
+    max_depth = 0
+    for tree in dump['tree_info']:
+        # 显式栈遍历，深度较大的树也不会递归过深
+        root = None
+        stack = [(tree['tree_structure'], None, None, 0)]
+        while stack:
+            node, parent, is_left, depth = stack.pop()
+            if 'leaf_value' in node:
+                index = builder.add(value=float(node['leaf_value']), cover=float(node.get('leaf_count', 0)))
+                max_depth = max(max_depth, depth)
+            else:
+                if node['decision_type'] == '==':
+                    # LightGBM 的分类分裂中 NaN 总是走右子树，不使用默认方向
+                    categories = [int(item) for item in str(node['threshold']).split('||')]
+                    index = builder.add(feature=node['split_feature'], default_left=node['default_left'],
+                                        missing=MISSING_NONE, categories=categories,
+                                        cover=float(node.get('internal_count', 0)))
+                elif node['decision_type'] == '<=':
+                    index = builder.add(feature=node['split_feature'], threshold=float(node['threshold']),
+                                        default_left=node['default_left'],
+                                        missing=LIGHTGBM_MISSING_TYPES[node['missing_type']],
+                                        cover=float(node.get('internal_count', 0)))
+                else:
+                    raise ValueError(f"不支持的LightGBM分裂类型 {node['decision_type']}")
+                stack.append((node['right_child'], index, False, depth + 1))
+                stack.append((node['left_child'], index, True, depth + 1))
+            if parent is None:
+                root = index
+            elif is_left:
+                builder.left[parent] = index
+            else:
+                builder.right[parent] = index
+        builder.roots.append(root)
+    return CompiledEnsemble(builder, dump['max_feature_idx'] + 1, 0.0, max_depth, np.float64, strict=False,
+                            source='lightgbm')
+
+
+def _compile_xgboost(booster, best_iteration=None):
+    learner = json.loads(booster.save_raw('json'))['learner']
+    objective = learner['objective']['name']
+    if objective not in XGBOOST_IDENTITY_OBJECTIVES:
+        raise ValueError(f"XGBoost目标函数 {objective} 的输出需要变换，不支持编译")
+    gradient_booster = learner['gradient_booster']
+    if gradient_booster['name'] != 'gbtree':
+        raise ValueError(f"只支持 gbtree 类型的XGBoost模型，当前为 {gradient_booster['name']}")
+    model_param = learner['learner_model_param']
+    if int(model_param.get('num_target', 1)) != 1 or int(model_param.get('num_class', 0)) > 1:
+        raise ValueError("只支持单输出的XGBoost模型")
+    base_score = float(str(model_param['base_score']).strip('[]'))
+
+    trees = gradient_booster['model']['trees']
+    if best_iteration is not None:
+        trees = trees[:best_iteration + 1]
+
+    builder = _NodeBuilder()
+    max_depth = 0
+    for tree in trees:
+        left_children = tree['left_children']
+        categories = {}
+        for node, begin, size in zip(tree['categories_nodes'], tree['categories_segments'],
+                                     tree['categories_sizes']):
+            categories[node] = tree['categories'][begin:begin + size]
+
+        offset = len(builder.feature)
+        depth = [0] * len(left_children)
+        covers = tree.get('sum_hessian') or [0.0] * len(left_children)
+        for node, left in enumerate(left_children):
+            if left == -1:
+                builder.add(value=float(tree['split_conditions'][node]), cover=float(covers[node]))
+                continue
+            right = tree['right_children'][node]
+            depth[left] = depth[right] = depth[node] + 1
+            max_depth = max(max_depth, depth[node] + 1)
+            if tree['split_type'][node] == 1:
+                # XGBoost 分类分裂中列出的类别走右子树，其余类别走左子树
+                right_set = set(categories.get(node, []))
+                index = builder.add(feature=tree['split_indices'][node],
+                                    default_left=bool(tree['default_left'][node]), missing=MISSING_NAN,
+                                    categories=[c for c in range(MAX_CATEGORY) if c not in right_set],
+                                    cover=float(covers[node]))
+            else:
+                index = builder.add(feature=tree['split_indices'][node],
+                                    threshold=float(tree['split_conditions'][node]),
+                                    default_left=bool(tree['default_left'][node]), missing=MISSING_NAN,
+                                    cover=float(covers[node]))
+            builder.link(index, offset + left, offset + right)
+        builder.roots.append(offset)
+    return CompiledEnsemble(builder, int(model_param['num_feature']), base_score, max_depth, np.float32, strict=True,
+                            source='xgboost')
+
+
+def model_best_iteration(model, attribute):
+    """模型早停得到的最佳迭代数，未使用早停时返回None；sklearn 包装器未早停时访问该属性会抛出 AttributeError"""
+    try:
+        best = getattr(model, attribute, None)
+    except AttributeError:
+        return None
+    return int(best) if best is not None and best > 0 else None
+
+
+def compile_trees(model):
+    """把 LightGBM/XGBoost 模型编译为节点数组；不是树模型或结构不受支持时抛出 ValueError"""
+    booster = getattr(model, 'booster_', None)
+    if booster is not None and hasattr(booster, 'dump_model'):
+        best = model_best_iteration(model, 'best_iteration_')
+        return _compile_lightgbm(booster, best)
+    if hasattr(model, 'get_booster'):
+        return _compile_xgboost(model.get_booster(), model_best_iteration(model, 'best_iteration'))
+    raise ValueError(f"{type(model).__name__} 不是可编译的树模型")
+
+
+def parity_matrices(ensemble, samples=20000, seed=0):
+    """构造一致性检查用的特征矩阵：取值落在分裂阈值及其相邻浮点数上，以及带缺失值的矩阵"""
+    rng = np.random.default_rng(seed)
+    n_features = ensemble.n_features_in_
+    internal = ~ensemble.is_leaf
+    boundaries = np.empty((samples, n_features), dtype=np.float64)
+    for feature in range(n_features):
+        nodes = internal & (ensemble.feature == feature)
+        candidates = []
+        numeric = nodes & ~ensemble.categorical
+        if numeric.any():
+            thresholds = np.unique(ensemble.threshold[numeric]).astype(np.float64)
+            # 阈值本身以及阈值两侧最近的可表示数值
+            candidates.extend([thresholds, np.nextafter(thresholds.astype(ensemble.dtype), -np.inf),
+                               np.nextafter(thresholds.astype(ensemble.dtype), np.inf)])
+        if (nodes & ensemble.categorical).any():
+            masks = np.bitwise_or.reduce(ensemble.category_mask[nodes & ensemble.categorical])
+            candidates.append(np.array([c for c in range(MAX_CATEGORY) if int(masks) >> c & 1] + [0.0]))
+        values = np.concatenate(candidates).astype(np.float64) if candidates else np.zeros(1)
+        boundaries[:, feature] = values[rng.integers(0, len(values), samples)]
+
+    missing = boundaries.copy()
+    missing[rng.random(missing.shape) < 0.2] = np.nan
+    return {'分裂阈值': boundaries, '缺失值': missing}